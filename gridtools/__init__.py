@@ -1 +1,40 @@
 __version__ = '0.4.1'
+
+#: Data types of source grids whose kernels are compiled by :py:func:`warmup` by default.
+SUPPORTED_DTYPES = ('float32', 'float64', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64')
+
+
+def warmup(dtypes=SUPPORTED_DTYPES, methods=None, parallel=False):
+    """
+    Compile the Numba kernels of :py:mod:`gridtools.resampling` and :py:mod:`gridtools.gapfilling`
+    for source grids of the given data types, with and without masks.
+
+    Compiled kernels are cached on disk (in ``__pycache__`` next to the modules or, if that is not writable,
+    in Numba's user-wide cache directory). Once warmed up, e.g. when building an image or installing
+    a deployment, new processes load the kernels from the cache instead of compiling them on first use.
+
+    Kernels are specialized for the types of all of their arguments. This function covers C-contiguous grids
+    of the given data types, the default fill values, and floating point fill values.
+    Other combinations, such as non-contiguous slices, are compiled (and cached) on first use.
+
+    :param dtypes: sequence of data types, defaults to :py:data:`SUPPORTED_DTYPES`.
+        Gap filling is only compiled for floating point types.
+    :param methods: sequence of resampling methods, e.g. ``(DS_MEAN, US_LINEAR)``, defaults to all methods.
+        Kernels are compiled per method, so only the methods given here are compiled.
+    :param parallel: *bool*, whether to also compile the kernels used with ``parallel=True``.
+    """
+    # Imported here so that importing gridtools, e.g. from setup.py, doesn't require numpy and numba
+    import numba
+    import numpy as np
+    import gridtools.gapfilling
+    import gridtools.resampling
+
+    if numba.config.DISABLE_JIT:
+        return
+    for dtype in dtypes:
+        dtype = np.dtype(dtype)
+        gridtools.resampling._warmup(dtype, methods=methods)
+        if parallel:
+            gridtools.resampling._warmup(dtype, methods=methods, parallel=True)
+        if np.issubdtype(dtype, np.floating):
+            gridtools.gapfilling._warmup(dtype)
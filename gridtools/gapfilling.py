@@ -1,3 +1,6 @@
+import time
+from collections import namedtuple
+
 import numpy as np
 from numba import jit
 
@@ -9,15 +12,152 @@ DEFAULT_KERNEL = np.array([[0.5, 0.7, 0.5],
                            [0.7, 1.0, 0.7],
                            [0.5, 0.7, 0.5]])
 
+#: Result info of :py:func:`fillgaps_lowpass_2d`: number of passes, number of gaps left,
+#: whether filling stalled, i.e. gaps are left that no pass would fill although there are valid pixels,
+#: whether filling stopped at *max_iter* although gaps could still be filled, and the time of each pass in seconds.
+FillgapsInfo = namedtuple('FillgapsInfo', ('iterations', 'gap_count', 'stalled', 'truncated', 'times'))
 
-def fillgaps_lowpass_2d(src, kernel=DEFAULT_KERNEL, threshold=1):
-    w = src.shape[-1]
-    h = src.shape[-2]
-    pixel_count = w * h
-    gap_count = 1
-    out = src
-    while 0 < gap_count < pixel_count:
-        out, gap_count = _apply_low_pass_filter(out, kernel, threshold)
+#: Number of kernel weights from which fillgaps_normconv_2d() convolves by FFT by default
+_FFT_KERNEL_SIZE = 121
+
+#: Relative tolerance of the rank-1 test of kernels
+_SEPARABLE_EPS = 1e-12
+
+#: Round-off of the FFT convolution relative to the sum of the absolute kernel weights
+_FFT_EPS = 1e-9
+
+
+def fillgaps_lowpass_2d(src, kernel=DEFAULT_KERNEL, threshold=1, max_iter=None, progress=None, return_info=False):
+    """
+    Fill the gaps of a 2-D grid by repeated low-pass filter passes. Each pass fills the gaps next to valid or
+    filled pixels by the kernel-weighted mean of the valid pixels within the kernel window, if the sum of
+    their kernel weights reaches *threshold*.
+
+    Filling stops if no gaps are left, if no further pass would fill any gap, e.g. if the gaps left don't reach
+    the *threshold*, or after *max_iter* passes.
+
+    :param src: 2-D *ndarray* of a floating point type, gaps are all values that are not finite
+    :param kernel: 2-D *ndarray*, optional
+        The kernel weights, its center is at ``(kh // 2, kw // 2)``. Separable kernels, i.e. outer products
+        ``np.outer(kernel_y, kernel_x)`` such as kernels of ones, are applied as row and column sums, which is
+        numerically equivalent within float tolerance.
+    :param threshold: *scalar*, optional
+        Minimum sum of the kernel weights of the valid pixels that fill a gap
+    :param max_iter: *int*, optional
+        Maximum number of passes, unlimited by default
+    :param progress: callable, optional
+        Called after each pass with the number of passes so far and the number of gaps left
+    :param return_info: *bool*, optional
+        If ``True``, return a :py:data:`FillgapsInfo` in addition to the result
+    :return: The gap-filled copy of *src*, or tuple (out, info) if *return_info* is ``True``.
+    """
+    if max_iter is not None and max_iter < 0:
+        raise ValueError('max_iter must be >= 0')
+    out = np.array(src)
+    kernel = np.asarray(kernel)
+    # Only the gaps next to valid pixels can be filled in the next pass, they form the frontier
+    frontier, frontier_size, gap_count = _get_frontier(out, kernel)
+    # Buffers of the next frontier, of the fill values, and of the gaps queued for the next frontier
+    next_frontier = np.empty_like(frontier)
+    values = np.empty(frontier.shape[0], dtype=np.float64)
+    queued = np.zeros(out.shape, dtype=np.bool_)
+    factors = _get_separable_factors(kernel) if frontier_size > 0 else None
+    if factors is not None:
+        kernel_y, kernel_x = factors
+        v_rows, k_rows = _get_row_sums(out, kernel_x)
+    times = []
+    while frontier_size > 0 and (max_iter is None or len(times) < max_iter):
+        t0 = time.perf_counter()
+        if factors is not None:
+            frontier_size, fill_count = _fill_frontier_separable(out, kernel_y, kernel_x, threshold, frontier,
+                                                                 frontier_size, next_frontier, values, queued,
+                                                                 v_rows, k_rows)
+        else:
+            frontier_size, fill_count = _fill_frontier(out, kernel, threshold, frontier, frontier_size,
+                                                       next_frontier, values, queued)
+        frontier, next_frontier = next_frontier, frontier
+        times.append(time.perf_counter() - t0)
+        gap_count -= fill_count
+        if progress is not None:
+            progress(len(times), gap_count)
+    if return_info:
+        truncated = frontier_size > 0
+        # Gaps are left that no pass will fill, although there are valid pixels
+        stalled = not truncated and 0 < gap_count < out.size
+        return out, FillgapsInfo(len(times), gap_count, stalled, truncated, times)
+    return out
+
+
+def fillgaps_normconv_2d(src, kernel=DEFAULT_KERNEL, threshold=1, fft=None):
+    """
+    Fill the gaps of a 2-D grid in a single pass by normalized convolution: the grid with gaps set to zero and
+    the grid of valid pixels are both convolved with the kernel, and each gap is filled by the ratio of both,
+    i.e. by the kernel-weighted mean of the valid pixels within the kernel window, if the sum of their kernel
+    weights reaches *threshold*. All gaps within the kernel radius of valid pixels are filled, the result equals
+    a single pass of :py:func:`fillgaps_lowpass_2d`.
+
+    Large kernels are convolved by FFT, whose cost is O(N log N) for N pixels regardless of the kernel size
+    and of the number of gaps.
+
+    :param src: 2-D *ndarray* of a floating point type, gaps are all values that are not finite
+    :param kernel: 2-D *ndarray*, optional
+        The kernel weights, its center is at ``(kh // 2, kw // 2)``
+    :param threshold: *scalar*, optional
+        Minimum sum of the kernel weights of the valid pixels that fill a gap
+    :param fft: *bool*, optional
+        Whether to convolve by FFT, which is numerically equivalent within float tolerance.
+        By default, kernels of at least 121 (11 x 11) weights are convolved by FFT.
+    :return: The gap-filled copy of *src*.
+    """
+    kernel = np.asarray(kernel)
+    if fft is None:
+        fft = kernel.size >= _FFT_KERNEL_SIZE
+    if not fft:
+        return fillgaps_lowpass_2d(src, kernel=kernel, threshold=threshold, max_iter=1)
+    out = np.array(src)
+    valid = np.isfinite(out)
+    gaps = np.logical_not(valid)
+    if not np.any(gaps) or not np.any(valid):
+        return out
+    kernel = kernel.astype(np.float64)
+    v_sum, k_sum = _correlate_fft((np.where(valid, out, 0.0), valid.astype(np.float64)), kernel)
+    # Sums below the round-off of the FFT are zero
+    eps = _FFT_EPS * np.sum(np.abs(kernel))
+    fill = gaps & (np.abs(k_sum) > eps) & (k_sum >= threshold - eps)
+    out[fill] = v_sum[fill] / k_sum[fill]
+    return out
+
+
+def fillgaps_nearest_2d(src, valid=None, return_distances=False):
+    """
+    Fill the gaps of a 2-D grid by the value of the nearest valid pixel in Euclidean distance, e.g. for grids of
+    classes, whose values must not be averaged.
+
+    The nearest valid pixels are found by an exact Euclidean distance transform in O(N) for N pixels,
+    see :py:func:`_get_nearest_valid`, and their values are gathered in one step.
+
+    :param src: 2-D *ndarray*
+    :param valid: boolean *ndarray*, optional
+        The valid pixels of *src*, an array of the same shape. Defaults to the finite values of *src*,
+        so it must be given for gaps in integer grids.
+    :param return_distances: *bool*, optional
+        If ``True``, also return the distances in pixels of all pixels to their nearest valid pixels
+    :return: The gap-filled copy of *src*, or tuple (out, distances) if *return_distances* is ``True``.
+        If there are no valid pixels, gaps are left and distances are infinite.
+    """
+    if valid is None:
+        valid = np.isfinite(src)
+    elif valid.shape != src.shape:
+        raise ValueError("'valid' must have the shape of 'src'")
+    if len(src.shape) != 2:
+        raise ValueError("'src' must be a 2-D array")
+    valid = np.ascontiguousarray(valid, dtype=np.bool_)
+    nearest_y, nearest_x, distances = _get_nearest_valid(valid)
+    out = np.array(src)
+    gaps = np.logical_not(valid) & (nearest_y >= 0)
+    out[gaps] = out[nearest_y[gaps], nearest_x[gaps]]
+    if return_distances:
+        return out, np.sqrt(distances)
     return out
 
 
@@ -47,7 +187,77 @@ def fillgaps_multiscale_2d(src, ds_iter=True, ds_method=gtr.DS_MEAN, us_method=g
     return out_low
 
 
-@jit(nopython=True)
+def _get_separable_factors(kernel):
+    """
+    Test whether *kernel* is separable, i.e. the outer product of a column and a row, and if so, get them.
+    They are taken from the kernel itself, so that e.g. kernels of ones are reproduced exactly.
+
+    :return: tuple (kernel_y, kernel_x) of 1-D float64 arrays, or ``None`` if *kernel* is not separable.
+    """
+    if kernel.ndim != 2 or kernel.size == 0:
+        return None
+    kernel = kernel.astype(np.float64)
+    y, x = np.unravel_index(np.argmax(np.abs(kernel)), kernel.shape)
+    pivot = kernel[y, x]
+    if pivot == 0:
+        return None
+    kernel_y = kernel[:, x] / pivot
+    kernel_x = kernel[y, :].copy()
+    if not np.allclose(np.outer(kernel_y, kernel_x), kernel, rtol=_SEPARABLE_EPS, atol=_SEPARABLE_EPS * abs(pivot)):
+        return None
+    return kernel_y, kernel_x
+
+
+def _correlate_fft(grids, kernel):
+    """
+    Correlate the 2-D grids of equal shape with *kernel* by FFT, so that the result at (y, x) is the sum of
+    ``kernel[ky, kx] * grid[y + ky - kh // 2, x + kx - kw // 2]`` over the kernel window, cells outside of the grid
+    being zero.
+
+    :return: list of the correlated grids
+    """
+    h, w = grids[0].shape
+    kh, kw = kernel.shape
+    # Zero padding avoids wrapping around
+    shape = (_get_fft_size(h + kh - 1), _get_fft_size(w + kw - 1))
+    kernel_spectrum = np.fft.rfft2(kernel[::-1, ::-1], shape)
+    y0 = kh - 1 - kh // 2
+    x0 = kw - 1 - kw // 2
+    return [np.fft.irfft2(np.fft.rfft2(grid, shape) * kernel_spectrum, shape)[y0:y0 + h, x0:x0 + w]
+            for grid in grids]
+
+
+def _get_fft_size(n):
+    """
+    Get the smallest size >= *n* whose prime factors are 2, 3 and 5, for which the FFT is fast.
+    """
+    size = 2 * n
+    f5 = 1
+    while f5 < size:
+        f3 = f5
+        while f3 < size:
+            f2 = f3
+            while f2 < n:
+                f2 *= 2
+            size = min(size, f2)
+            f3 *= 3
+        f5 *= 5
+    return size
+
+
+def _warmup(dtype):
+    """
+    Compile the kernels for grids of the floating point type *dtype*, see :py:func:`gridtools.warmup`.
+    """
+    src = np.arange(64).reshape((8, 8)).astype(dtype)
+    src[2:5, 3:6] = np.nan
+    fillgaps_lowpass_2d(src)
+    fillgaps_lowpass_2d(src, kernel=np.ones((3, 3)))
+    fillgaps_multiscale_2d(src)
+    fillgaps_nearest_2d(src)
+
+
+@jit(nopython=True, cache=True)
 def count_gaps(data):
     w = data.shape[-1]
     h = data.shape[-2]
@@ -59,16 +269,23 @@ def count_gaps(data):
     return gap_count
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def is_gap(v):
     return not np.isfinite(v)
 
 
-@jit(nopython=True)
-def _apply_low_pass_filter(data, kernel, threshold):
+@jit(nopython=True, cache=True)
+def _get_frontier(data, kernel):
+    """
+    Find the gap pixels that have a valid pixel within the kernel window.
+
+    :param data: The data to gap-fill
+    :param kernel: the low-pass filter kernel
+    :return: tuple (frontier, frontier_size, gap_count). *frontier* is an array of the number of gaps,
+        whose first *frontier_size* entries are the pixels (y, x) of the frontier, encoded as ``y * w + x``.
+    """
     w = data.shape[-1]
     h = data.shape[-2]
-    out = data.copy()
     kw = kernel.shape[-1]
     kh = kernel.shape[-2]
     kx0 = kw // 2
@@ -76,30 +293,262 @@ def _apply_low_pass_filter(data, kernel, threshold):
     gap_count = 0
     for y in range(h):
         for x in range(w):
-            v = data[y, x]
-            if is_gap(v):
-                v_sum = 0.
-                k_sum = 0.
+            if is_gap(data[y, x]):
+                gap_count += 1
+    frontier = np.empty(gap_count, dtype=np.int64)
+    frontier_size = 0
+    for y in range(h):
+        for x in range(w):
+            if is_gap(data[y, x]):
+                found = False
                 for ky in range(kh):
                     yy = y + ky - ky0
                     if 0 <= yy < h:
                         for kx in range(kw):
                             xx = x + kx - kx0
-                            if 0 <= xx < w:
-                                v = data[yy, xx]
-                                if not is_gap(v):
-                                    k = kernel[ky, kx]
-                                    v_sum += k * v
-                                    k_sum += k
-                if k_sum != 0 and k_sum >= threshold:
-                    out[y, x] = v_sum / k_sum
-                else:
-                    gap_count += 1
+                            if 0 <= xx < w and not is_gap(data[yy, xx]):
+                                found = True
+                                break
+                    if found:
+                        break
+                if found:
+                    frontier[frontier_size] = y * w + x
+                    frontier_size += 1
+    return frontier, frontier_size, gap_count
 
-    return out, gap_count
+
+@jit(nopython=True, cache=True)
+def _fill_frontier(data, kernel, threshold, frontier, frontier_size, next_frontier, values, queued):
+    """
+    Fill the gap pixels of the frontier in place, each by the kernel-weighted mean of the valid pixels within
+    the kernel window, if the sum of their weights reaches *threshold*. All fill values are computed before
+    any of them is written, so the result equals a low-pass filter pass over the whole grid.
+
+    :param data: The data to gap-fill
+    :param kernel: the low-pass filter kernel
+    :param threshold: minimum sum of the kernel weights of the valid pixels
+    :param frontier: the pixels to fill, see :py:func:`_get_frontier`
+    :param frontier_size: the number of pixels in *frontier*
+    :param next_frontier: array of the size of *frontier* in which to place the next frontier: the gaps
+        left that have a pixel filled by this pass within their kernel window
+    :param values: buffer of the size of *frontier* for the fill values
+    :param queued: boolean array of the shape of *data*, all ``False``, and so again on return
+    :return: tuple (next_frontier_size, fill_count)
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    kw = kernel.shape[-1]
+    kh = kernel.shape[-2]
+    kx0 = kw // 2
+    ky0 = kh // 2
+    for i in range(frontier_size):
+        y = frontier[i] // w
+        x = frontier[i] - y * w
+        v_sum = 0.
+        k_sum = 0.
+        for ky in range(kh):
+            yy = y + ky - ky0
+            if 0 <= yy < h:
+                for kx in range(kw):
+                    xx = x + kx - kx0
+                    if 0 <= xx < w:
+                        v = data[yy, xx]
+                        if not is_gap(v):
+                            k = kernel[ky, kx]
+                            v_sum += k * v
+                            k_sum += k
+        if k_sum != 0 and k_sum >= threshold:
+            values[i] = v_sum / k_sum
+        else:
+            values[i] = np.nan
+    return _update_frontier(data, kh, kw, frontier, frontier_size, next_frontier, values, queued)
+
+
+@jit(nopython=True, cache=True)
+def _fill_frontier_separable(data, kernel_y, kernel_x, threshold, frontier, frontier_size, next_frontier, values,
+                             queued, v_rows, k_rows):
+    """
+    Like :py:func:`_fill_frontier` for the separable kernel ``np.outer(kernel_y, kernel_x)``. The sums over the
+    kernel window are the sums of the row sums *v_rows* and *k_rows* of :py:func:`_get_row_sums` weighted by
+    *kernel_y*, which are updated for the filled pixels, so each pixel costs O(kh + kw) instead of O(kh * kw).
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    kw = kernel_x.shape[0]
+    kh = kernel_y.shape[0]
+    ky0 = kh // 2
+    for i in range(frontier_size):
+        y = frontier[i] // w
+        x = frontier[i] - y * w
+        v_sum = 0.
+        k_sum = 0.
+        for ky in range(kh):
+            yy = y + ky - ky0
+            if 0 <= yy < h:
+                k = kernel_y[ky]
+                v_sum += k * v_rows[yy, x]
+                k_sum += k * k_rows[yy, x]
+        if k_sum != 0 and k_sum >= threshold:
+            values[i] = v_sum / k_sum
+        else:
+            values[i] = np.nan
+    for i in range(frontier_size):
+        if not is_gap(values[i]):
+            y = frontier[i] // w
+            x = frontier[i] - y * w
+            _add_row_sums(v_rows, k_rows, kernel_x, y, x, values[i])
+    return _update_frontier(data, kh, kw, frontier, frontier_size, next_frontier, values, queued)
+
+
+@jit(nopython=True, cache=True)
+def _update_frontier(data, kh, kw, frontier, frontier_size, next_frontier, values, queued):
+    """
+    Write the fill *values* of the frontier that are not gaps into *data* and find the next frontier,
+    see :py:func:`_fill_frontier`.
+
+    :return: tuple (next_frontier_size, fill_count)
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    kx0 = kw // 2
+    ky0 = kh // 2
+    fill_count = 0
+    for i in range(frontier_size):
+        if not is_gap(values[i]):
+            y = frontier[i] // w
+            x = frontier[i] - y * w
+            data[y, x] = values[i]
+            fill_count += 1
+    # Gaps whose kernel window contains a filled pixel, i.e. (y - ky + ky0, x - kx + kx0)
+    next_frontier_size = 0
+    for i in range(frontier_size):
+        if not is_gap(values[i]):
+            y = frontier[i] // w
+            x = frontier[i] - y * w
+            for ky in range(kh):
+                yy = y - ky + ky0
+                if 0 <= yy < h:
+                    for kx in range(kw):
+                        xx = x - kx + kx0
+                        if 0 <= xx < w and not queued[yy, xx] and is_gap(data[yy, xx]):
+                            queued[yy, xx] = True
+                            next_frontier[next_frontier_size] = yy * w + xx
+                            next_frontier_size += 1
+    for i in range(next_frontier_size):
+        y = next_frontier[i] // w
+        queued[y, next_frontier[i] - y * w] = False
+    return next_frontier_size, fill_count
+
+
+@jit(nopython=True, cache=True)
+def _get_row_sums(data, kernel_x):
+    """
+    Compute the sums of the valid pixels weighted by *kernel_x* along each row, and the sums of their weights.
+
+    :return: tuple (v_rows, k_rows) of float64 arrays of the shape of *data*
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    v_rows = np.zeros((h, w), dtype=np.float64)
+    k_rows = np.zeros((h, w), dtype=np.float64)
+    for y in range(h):
+        for x in range(w):
+            v = data[y, x]
+            if not is_gap(v):
+                _add_row_sums(v_rows, k_rows, kernel_x, y, x, v)
+    return v_rows, k_rows
+
+
+@jit(nopython=True, cache=True)
+def _add_row_sums(v_rows, k_rows, kernel_x, y, x, v):
+    """
+    Add the valid pixel (y, x) of value *v* to the row sums of the pixels whose kernel window contains it.
+    """
+    w = v_rows.shape[-1]
+    kw = kernel_x.shape[0]
+    kx0 = kw // 2
+    for kx in range(kw):
+        xx = x - kx + kx0
+        if 0 <= xx < w:
+            k = kernel_x[kx]
+            v_rows[y, xx] += k * v
+            k_rows[y, xx] += k
+
+
+@jit(nopython=True, cache=True)
+def _get_nearest_valid(valid):
+    """
+    Exact Euclidean distance transform of the boolean grid *valid* in O(N) for N pixels, after Felzenszwalb and
+    Huttenlocher, "Distance Transforms of Sampled Functions", Theory of Computing 8, 2012.
+
+    First, the nearest valid pixel in the same column is found for each pixel by two sweeps over the rows.
+    Then each row takes the lower envelope of the parabolas ``(x - q) ** 2 + dy(q) ** 2`` of the columns *q*,
+    where *dy(q)* is the distance to the nearest valid pixel in column *q*.
+
+    :param valid: 2-D boolean *ndarray*
+    :return: tuple (nearest_y, nearest_x, distances). *nearest_y* and *nearest_x* are int64 arrays of the shape of
+        *valid* holding the indices of the nearest valid pixel of each pixel, or -1 if there are no valid pixels.
+        *distances* holds the squared distances, infinite if there are no valid pixels.
+    """
+    w = valid.shape[-1]
+    h = valid.shape[-2]
+    # Nearest valid pixel in the same column, sweeping all columns at once row by row
+    column_y = np.full((h, w), -1, dtype=np.int64)
+    for y in range(h):
+        for x in range(w):
+            if valid[y, x]:
+                column_y[y, x] = y
+            elif y > 0:
+                column_y[y, x] = column_y[y - 1, x]
+    next_y = np.full(w, -1, dtype=np.int64)
+    for y in range(h - 1, -1, -1):
+        for x in range(w):
+            if valid[y, x]:
+                next_y[x] = y
+            elif next_y[x] >= 0 and (column_y[y, x] < 0 or next_y[x] - y < y - column_y[y, x]):
+                column_y[y, x] = next_y[x]
+    nearest_y = np.full((h, w), -1, dtype=np.int64)
+    nearest_x = np.full((h, w), -1, dtype=np.int64)
+    distances = np.full((h, w), np.inf, dtype=np.float64)
+    # Parabola values, and the columns and left boundaries of the parabolas of the lower envelope
+    f = np.empty(w, dtype=np.float64)
+    v = np.empty(w, dtype=np.int64)
+    z = np.empty(w + 1, dtype=np.float64)
+    for y in range(h):
+        k = -1
+        for q in range(w):
+            if column_y[y, q] < 0:
+                continue
+            dy = column_y[y, q] - y
+            f[q] = dy * dy
+            if k < 0:
+                k = 0
+                v[0] = q
+                z[0] = -np.inf
+                z[1] = np.inf
+                continue
+            s = ((f[q] + q * q) - (f[v[k]] + v[k] * v[k])) / (2.0 * (q - v[k]))
+            while s <= z[k]:
+                k -= 1
+                s = ((f[q] + q * q) - (f[v[k]] + v[k] * v[k])) / (2.0 * (q - v[k]))
+            k += 1
+            v[k] = q
+            z[k] = s
+            z[k + 1] = np.inf
+        if k < 0:
+            continue
+        j = 0
+        for x in range(w):
+            while z[j + 1] < x:
+                j += 1
+            q = v[j]
+            nearest_y[y, x] = column_y[y, q]
+            nearest_x[y, x] = q
+            distances[y, x] = (x - q) * (x - q) + f[q]
+    return nearest_y, nearest_x, distances
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def _fill_gaps(data, fill_data):
     """
     Fills gap pixels by taking over values from a reduced resolution version of the grid.
@@ -1,8 +1,16 @@
 # http://stackoverflow.com/questions/7075082/what-is-future-in-python-used-for-and-how-when-to-use-it-and-how-it-works
 from __future__ import division
 
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from types import FunctionType
+
+import numba
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
 #: Interpolation method for upsampling: Take nearest source grid cell, even if it is invalid.
 US_NEAREST = 10
@@ -13,12 +21,16 @@ US_LINEAR = 11
 DS_FIRST = 50
 #: Aggregation method for downsampling: Take last valid source grid cell, ignore contribution areas.
 DS_LAST = 51
-# DS_MIN = 52
-# DS_MAX = 53
+#: Aggregation method for downsampling: Take the minimum of all valid source grid cells, ignore contribution areas.
+DS_MIN = 52
+#: Aggregation method for downsampling: Take the maximum of all valid source grid cells, ignore contribution areas.
+DS_MAX = 53
 #: Aggregation method for downsampling: Compute average of all valid source grid cells,
 #: with weights given by contribution area.
 DS_MEAN = 54
-# DS_MEDIAN = 55
+#: Aggregation method for downsampling: Compute the weighted median of all valid source grid cells,
+#: with weights given by contribution area. See :py:func:`downsample_quantiles_2d` for its definition.
+DS_MEDIAN = 55
 #: Aggregation method for downsampling: Compute most frequently seen valid source grid cell,
 #: with frequency given by contribution area. Note that this mode can use an additional keyword argument
 #: *mode_rank* which can be used to generate the n-th mode. See :py:function:`downsample_2d`.
@@ -31,13 +43,39 @@ DS_VAR = 57
 #: (see https://en.wikipedia.org/wiki/Mean_square_weighted_deviation), with weights given by contribution area.
 DS_STD = 58
 
-#: Constant indicating an empty 2-D mask
-_NOMASK2D = np.ma.getmaskarray(np.ma.array([[0]], mask=[[0]]))
+_US_METHODS = (US_NEAREST, US_LINEAR)
+_DS_METHODS = (DS_FIRST, DS_LAST, DS_MIN, DS_MAX, DS_MEAN, DS_MEDIAN, DS_MODE, DS_VAR, DS_STD)
+
+#: Statistics computed by downsample_stats_2d()
+STATS = ('mean', 'var', 'std', 'min', 'max', 'count')
+
+#: Constant indicating an empty mask for a stack of 2-D grids
+_NOMASK3D = np.zeros((1, 1, 1), dtype=np.bool_)
+#: Constant standing in for the output stacks of statistics that are not requested, see downsample_stats_2d()
+_NOSTATS3D = np.zeros((1, 1, 1), dtype=np.float64)
 
 _EPS = 1e-10
 
+#: Maximum value range of integer grids for which DS_MODE and DS_MEDIAN use dense histograms
+_MAX_HISTOGRAM_BINS = 65536
+#: Histogram range (v_min, bin_count) of grids for which no value histograms are used
+_NO_HISTOGRAM = (0, 0)
+
+#: Names of the arrays of downsampling and upsampling tables in a WeightCache
+_TABLE_NAMES = ('y_idx', 'y_wgt', 'x_idx', 'x_wgt')
+
+#: Format version of WeightCache entries, part of their keys
+_CACHE_VERSION = 1
+
+#: Number of values below which weighted selection falls back to insertion sort
+_SELECT_SORT_SIZE = 16
+
+#: Cache of numpy's default fill values by dtype
+_DEFAULT_FILL_VALUES = {}
+
 
-def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None):
+def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None,
+                src_transform=None, out_transform=None, parallel=False, num_threads=None, valid=None, out_valid=None):
     """
     Resample a 2-D grid to a new resolution.
 
@@ -60,18 +98,36 @@ def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=No
     :param out: 2-D *ndarray*, optional
         Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
         shape as the expected output.
+    :param src_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the src array.
+        Column and row rotation are not supported.
+    :param out_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the out array.
+        Column and row rotation are not supported. Each axis is downsampled if its target cells are at least as
+        large as the source cells, otherwise it is upsampled.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
     :return: An resampled version of the *src* array.
     """
-    out = _get_out(out, src, (h, w))
-    if out is None:
-        return src
-    mask, use_mask = _get_mask(src)
-    fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_resample_2d(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out),
-                        src, fill_value)
+    _check_2d(src)
+    return resample_nd(src, w, h, ds_method=ds_method, us_method=us_method, fill_value=fill_value,
+                       mode_rank=mode_rank, out=out, src_transform=src_transform, out_transform=out_transform,
+                       parallel=parallel, num_threads=num_threads, valid=valid, out_valid=out_valid)
 
 
-def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None):
+def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None, src_transform=None, out_transform=None,
+                parallel=False, num_threads=None, valid=None, out_valid=None):
     """
     Upsample a 2-D grid to a higher resolution by interpolating original grid cells.
 
@@ -89,17 +145,36 @@ def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None):
     :param out: 2-D *ndarray*, optional
         Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
         shape as the expected output.
+    :param src_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the src array.
+        Column and row rotation are not supported.
+    :param out_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the out array.
+        Column and row rotation are not supported. The target cells must not be larger than the source cells.
+        Only the target window is computed, and it equals the corresponding part of the upsampled whole *src*.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
     :return: An upsampled version of the *src* array.
     """
-    out = _get_out(out, src, (h, w))
-    if out is None:
-        return src
-    mask, use_mask = _get_mask(src)
-    fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_upsample_2d(src, mask, use_mask, method, fill_value, out), src, fill_value)
+    _check_2d(src)
+    return upsample_nd(src, w, h, method=method, fill_value=fill_value, out=out,
+                       src_transform=src_transform, out_transform=out_transform,
+                       parallel=parallel, num_threads=num_threads, valid=valid, out_valid=out_valid)
 
 
-def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None, src_transform=None, out_transform=None):
+def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None, src_transform=None, out_transform=None,
+                  parallel=False, num_threads=None, valid=None, out_valid=None):
     """
     Downsample a 2-D grid to a lower resolution by aggregating original grid cells.
 
@@ -128,437 +203,3349 @@ def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=N
         Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
         column rotation, height of pixel, upper left y-coordinate) of the out array.
         Column and row rotation are not supported.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
     :return: A downsampled version of the *src* array.
     """
-    if method == DS_MODE and mode_rank < 1:
-        raise ValueError('mode_rank must be >= 1')
-    out = _get_out(out, src, (h, w))
+    _check_2d(src)
+    return downsample_nd(src, w, h, method=method, fill_value=fill_value, mode_rank=mode_rank, out=out,
+                         src_transform=src_transform, out_transform=out_transform,
+                         parallel=parallel, num_threads=num_threads, valid=valid, out_valid=out_valid)
 
-    if (src_transform is None) ^ (out_transform is None):
-        raise ValueError("Either no transform should be given, or both")
-    elif src_transform is not None and out_transform is not None:
-        src_transform, out_transform = _check_transform(src_transform, out_transform, src, out)
-        src_dx, src_dy = src_transform[0], src_transform[4]
-        out_dx, out_dy = out_transform[0], out_transform[4]
-        if abs(out_dx) < abs(src_dx) or abs(out_dy) < abs(src_dy):
-            raise ValueError("Invalid cellsize in 'out_transform'")
-        use_transform = True
-    else:
-        src_transform = np.zeros(6,)
-        out_transform = np.zeros(6,)
-        use_transform = False
 
-    if out is None:
-        return src
-    mask, use_mask = _get_mask(src)
-    fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_downsample_2d(src, mask, use_mask, method, fill_value, mode_rank, out, use_transform, src_transform, out_transform), src, fill_value)
+def downsample_stats_2d(src, w, h, stats=STATS, fill_value=np.nan, out=None, src_transform=None, out_transform=None,
+                        parallel=False, num_threads=None, valid=None):
+    """
+    Downsample a 2-D grid to several statistics of the valid source grid cells in a single traversal.
 
+    :param src: 2-D *ndarray*
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param stats: sequence of statistics names, a subset of :py:data:`STATS`:
+        ``'mean'``, ``'var'``, ``'std'``: as computed by the methods ``DS_MEAN``, ``DS_VAR`` and ``DS_STD``;
+        ``'min'``, ``'max'``: as computed by the methods ``DS_MIN`` and ``DS_MAX``;
+        ``'count'``: number of valid source grid cells, weighted by contribution area.
+    :param fill_value: *scalar*, optional
+        Value of all statistics except ``'count'`` for target cells without valid source cells, defaults to NaN.
+    :param out: *dict*, optional
+        Alternate output arrays of shape (h, w) and of a floating point type by statistics name in which to place
+        the results. Statistics missing in *out* are placed in new arrays of type float64.
+        All names in *out* must be in *stats*.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_2d`.
+    :return: A *dict* that maps the names in *stats* to 2-D arrays of shape (h, w).
+    """
+    _check_2d(src)
+    stats = tuple(stats)
+    for name in stats:
+        if name not in STATS:
+            raise ValueError('invalid statistics name %r' % (name,))
+    out = dict(out) if out is not None else {}
+    for name, array in out.items():
+        if name not in stats:
+            raise ValueError("'out' has an array for %r, which is not in 'stats'" % (name,))
+        if array.shape != (h, w):
+            raise ValueError("'out' arrays must have shape (h, w)")
+        if not np.issubdtype(array.dtype, np.floating):
+            raise ValueError("'out' arrays must be of a floating point type")
+        if not array.flags.writeable:
+            raise ValueError("'out' arrays must be writeable")
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, src.shape, (h, w))
+    y_idx, y_wgt, x_idx, x_wgt = _get_ds_tables(src.shape, (h, w), src_transform, out_transform)
+    result = {name: out[name] if name in out else np.zeros((h, w), dtype=np.float64) for name in stats}
+    use_stats = np.array([name in result for name in STATS], dtype=np.bool_)
+    stats_out = [_as_stack(result[name]).view(np.ndarray) if name in result else _NOSTATS3D for name in STATS]
+    mask, use_mask = _get_mask(src, valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    downsample_stats = _downsample_stats_parallel if n_chunks > 1 else _downsample_stats
+    with _num_threads(num_threads if parallel else None):
+        downsample_stats(_as_stack(src), _as_stack(mask), use_mask, fill_value, use_stats, *stats_out,
+                         y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+    return result
 
-def _get_out(out, src, shape):
-    if out is None:
-        return np.zeros(shape, dtype=src.dtype)
-    else:
-        if out.shape != shape:
-            raise ValueError("'shape' and 'out' are incompatible")
-        if out.shape == src.shape:
-            return None
-        return out
 
+def downsample_quantiles_2d(src, w, h, quantiles, fill_value=None, out=None, src_transform=None, out_transform=None,
+                            parallel=False, num_threads=None, valid=None, out_valid=None):
+    """
+    Downsample a 2-D grid to weighted quantiles of the valid source grid cells, e.g. to the 10th and 90th
+    percentiles. All quantiles are computed in a single pass, the quantile 0.5 equals the result of
+    ``downsample_2d(src, w, h, method=DS_MEDIAN)``.
 
-def _check_transform(src_transform, out_transform, src, out):
-    src_transform = np.array(src_transform[:6], dtype=np.float64)
-    out_transform = np.array(out_transform[:6], dtype=np.float64)
-    src_dx, src_xrot, src_xcov0, src_yrot, src_dy, src_ycov0 = src_transform
-    out_dx, out_xrot, out_xcov0, out_yrot, out_dy, out_ycov0 = out_transform
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
-    src_xcov1 = src_xcov0 + src_w * src_dx
-    out_xcov1 = out_xcov0 + out_w * out_dx
-    src_ycov1 = src_ycov0 + src_h * src_dy
-    out_ycov1 = out_ycov0 + out_h * out_dy
-    if (src_xrot or src_yrot or out_xrot or out_yrot) != 0:
-        raise NotImplementedError("Resampling rotated grids is not supported")
-    if src_dx * out_dx < 0:
-        raise ValueError("Incompatible 'src_transform' and 'out_transform': pixel widths must have the same sign")
-    if src_dy * out_dy < 0:
-        raise ValueError("Incompatible 'src_transform' and 'out_transform': pixel heights must have the same sign")
-    if (out_xcov1 - src_xcov1) * src_dx > 0 or (out_xcov0 - src_xcov0) * src_dx < 0:
-        raise ValueError("Invalid target coverage: target x outside of src")
-    if (out_ycov1 - src_ycov1) * src_dy > 0 or (out_ycov0 - src_ycov0) * src_dy < 0:
-        raise ValueError("Invalid target coverage: target y outside of src")
-    return src_transform, out_transform
+    The weighted *q*-quantile of a target grid cell is the smallest valid source value *v* such that the
+    contribution areas of the source cells with values less than or equal to *v* add up to at least *q* times the
+    contribution area of all valid source cells. Quantiles are therefore always source values, e.g. the lower
+    median for an even number of equally weighted values.
 
+    :param src: 2-D *ndarray*
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param quantiles: sequence of quantiles in the range 0 to 1
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: 3-D *ndarray*, optional
+        Alternate output array of shape (len(quantiles), h, w) in which to place the result.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_2d`.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of shape (len(quantiles), h, w) in which to place whether each quantile is valid.
+    :return: An array of shape (len(quantiles), h, w).
+    """
+    _check_2d(src)
+    quantiles = np.asarray(quantiles, dtype=np.float64).reshape((-1,))
+    if np.any(~(quantiles >= 0.0) | ~(quantiles <= 1.0)):
+        raise ValueError('quantiles must be in the range 0 to 1')
+    shape = (quantiles.shape[0], h, w)
+    if out is None:
+        out = np.zeros(shape, dtype=src.dtype)
+    elif out.shape != shape:
+        raise ValueError("'out' must have shape (len(quantiles), h, w)")
+    fill_value = _get_fill_value(fill_value, src, out)
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, src.shape, (h, w))
+    y_idx, y_wgt, x_idx, x_wgt = _get_ds_tables(src.shape, (h, w), src_transform, out_transform)
+    mask, use_mask = _get_mask(src, valid)
+    out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    with _num_threads(num_threads if parallel else None):
+        _downsample_quantiles_stack(_as_stack(src), _as_stack(mask), use_mask, fill_value, quantiles,
+                                    np.ma.getdata(out)[np.newaxis], out_mask[np.newaxis], use_out_mask,
+                                    y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+    return _set_out_mask(out, out_mask, src, fill_value, out_valid)
 
-def _get_mask(src):
-    if isinstance(src, np.ma.MaskedArray):
-        mask = np.ma.getmask(src)
-        if mask is not np.ma.nomask:
-            return mask, True
-    return _NOMASK2D, False
 
+def resample_nd(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None,
+                src_transform=None, out_transform=None, parallel=False, num_threads=None, valid=None, out_valid=None):
+    """
+    Resample a stack of 2-D grids to a new resolution.
 
-def _mask_or_not(out, src, fill_value):
-    if isinstance(src, np.ma.MaskedArray):
-        if not isinstance(out, np.ma.MaskedArray):
-            if np.isfinite(fill_value):
-                masked = np.ma.masked_equal(out, fill_value, copy=False)
-            else:
-                masked = np.ma.masked_invalid(out, copy=False)
-            masked.set_fill_value(fill_value)
-            return masked
-    return out
+    All axes except the last two are batch axes, e.g. time and band of a (time, band, y, x) cube.
+    The whole stack is resampled by a single kernel call, and the source indices and weights of the
+    output rows and columns are computed only once for all grids of the stack.
 
+    :param src: N-D *ndarray*, N >= 2
+    :param w: *int*
+        New grid width
+    :param h:  *int*
+        New grid height
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *ds_method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the
+        shape ``src.shape[:-2] + (h, w)``.
+    :param src_transform: *affine* transform, optional
+        Affine transform of the src grids, see :py:func:`resample_2d`.
+    :param out_transform: *affine* transform, optional
+        Affine transform of the out grids, see :py:func:`resample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
+    :return: An resampled version of the *src* array.
+    """
+    if ds_method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    _check_nd(src)
+    out = _get_out(out, src, src.shape[:-2] + (h, w), no_op=src_transform is None)
+    src_transform, out_transform = _get_transforms(src_transform, out_transform,
+                                                   src.shape, src.shape[:-2] + (h, w))
+    mask, use_mask = _get_mask(src, valid)
+    if out is None or (src_transform is None and out.shape == src.shape):
+        return _no_op(src, mask, use_mask, out_valid)
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    out_stack = _as_stack(out)
+    with _num_threads(num_threads if parallel else None):
+        _resample(_as_stack(src), _as_stack(mask), use_mask, ds_method, us_method, fill_value, mode_rank,
+                  out_stack, _as_stack(out_mask), use_out_mask, n_chunks, src_transform, out_transform)
+    return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
 
-def _get_fill_value(fill_value, src, out):
-    if fill_value is None:
-        if isinstance(src, np.ma.MaskedArray):
-            fill_value = src.fill_value
-        elif isinstance(out, np.ma.MaskedArray):
-            fill_value = out.fill_value
-        else:
-            # use numpy's default fill_value
-            fill_value = np.ma.array([0], mask=[False], dtype=src.dtype).fill_value
-    return fill_value
 
+def upsample_nd(src, w, h, method=US_LINEAR, fill_value=None, out=None, src_transform=None, out_transform=None,
+                parallel=False, num_threads=None, valid=None, out_valid=None):
+    """
+    Upsample a stack of 2-D grids to a higher resolution by interpolating original grid cells.
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
-# Key-value args are not allowed.
-#
-@jit(nopython=True)
-def _resample_2d(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out):
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
+    All axes except the last two are batch axes, e.g. time and band of a (time, band, y, x) cube.
+    The whole stack is upsampled by a single kernel call, and the source indices and weights of the
+    output rows and columns are computed only once for all grids of the stack.
 
-    if out_w < src_w and out_h < src_h:
-        return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_w < src_w:
-        if out_h > src_h:
-            temp = np.zeros((src_h, out_w), dtype=src.dtype)
-            temp = _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, temp)
-            # todo - write test & fix: must use mask=np.ma.getmaskarray(temp) here if use_mask==True
-            return _upsample_2d(temp, mask, use_mask, us_method, fill_value, out)
-        else:
-            return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_h < src_h:
-        if out_w > src_w:
-            temp = np.zeros((out_h, src_w), dtype=src.dtype)
-            temp = _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, temp)
-            # todo - write test & fix: must use mask=np.ma.getmaskarray(temp) here if use_mask==True
-            return _upsample_2d(temp, mask, use_mask, us_method, fill_value, out)
-        else:
-            return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_w > src_w or out_h > src_h:
-        return _upsample_2d(src, mask, use_mask, us_method, fill_value, out)
-    return src
+    :param src: N-D *ndarray*, N >= 2
+    :param w: *int*
+        Grid width, which must be greater than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be greater than or equal to *src.shape[-2]*
+    :param method: one of the *US_* constants, optional
+        Grid cell interpolation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the
+        shape ``src.shape[:-2] + (h, w)``.
+    :param src_transform: *affine* transform, optional
+        Affine transform of the src grids, see :py:func:`upsample_2d`.
+    :param out_transform: *affine* transform, optional
+        Affine transform of the out grids, see :py:func:`upsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
+    :return: An upsampled version of the *src* array.
+    """
+    _check_nd(src)
+    out = _get_out(out, src, src.shape[:-2] + (h, w), no_op=src_transform is None)
+    src_transform, out_transform = _get_us_transforms(src_transform, out_transform,
+                                                      src.shape, src.shape[:-2] + (h, w))
+    mask, use_mask = _get_mask(src, valid)
+    if out is None or (src_transform is None and out.shape == src.shape):
+        return _no_op(src, mask, use_mask, out_valid)
+    y_idx, y_wgt, x_idx, x_wgt = _get_us_tables(src.shape, out.shape, method, src_transform, out_transform)
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    out_stack = _as_stack(out)
+    with _num_threads(num_threads if parallel else None):
+        _upsample_stack(_as_stack(src), _as_stack(mask), use_mask, method, fill_value, out_stack,
+                        _as_stack(out_mask), use_out_mask, y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+    return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
 
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
-# Key-value args are not allowed.
-#
-@jit(nopython=True)
-def _upsample_2d(src, mask, use_mask, method, fill_value, out):
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
+def downsample_nd(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None, src_transform=None, out_transform=None,
+                  parallel=False, num_threads=None, valid=None, out_valid=None):
+    """
+    Downsample a stack of 2-D grids to a lower resolution by aggregating original grid cells.
 
-    if src_w == out_w and src_h == out_h:
-        return src
+    All axes except the last two are batch axes, e.g. time and band of a (time, band, y, x) cube.
+    The whole stack is downsampled by a single kernel call, and the source index ranges and weights of the
+    output rows and columns are computed only once for all grids of the stack.
 
-    if out_w < src_w or out_h < src_h:
-        raise ValueError("invalid target size")
+    :param src: N-D *ndarray*, N >= 2
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the
+        shape ``src.shape[:-2] + (h, w)``.
+    :param src_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the src grids.
+        Column and row rotation are not supported.
+    :param out_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the out grids.
+        Column and row rotation are not supported.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, an array of the same shape. It can be given instead of or in addition to
+        a masked *src*, e.g. to avoid the overhead of numpy masked arrays.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of the shape of the result in which to place whether each target grid cell is
+        valid. The result is masked only if *src* is a masked array.
+    :return: A downsampled version of the *src* array.
+    """
+    if method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    _check_nd(src)
+    out = _get_out(out, src, src.shape[:-2] + (h, w), no_op=src_transform is None)
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform,
+                                                      src.shape, src.shape[:-2] + (h, w))
+    mask, use_mask = _get_mask(src, valid)
+    if out is None or (src_transform is None and out.shape == src.shape):
+        return _no_op(src, mask, use_mask, out_valid)
+    y_idx, y_wgt, x_idx, x_wgt = _get_ds_tables(src.shape, out.shape, src_transform, out_transform)
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    out_stack = _as_stack(out)
+    with _num_threads(num_threads if parallel else None):
+        _downsample_stack(_as_stack(src), _as_stack(mask), use_mask, method, fill_value, mode_rank, out_stack,
+                          _as_stack(out_mask), use_out_mask, y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+    return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
 
-    if method == US_NEAREST:
-        scale_x = src_w / out_w
-        scale_y = src_h / out_h
-        for out_y in range(out_h):
-            src_y = int(scale_y * out_y)
-            for out_x in range(out_w):
-                src_x = int(scale_x * out_x)
-                value = src[src_y, src_x]
-                if np.isfinite(value) and not (use_mask and mask[src_y, src_x]):
-                    out[out_y, out_x] = value
-                else:
-                    out[out_y, out_x] = fill_value
 
-    elif method == US_LINEAR:
-        scale_x = (src_w - 1.0) / ((out_w - 1.0) if out_w > 1 else 1.0)
-        scale_y = (src_h - 1.0) / ((out_h - 1.0) if out_h > 1 else 1.0)
-        for out_y in range(out_h):
-            src_yf = scale_y * out_y
-            src_y0 = int(src_yf)
-            wy = src_yf - src_y0
-            src_y1 = src_y0 + 1
-            if src_y1 >= src_h:
-                src_y1 = src_y0
-            for out_x in range(out_w):
-                src_xf = scale_x * out_x
-                src_x0 = int(src_xf)
-                wx = src_xf - src_x0
-                src_x1 = src_x0 + 1
-                if src_x1 >= src_w:
-                    src_x1 = src_x0
-                v00 = src[src_y0, src_x0]
-                v01 = src[src_y0, src_x1]
-                v10 = src[src_y1, src_x0]
-                v11 = src[src_y1, src_x1]
-                if use_mask:
-                    v00_ok = np.isfinite(v00) and not mask[src_y0, src_x0]
-                    v01_ok = np.isfinite(v01) and not mask[src_y0, src_x1]
-                    v10_ok = np.isfinite(v10) and not mask[src_y1, src_x0]
-                    v11_ok = np.isfinite(v11) and not mask[src_y1, src_x1]
-                else:
-                    v00_ok = np.isfinite(v00)
-                    v01_ok = np.isfinite(v01)
-                    v10_ok = np.isfinite(v10)
-                    v11_ok = np.isfinite(v11)
-                if v00_ok and v01_ok and v10_ok and v11_ok:
-                    ok = True
-                    v0 = v00 + wx * (v01 - v00)
-                    v1 = v10 + wx * (v11 - v10)
-                    value = v0 + wy * (v1 - v0)
-                elif wx < 0.5:
-                    # NEAREST according to weight
-                    if wy < 0.5:
-                        ok = v00_ok
-                        value = v00
-                    else:
-                        ok = v10_ok
-                        value = v10
-                else:
-                    # NEAREST according to weight
-                    if wy < 0.5:
-                        ok = v01_ok
-                        value = v01
-                    else:
-                        ok = v11_ok
-                        value = v11
-                if ok:
-                    out[out_y, out_x] = value
-                else:
-                    out[out_y, out_x] = fill_value
+def downsample_tiled_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None, src_transform=None,
+                        out_transform=None, tile_bytes=64 * 1024 * 1024, parallel=False, num_threads=None,
+                        valid=None, out_valid=None):
+    """
+    Downsample a 2-D grid that doesn't fit into memory, e.g. a ``numpy.memmap``, by aggregating original grid cells.
 
-    else:
-        raise ValueError('invalid upsampling method')
+    The output rows are processed in blocks. For each block, only the strip of source rows covered by the block,
+    including partly covered edge rows, is read from *src*, and the block is written into *out*.
+    The result is identical to the one of :py:func:`downsample_2d`.
 
+    :param src: 2-D array-like, e.g. a ``numpy.memmap``, that supports ``src[y0:y1]`` and has *shape* and *dtype*
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from *out* if it is a masked array, otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        See :py:func:`downsample_2d`.
+    :param out: 2-D array-like, optional
+        Alternate output array of shape (h, w) in which to place the result, e.g. a ``numpy.memmap``.
+        It must support ``out[y0:y1] = block``.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param tile_bytes: *int*, optional
+        Maximum size of the source strips in bytes, 64 MiB by default. It bounds the peak memory, unless a single
+        output row needs more source rows, which are then read at once.
+    :param parallel: *bool*, optional
+        If ``True``, the output rows of each block are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: 2-D boolean array-like, optional
+        The valid cells of *src*, e.g. a ``numpy.memmap``, read in strips like *src*.
+    :param out_valid: 2-D boolean array-like, optional
+        Alternate output array of shape (h, w) in which to place whether each target grid cell is valid.
+    :return: *out*, or a new array if *out* is not given.
+    """
+    if method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    if len(src.shape) != 2:
+        raise ValueError("'src' must be a 2-D array")
+    if out is None:
+        out = np.zeros((h, w), dtype=src.dtype)
+    elif out.shape != (h, w):
+        raise ValueError("'shape' and 'out' are incompatible")
+    if valid is not None and valid.shape != src.shape:
+        raise ValueError("'valid' must have the shape of 'src'")
+    if out_valid is not None and out_valid.shape != (h, w):
+        raise ValueError("'out_valid' must have the shape of the result")
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, src.shape, (h, w))
+    y_idx, y_wgt, x_idx, x_wgt = _get_ds_tables(src.shape, (h, w), src_transform, out_transform)
+    # Like downsample_2d(), which returns src if it has the target shape
+    no_op = src_transform is None and src.shape == (h, w)
+    fill_value = _get_fill_value(fill_value, src, out)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    row_bytes = src.shape[-1] * np.dtype(src.dtype).itemsize
+    max_rows = max(tile_bytes // row_bytes, 1)
+    # Choose the kernel for the whole grid, not per block, so that all blocks are computed alike
+    unit_weights = _has_unit_weights(y_wgt, x_wgt)
+    value_range = _NO_HISTOGRAM
+    if (method == DS_MODE or method == DS_MEDIAN) and not no_op:
+        value_range = _get_histogram_range(src, max_rows) or _NO_HISTOGRAM
+    out_y0 = 0
+    while out_y0 < h:
+        src_y0 = y_idx[out_y0, 0]
+        out_y1 = max(int(np.searchsorted(y_idx[:, 1], src_y0 + max_rows - 1, side='right')), out_y0 + 1)
+        src_y1 = y_idx[out_y1 - 1, 1] + 1
+        strip = np.ascontiguousarray(src[src_y0:src_y1])
+        if valid is not None:
+            mask, use_mask = np.logical_not(valid[src_y0:src_y1]), True
+        else:
+            mask, use_mask = _NOMASK3D, False
+        if no_op:
+            out[out_y0:out_y1] = strip
+            if out_valid is not None:
+                block_valid = np.zeros(strip.shape, dtype=np.bool_)
+                _no_op(strip, mask, use_mask, block_valid)
+                out_valid[out_y0:out_y1] = block_valid
+        else:
+            block = np.zeros((out_y1 - out_y0, w), dtype=out.dtype)
+            if out_valid is not None:
+                block_mask, use_block_mask = np.zeros(block.shape, dtype=np.bool_), True
+            else:
+                block_mask, use_block_mask = _NOMASK3D, False
+            with _num_threads(num_threads if parallel else None):
+                _downsample_stack(_as_stack(strip), _as_stack(mask), use_mask, method, fill_value, mode_rank,
+                                  _as_stack(block), _as_stack(block_mask), use_block_mask,
+                                  y_idx[out_y0:out_y1] - src_y0, y_wgt[out_y0:out_y1], x_idx, x_wgt, n_chunks,
+                                  unit_weights=unit_weights, value_range=value_range)
+            out[out_y0:out_y1] = block
+            if out_valid is not None:
+                out_valid[out_y0:out_y1] = np.logical_not(block_mask)
+        out_y0 = out_y1
     return out
 
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
-# Key-value args are not allowed.
-#
-@jit(nopython=True)
-def _downsample_2d(src, mask, use_mask, method, fill_value, mode_rank, out, use_transform=False, src_transform=np.zeros((6,)), out_transform=np.zeros(6,)):
-    # np.zeros is as default necessary for numba, it tries to unpack src_transform and out_transform
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
+def downsample_window_2d(src, w, h, window, method=DS_MEAN, fill_value=None, mode_rank=1, out=None,
+                         src_transform=None, out_transform=None, parallel=False, num_threads=None,
+                         valid=None, out_valid=None):
+    """
+    Downsample a 2-D grid to a window of a lower resolution target grid, e.g. to a map tile.
+
+    Only the target grid cells of the window are computed, and only the source grid cells contributing to them
+    are read, so the time depends on the size of the window rather than on the size of *src*.
+    The result is identical to ``downsample_2d(src, w, h, ...)[y:y + win_h, x:x + win_w]``.
+
+    :param src: 2-D *ndarray*
+    :param w: *int*
+        Width of the whole target grid, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Height of the whole target grid, which must be less than or equal to *src.shape[-2]*
+    :param window: *tuple*
+        The window (x, y, win_w, win_h) of the target grid given by its column and row offset, width, and height
+    :param method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        See :py:func:`downsample_2d`.
+    :param out: 2-D *ndarray*, optional
+        Alternate output array of shape (win_h, win_w) in which to place the result.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        Transform of the whole target grid, see :py:func:`downsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_2d`.
+    :param out_valid: boolean *ndarray*, optional
+        Alternate output array of shape (win_h, win_w) in which to place whether each target grid cell is valid.
+    :return: An array of shape (win_h, win_w).
+    """
+    if method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    _check_2d(src)
+    x, y, win_w, win_h = (int(v) for v in window)
+    if x < 0 or y < 0 or win_w < 1 or win_h < 1 or x + win_w > w or y + win_h > h:
+        raise ValueError("'window' must be within the target grid")
+    if valid is not None and valid.shape != src.shape:
+        raise ValueError("'valid' must have the shape of 'src'")
+    out = _get_out(out, src, (win_h, win_w), no_op=False)
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, src.shape, (h, w))
+    if src_transform is None and src.shape == (h, w):
+        # Like downsample_2d(), which returns src if it has the target shape
+        window_src = src[y:y + win_h, x:x + win_w]
+        window_valid = valid[y:y + win_h, x:x + win_w] if valid is not None else None
+        _no_op(window_src, *_get_mask(window_src, window_valid), out_valid=out_valid)
+        out[...] = window_src
+        if isinstance(src, np.ma.MaskedArray) and not isinstance(out, np.ma.MaskedArray):
+            out = np.ma.MaskedArray(out, mask=np.ma.getmaskarray(window_src), copy=False,
+                                    fill_value=_get_fill_value(fill_value, src, out))
+        return out
+    y_offset, scale_y, x_offset, scale_x = _get_ds_geometry(src.shape, (h, w), src_transform, out_transform)
+    y_idx, y_wgt = _get_ds_axis(src.shape[-2], win_h, y_offset, scale_y, start=y)
+    x_idx, x_wgt = _get_ds_axis(src.shape[-1], win_w, x_offset, scale_x, start=x)
+    # Choose the kernel of the whole target grid, so that the window is computed alike
+    unit_weights = _is_aligned(y_offset, scale_y) and _is_aligned(x_offset, scale_x)
+    src_y0, src_y1 = y_idx[0, 0], y_idx[-1, 1] + 1
+    src_x0, src_x1 = x_idx[0, 0], x_idx[-1, 1] + 1
+    window_src = src[src_y0:src_y1, src_x0:src_x1]
+    window_valid = valid[src_y0:src_y1, src_x0:src_x1] if valid is not None else None
+    mask, use_mask = _get_mask(window_src, window_valid)
+    if use_mask:
+        mask = np.ascontiguousarray(mask)
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    out_stack = _as_stack(out)
+    with _num_threads(num_threads if parallel else None):
+        _downsample_stack(_as_stack(np.ascontiguousarray(np.ma.getdata(window_src))), _as_stack(mask), use_mask,
+                          method, fill_value, mode_rank, out_stack, _as_stack(out_mask), use_out_mask,
+                          y_idx - src_y0, y_wgt, x_idx - src_x0, x_wgt, n_chunks, unit_weights=unit_weights)
+    return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
+
+
+def downsample_modes_2d(src, w, h, k, fill_value=None, out=None, out_weights=None, src_transform=None,
+                        out_transform=None, parallel=False, num_threads=None, valid=None):
+    """
+    Downsample a 2-D integer grid, e.g. of land cover classes, to its *k* most frequent values per target grid cell.
+    All *k* modes are computed in a single pass, ``modes[r]`` equals the result of
+    ``downsample_2d(src, w, h, method=DS_MODE, mode_rank=r + 1)``.
+
+    :param src: 2-D *ndarray* of an integer type whose value range spans at most 65536 values
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param k: *int*
+        Number of modes, at least one
+    :param fill_value: *scalar*, optional
+        Value of modes that don't exist, e.g. for target cells with fewer than *k* distinct valid values.
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: 3-D *ndarray*, optional
+        Alternate output array of shape (k, h, w) in which to place the modes.
+    :param out_weights: 3-D *ndarray*, optional
+        Alternate output array of shape (k, h, w) in which to place the weights.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_2d`.
+    :return: tuple (modes, weights) of arrays of shape (k, h, w). *weights* holds the fraction of the valid area of
+        each target grid cell that is covered by the corresponding mode, or zero if the mode doesn't exist.
+    """
+    if k < 1:
+        raise ValueError('k must be >= 1')
+    _check_2d(src)
+    if out is None:
+        out = np.zeros((k, h, w), dtype=src.dtype)
+    elif out.shape != (k, h, w):
+        raise ValueError("'out' must have shape (k, h, w)")
+    if out_weights is None:
+        out_weights = np.zeros((k, h, w), dtype=np.float64)
+    elif out_weights.shape != (k, h, w):
+        raise ValueError("'out_weights' must have shape (k, h, w)")
+    fill_value = _get_fill_value(fill_value, src, out)
+    _downsample_classes_2d(src, valid, fill_value, out, out_weights, np.zeros((0,), dtype=np.int64),
+                           np.zeros((0, h, w), dtype=np.float64), src_transform, out_transform, parallel, num_threads)
+    # Modes exist if and only if they have a weight
+    return _set_out_mask(out, out_weights == 0.0, src, fill_value, None), out_weights
+
+
+def downsample_fractions_2d(src, w, h, classes, out=None, src_transform=None, out_transform=None,
+                            parallel=False, num_threads=None, valid=None):
+    """
+    Compute the area fractions of classes in a 2-D integer grid, e.g. of land cover classes, per target grid cell.
+    All classes are computed in a single pass.
+
+    :param src: 2-D *ndarray* of an integer type whose value range spans at most 65536 values
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param classes: sequence of the class values, e.g. ``range(n_classes)``
+    :param out: 3-D floating point *ndarray*, optional
+        Alternate output array of shape (len(classes), h, w) in which to place the result.
+    :param src_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param out_transform: *affine* transform, optional
+        See :py:func:`downsample_2d`.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_2d`.
+    :return: An array of shape (len(classes), h, w). Element [c, y, x] is the fraction of the valid area of
+        target grid cell (y, x) that is covered by ``classes[c]``. Target cells without valid source cells are NaN.
+    """
+    _check_2d(src)
+    classes = np.asarray(classes, dtype=np.int64).reshape((-1,))
+    shape = (classes.shape[0], h, w)
+    if out is None:
+        out = np.zeros(shape, dtype=np.float64)
+    elif out.shape != shape:
+        raise ValueError("'out' must have shape (len(classes), h, w)")
+    _downsample_classes_2d(src, valid, 0, np.zeros((0, h, w), dtype=src.dtype), np.zeros((0, h, w), dtype=np.float64),
+                           classes, out, src_transform, out_transform, parallel, num_threads)
+    return out
+
+
+class Regridder(object):
+    """
+    A reusable resampling plan for grids of a fixed geometry.
+
+    The source index ranges and weights of all output rows and columns depend only on the grid shapes and
+    transforms. They are computed once when the plan is created, so that calling the plan on many grids
+    of the same geometry costs just the kernel time.
+
+    :param src_shape: *tuple*
+        Shape of the source grids, the last two entries are height and width.
+    :param out_shape: *tuple*
+        Shape of the output grids, the last two entries are height and width.
+    :param src_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the src grids.
+        Column and row rotation are not supported.
+    :param out_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the out grids.
+        Column and row rotation are not supported.
+    :param method: one of the *DS_* or *US_* constants, optional
+        Grid cell aggregation method for downsampling or interpolation method for upsampling.
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from the source grid if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param parallel: *bool*, optional
+        If ``True``, output rows are split into chunks which are processed by multiple threads.
+        The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param cache: :py:class:`WeightCache`, optional
+        Cache from which the source index ranges and weights are loaded, or in which they are stored.
+    """
+
+    def __init__(self, src_shape, out_shape, src_transform=None, out_transform=None, method=DS_MEAN,
+                 fill_value=None, mode_rank=1, parallel=False, num_threads=None, cache=None):
+        self.src_shape = tuple(src_shape[-2:])
+        self.out_shape = tuple(out_shape[-2:])
+        self.method = method
+        self.fill_value = fill_value
+        self.mode_rank = mode_rank
+        self.num_threads = num_threads if parallel else None
+        n_chunks = _get_chunk_count(parallel, num_threads)
+        if method in _US_METHODS:
+            src_transform, out_transform = _get_us_transforms(src_transform, out_transform,
+                                                              self.src_shape, self.out_shape)
+            get_tables = _get_us_tables
+            table_args = (self.src_shape, self.out_shape, method, src_transform, out_transform)
+            kernel = _upsample_stack
+        elif method in _DS_METHODS:
+            if method == DS_MODE and mode_rank < 1:
+                raise ValueError('mode_rank must be >= 1')
+            src_transform, out_transform = _get_ds_transforms(src_transform, out_transform,
+                                                              self.src_shape, self.out_shape)
+            get_tables = _get_ds_tables
+            table_args = (self.src_shape, self.out_shape, src_transform, out_transform)
+            kernel = _downsample_stack
+        else:
+            raise ValueError('invalid resampling method')
+        if cache is not None:
+            tables = cache.get(('Regridder', method) + table_args,
+                               lambda: dict(zip(_TABLE_NAMES, get_tables(*table_args))))
+            self._tables = tuple(tables[name] for name in _TABLE_NAMES)
+        else:
+            self._tables = get_tables(*table_args)
+        self._kernel = kernel
+        self._n_chunks = n_chunks
+        # Choose the block kernel once for the plan, not per call
+        self._unit_weights = _has_unit_weights(self._tables[1], self._tables[3]) if method in _DS_METHODS else False
+
+    def __call__(self, src, out=None, valid=None, out_valid=None):
+        """
+        Resample *src* into the output grid geometry.
+
+        :param src: N-D *ndarray*, N >= 2, whose last two axes match *src_shape*.
+            All other axes are batch axes.
+        :param out: N-D *ndarray*, optional
+            Alternate output array in which to place the result. The default is *None*; if provided, it must have
+            the shape ``src.shape[:-2] + out_shape``.
+        :param valid: boolean *ndarray*, optional
+            The valid cells of *src*, see :py:func:`downsample_nd`.
+        :param out_valid: boolean *ndarray*, optional
+            Alternate output array in which to place whether each target grid cell is valid,
+            see :py:func:`downsample_nd`.
+        :return: The resampled version of the *src* array.
+        """
+        if src.shape[-2:] != self.src_shape:
+            raise ValueError("'src' does not match the regridder's source shape")
+        shape = src.shape[:-2] + self.out_shape
+        if out is None:
+            out = np.zeros(shape, dtype=src.dtype)
+        elif out.shape != shape:
+            raise ValueError("'shape' and 'out' are incompatible")
+        mask, use_mask = _get_mask(src, valid)
+        fill_value = _get_fill_value(self.fill_value, src, out)
+        out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+        if self.method in _DS_METHODS:
+            args = (fill_value, self.mode_rank)
+            kwargs = dict(unit_weights=self._unit_weights)
+        else:
+            args = (fill_value,)
+            kwargs = dict()
+        out_stack = _as_stack(out)
+        with _num_threads(self.num_threads):
+            self._kernel(_as_stack(src), _as_stack(mask), use_mask, self.method, *args,
+                         out_stack, _as_stack(out_mask), use_out_mask, *self._tables, self._n_chunks, **kwargs)
+        return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
+
+
+class StreamResampler(object):
+    """
+    Resampling of a 2-D grid that arrives as a stream of row strips, e.g. from a decompressor or a socket.
+
+    Source rows are passed to :py:meth:`push` in order. Only the source rows needed by output rows that are not
+    finished yet are kept, and each output row is computed as soon as all of its source rows have been pushed.
+    Hence, the latency to the first output row and the memory used depend on the resampling factor,
+    but not on the grid height. The rows are identical to those of :py:class:`Regridder` for the whole grid.
+
+    :param src_shape: *tuple*
+        Shape of the source grid, the last two entries are height and width.
+    :param out_shape: *tuple*
+        Shape of the output grid, the last two entries are height and width.
+    :param src_transform: *affine* transform, optional
+        See :py:class:`Regridder`.
+    :param out_transform: *affine* transform, optional
+        See :py:class:`Regridder`.
+    :param method: one of the *DS_* or *US_* constants, optional
+        Grid cell aggregation method for downsampling or interpolation method for upsampling.
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from the source strips if they are masked arrays,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        See :py:class:`Regridder`.
+    :param parallel: *bool*, optional
+        If ``True``, the output rows finished by a strip are split into chunks which are processed by
+        multiple threads.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param cache: :py:class:`WeightCache`, optional
+        See :py:class:`Regridder`.
+    """
+
+    def __init__(self, src_shape, out_shape, src_transform=None, out_transform=None, method=DS_MEAN,
+                 fill_value=None, mode_rank=1, parallel=False, num_threads=None, cache=None):
+        self._regridder = Regridder(src_shape, out_shape, src_transform=src_transform, out_transform=out_transform,
+                                    method=method, fill_value=fill_value, mode_rank=mode_rank, parallel=parallel,
+                                    num_threads=num_threads, cache=cache)
+        self.src_shape = self._regridder.src_shape
+        self.out_shape = self._regridder.out_shape
+        y_idx = self._regridder._tables[0]
+        # Source rows [_row_start[out_y], _row_end[out_y]) are needed by output row out_y
+        self._row_start = y_idx.min(axis=1)
+        self._row_end = y_idx.max(axis=1) + 1
+        # Buffer of the carried rows, which start at source row _rows_y0, as large as any output row needs
+        self._max_rows = max(int((self._row_end - self._row_start).max()), 1)
+        self._rows = None
+        self._rows_mask = None
+        self._rows_y0 = 0
+        self._row_count = 0
+        self._src_y = 0
+        self._out_y = 0
+
+    @property
+    def rows_pushed(self):
+        """Number of source rows pushed so far."""
+        return self._src_y
+
+    @property
+    def rows_done(self):
+        """Number of output rows finished so far."""
+        return self._out_y
+
+    def push(self, strip, valid=None):
+        """
+        Push the next source rows and compute the output rows that are finished by them.
+
+        :param strip: 2-D *ndarray* of shape (n, src_w), or a 1-D *ndarray* for a single row.
+            Masked strips yield masked output rows.
+        :param valid: boolean *ndarray* of the shape of *strip*, optional
+            The valid cells of *strip*, see :py:func:`downsample_nd`.
+        :return: A 2-D array of the finished output rows, which has zero rows if no output row was finished.
+        """
+        if strip.ndim == 1:
+            strip = strip.reshape((1, -1))
+            valid = valid.reshape((1, -1)) if valid is not None else None
+        if strip.ndim != 2 or strip.shape[-1] != self.src_shape[-1]:
+            raise ValueError("'strip' must have the width of the source grid")
+        if self._src_y + strip.shape[0] > self.src_shape[-2]:
+            raise ValueError("'strip' exceeds the height of the source grid")
+        mask, use_mask = _get_mask(strip, valid)
+        data = np.ascontiguousarray(np.ma.getdata(strip))
+        mask = np.ascontiguousarray(mask)
+        if self._rows is None:
+            self._rows = np.zeros((self._max_rows, self.src_shape[-1]), dtype=strip.dtype)
+        if use_mask and self._rows_mask is None:
+            self._rows_mask = np.zeros(self._rows.shape, dtype=np.bool_)
+        src_y0 = self._src_y
+        src_y1 = src_y0 + strip.shape[0]
+        self._src_y = src_y1
+
+        out_y0 = self._out_y
+        out_y1 = int(np.searchsorted(self._row_end, src_y1, side='right'))
+        out = np.zeros((out_y1 - out_y0, self.out_shape[-1]), dtype=self._rows.dtype)
+        fill_value = _get_fill_value(self._regridder.fill_value, strip, None)
+        out_mask, use_out_mask = _get_out_mask(out, strip, None)
+        # Output rows that need carried rows are computed from the carry buffer, filled up from the strip
+        out_y = out_y0
+        strip_y = src_y0
+        while out_y < out_y1 and self._row_start[out_y] < src_y0:
+            self._keep_rows(self._row_start[out_y])
+            count = min(src_y1 - strip_y, self._rows.shape[0] - self._row_count)
+            self._put_rows(data, mask, use_mask, strip_y - src_y0, count)
+            strip_y += count
+            out_y_end = min(int(np.searchsorted(self._row_end, strip_y, side='right')),
+                            int(np.searchsorted(self._row_start, src_y0, side='left')))
+            use_rows_mask = self._rows_mask is not None
+            rows_mask = self._rows_mask[:self._row_count] if use_rows_mask else _NOMASK3D
+            self._resample(self._rows[:self._row_count], rows_mask, use_rows_mask, self._rows_y0, fill_value,
+                           out, out_mask, use_out_mask, out_y0, out_y, out_y_end)
+            out_y = out_y_end
+        # The other output rows are computed from the strip
+        if out_y < out_y1:
+            self._resample(data, mask, use_mask, src_y0, fill_value, out, out_mask, use_out_mask, out_y0, out_y,
+                           out_y1)
+        self._out_y = out_y1
+        # Carry the rows that the open output rows need
+        keep_y = min(self._row_start[out_y1], src_y1) if out_y1 < self.out_shape[-2] else src_y1
+        self._keep_rows(keep_y)
+        strip_y = max(strip_y, keep_y)
+        self._put_rows(data, mask, use_mask, strip_y - src_y0, src_y1 - strip_y)
+        return _set_out_mask(out, out_mask, strip, fill_value, None)
+
+    def _keep_rows(self, src_y):
+        """
+        Drop the carried rows before source row *src_y* by shifting the others to the start of the buffer.
+        """
+        drop = min(src_y - self._rows_y0, self._row_count)
+        if drop > 0:
+            count = self._row_count - drop
+            self._rows[:count] = self._rows[drop:self._row_count]
+            if self._rows_mask is not None:
+                self._rows_mask[:count] = self._rows_mask[drop:self._row_count]
+            self._row_count = count
+        self._rows_y0 = src_y if self._row_count == 0 else self._rows_y0 + drop
+
+    def _put_rows(self, data, mask, use_mask, y, count):
+        """
+        Append *count* rows of the strip *data* from row *y* on to the carried rows.
+        """
+        rows = slice(self._row_count, self._row_count + count)
+        self._rows[rows] = data[y:y + count]
+        if self._rows_mask is not None:
+            self._rows_mask[rows] = mask[y:y + count] if use_mask else False
+        self._row_count += count
+
+    def _resample(self, rows, mask, use_mask, rows_y0, fill_value, out, out_mask, use_out_mask, out_y0, y0, y1):
+        """
+        Compute the output rows *y0* to *y1* into the rows of *out* from *out_y0* on,
+        from *rows* which start at source row *rows_y0*.
+        """
+        regridder = self._regridder
+        y_idx, y_wgt, x_idx, x_wgt = regridder._tables
+        y_idx = y_idx[y0:y1] - rows_y0
+        y_wgt = y_wgt[y0:y1]
+        out = out[y0 - out_y0:y1 - out_y0]
+        out_mask = out_mask[y0 - out_y0:y1 - out_y0] if use_out_mask else out_mask
+        with _num_threads(regridder.num_threads):
+            if regridder.method in _DS_METHODS:
+                _downsample_stack(_as_stack(rows), _as_stack(mask), use_mask, regridder.method, fill_value,
+                                  regridder.mode_rank, _as_stack(out), _as_stack(out_mask), use_out_mask,
+                                  y_idx, y_wgt, x_idx, x_wgt, regridder._n_chunks, unit_weights=regridder._unit_weights)
+            else:
+                _upsample_stack(_as_stack(rows), _as_stack(mask), use_mask, regridder.method, fill_value,
+                                _as_stack(out), _as_stack(out_mask), use_out_mask, y_idx, y_wgt, x_idx, x_wgt,
+                                regridder._n_chunks)
+
+
+def resample_stream(strips, src_shape, out_shape, **kwargs):
+    """
+    Resample a 2-D grid that arrives as an iterable of row strips, see :py:class:`StreamResampler`.
+
+    :param strips: iterable of 2-D *ndarray* of shape (n, src_w), or of 1-D *ndarray* for single rows
+    :param src_shape: *tuple*
+        Shape of the source grid, the last two entries are height and width.
+    :param out_shape: *tuple*
+        Shape of the output grid, the last two entries are height and width.
+    :param kwargs: Keyword arguments of :py:class:`StreamResampler`.
+    :return: A generator of 2-D arrays of the output rows, yielded as soon as they are finished.
+    """
+    resampler = StreamResampler(src_shape, out_shape, **kwargs)
+    for strip in strips:
+        rows = resampler.push(strip)
+        if rows.shape[0]:
+            yield rows
+    if resampler.rows_pushed != resampler.src_shape[-2]:
+        raise ValueError("'strips' must cover the height of the source grid")
+
+
+class SparseRegridder(object):
+    """
+    Conservative regridding between grids of arbitrary affine transforms, including rotated grids.
+
+    The regridder holds a sparse weight matrix in compressed sparse row (CSR) format. Element (k, l) is the exact
+    area of the overlap of target cell k and source cell l, in units of the source cell area, where cells are
+    numbered row by row. Applying the regridder computes the area-weighted mean of the valid source cells
+    of each target cell, i.e. ``DS_MEAN`` for arbitrary geometries. Building the matrix costs much more than
+    applying it, so the regridder should be reused for all grids of the same geometry.
+
+    :param src_shape: *tuple*
+        Shape of the source grids, the last two entries are height and width.
+    :param out_shape: *tuple*
+        Shape of the output grids, the last two entries are height and width.
+    :param src_transform: *affine* transform, optional
+        Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+        column rotation, height of pixel, upper left y-coordinate) of the src grids.
+    :param out_transform: *affine* transform, optional
+        Affine object/tuple/array/list as *src_transform* of the out grids. If neither transform is given,
+        both grids cover the same area.
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from the source grid if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param parallel: *bool*, optional
+        If ``True``, output cells are split into chunks which are processed by multiple threads,
+        when building the matrix and when applying it. The result is the same as for the serial computation.
+    :param num_threads: *int*, optional
+        Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+    :param cache: :py:class:`WeightCache`, optional
+        Cache from which the weight matrix is loaded, or in which it is stored after building it.
+    """
+
+    def __init__(self, src_shape, out_shape, src_transform=None, out_transform=None, fill_value=None,
+                 parallel=False, num_threads=None, cache=None):
+        self.src_shape = tuple(src_shape[-2:])
+        self.out_shape = tuple(out_shape[-2:])
+        self.fill_value = fill_value
+        self.num_threads = num_threads if parallel else None
+        self._n_chunks = _get_chunk_count(parallel, num_threads)
+        src_h, src_w = self.src_shape
+        out_h, out_w = self.out_shape
+        if (src_transform is None) ^ (out_transform is None):
+            raise ValueError("Either no transform should be given, or both")
+        if src_transform is None:
+            src_transform = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+            out_transform = (src_w / out_w, 0.0, 0.0, 0.0, src_h / out_h, 0.0)
+        pixel_transform = _get_pixel_transform(src_transform, out_transform)
+        #: Shape of the weight matrix, (out_h * out_w, src_h * src_w).
+        self.shape = (out_h * out_w, src_h * src_w)
+
+        def get_matrix():
+            with _num_threads(self.num_threads):
+                return _get_overlap_matrix(self.src_shape, self.out_shape, pixel_transform, self._n_chunks)
+
+        if cache is not None:
+            matrix = cache.get(('SparseRegridder', self.src_shape, self.out_shape, pixel_transform), get_matrix)
+        else:
+            matrix = get_matrix()
+        #: Row pointers of the CSR weight matrix.
+        self.indptr = matrix['indptr']
+        #: Column indices of the CSR weight matrix, i.e. flat indices of source cells.
+        self.indices = matrix['indices']
+        #: Values of the CSR weight matrix, i.e. overlap areas in units of the source cell area.
+        self.weights = matrix['weights']
+
+    def __call__(self, src, out=None, valid=None, out_valid=None):
+        """
+        Regrid *src* into the output grid geometry.
+
+        :param src: N-D *ndarray*, N >= 2, whose last two axes match *src_shape*.
+            All other axes are batch axes, e.g. bands or time steps, which are regridded by a single kernel call.
+        :param out: N-D *ndarray*, optional
+            Alternate output array in which to place the result. The default is *None*; if provided, it must have
+            the shape ``src.shape[:-2] + out_shape``.
+        :param valid: boolean *ndarray*, optional
+            The valid cells of *src*, see :py:func:`downsample_nd`.
+        :param out_valid: boolean *ndarray*, optional
+            Alternate output array in which to place whether each target grid cell is valid,
+            see :py:func:`downsample_nd`.
+        :return: The regridded version of the *src* array.
+        """
+        if src.shape[-2:] != self.src_shape:
+            raise ValueError("'src' does not match the regridder's source shape")
+        shape = src.shape[:-2] + self.out_shape
+        if out is None:
+            out = np.zeros(shape, dtype=src.dtype)
+        elif out.shape != shape:
+            raise ValueError("'shape' and 'out' are incompatible")
+        mask, use_mask = _get_mask(src, valid)
+        fill_value = _get_fill_value(self.fill_value, src, out)
+        out_mask, use_out_mask = _get_out_mask(out, src, out_valid)
+        src_rows = _as_stack(src).reshape((-1, self.shape[1]))
+        mask_rows = _as_stack(mask).reshape((src_rows.shape[0] if use_mask else 1, -1))
+        out_stack = _as_stack(out)
+        out_rows = out_stack.reshape((-1, self.shape[0]))
+        out_mask_rows = _as_stack(out_mask).reshape((out_rows.shape[0] if use_out_mask else 1, -1))
+        sparse_mean = _sparse_mean_parallel if self._n_chunks > 1 else _sparse_mean
+        with _num_threads(self.num_threads):
+            sparse_mean(src_rows, mask_rows, use_mask, fill_value, out_rows, out_mask_rows, use_out_mask,
+                        self.indptr, self.indices, self.weights, self._n_chunks)
+        if not np.may_share_memory(out_rows, out_stack):
+            out_stack[...] = out_rows.reshape(out_stack.shape)
+        if use_out_mask and not np.may_share_memory(out_mask_rows, out_mask):
+            out_mask[...] = out_mask_rows.reshape(out_mask.shape)
+        return _set_out_mask(_from_stack(out_stack, out), out_mask, src, fill_value, out_valid)
+
+
+class WeightCache(object):
+    """
+    A persistent cache of resampling weights on disk, e.g. to share the weight matrices of
+    :py:class:`SparseRegridder` between processes and job runs.
+
+    Each entry is a directory of ``.npy`` files, named after a hash of the grid shapes, transforms, and method.
+    Entries are loaded as read-only memory maps, so loading them doesn't copy the weights. If the size of all
+    entries exceeds *max_bytes*, the least recently used entries are removed.
+
+    :param cache_dir: *str*
+        The cache directory, which is created if it doesn't exist.
+    :param max_bytes: *int*, optional
+        Maximum size of all entries in bytes, 1 GiB by default.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get(self, key, compute):
+        """
+        Get the arrays cached under *key*, or compute and store them.
+
+        :param key: *tuple* of shapes, transforms, methods, and other values that determine the arrays
+        :param compute: callable that returns the arrays as *dict* of *ndarray* by name
+        :return: *dict* of read-only arrays by name
+        """
+        entry_dir = os.path.join(self.cache_dir, _get_cache_key(key))
+        arrays = self._load(entry_dir)
+        if arrays is None:
+            self._store(entry_dir, compute())
+            self._evict(entry_dir)
+            arrays = self._load(entry_dir)
+        return arrays
+
+    @property
+    def size(self):
+        """Size of all entries in bytes."""
+        return sum(size for _, _, size in self._get_entries())
+
+    def clear(self):
+        """Remove all entries."""
+        for entry_dir, _, _ in self._get_entries():
+            self._remove(entry_dir)
+
+    def _load(self, entry_dir):
+        try:
+            arrays = {name[:-4]: np.load(os.path.join(entry_dir, name), mmap_mode='r')
+                      for name in os.listdir(entry_dir) if name.endswith('.npy')}
+            # Mark as recently used
+            os.utime(entry_dir, None)
+        except (OSError, ValueError):
+            # Missing, or removed by another process meanwhile
+            return None
+        return arrays
+
+    def _store(self, entry_dir, arrays):
+        # Write into a temporary directory first, so that other processes never see incomplete entries
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_dir, name + '.npy'), np.ascontiguousarray(array))
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # Stored by another process meanwhile
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _evict(self, keep_dir):
+        entries = sorted(self._get_entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for entry_dir, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if entry_dir != keep_dir:
+                self._remove(entry_dir)
+                total -= size
+
+    def _remove(self, entry_dir):
+        # Move the entry away first, so that other processes never see incomplete entries
+        removed_dir = tempfile.mkdtemp(prefix='.removed-', dir=self.cache_dir)
+        try:
+            os.rename(entry_dir, os.path.join(removed_dir, 'entry'))
+        except OSError:
+            # Removed by another process meanwhile
+            pass
+        shutil.rmtree(removed_dir, ignore_errors=True)
+
+    def _get_entries(self):
+        """
+        Get the entries as list of tuples (entry_dir, last use time, size in bytes).
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, file_name))
+                           for file_name in os.listdir(entry_dir))
+                entries.append((entry_dir, os.path.getmtime(entry_dir), size))
+            except OSError:
+                pass
+        return entries
+
+
+class SummedAreaTable(object):
+    """
+    Summed-area tables (integral images) of a grid or a stack of grids for fast downsampling
+    using the methods ``DS_MEAN``, ``DS_VAR``, and ``DS_STD``.
+
+    The tables hold the cumulative sums of the valid cell weights, the valid cell values, and the squared
+    valid cell values. The integral of a grid over any rectangle is the bilinear interpolation of the tables
+    at the rectangle's corners, which also covers fractional contributions of cells at the rectangle's edges.
+    Therefore, the cost per output cell is constant, whatever the aggregation factor is, and the same tables
+    can be used to produce several target resolutions.
+
+    Results equal those of :py:func:`downsample_nd` up to floating point round-off. Note that the precision
+    of the tables decreases with the grid size and the magnitude of the values.
+
+    :param src: N-D *ndarray*, N >= 2
+        The source grid. All axes except the last two are batch axes.
+    :param valid: boolean *ndarray*, optional
+        The valid cells of *src*, see :py:func:`downsample_nd`.
+    """
+
+    def __init__(self, src, valid=None):
+        _check_nd(src)
+        self.src_shape = src.shape
+        self.dtype = src.dtype
+        self._src_masked = isinstance(src, np.ma.MaskedArray)
+        self._src_fill_value = src.fill_value if self._src_masked else None
+        mask, use_mask = _get_mask(src, valid)
+        data = _as_stack(src)
+        valid = np.isfinite(data)
+        if use_mask:
+            valid &= ~_as_stack(mask)
+        values = np.where(valid, data, 0).astype(np.float64)
+        weights = valid.astype(np.float64)
+        # Values are shifted by the mean of each grid, which reduces round-off in the tables
+        w_count = weights.sum(axis=(1, 2))
+        self._shift = values.sum(axis=(1, 2)) / np.maximum(w_count, 1.0)
+        values -= self._shift[:, np.newaxis, np.newaxis]
+        values *= weights
+        self._w_table = _get_summed_area_table(weights)
+        self._v_table = _get_summed_area_table(values)
+        values *= values
+        self._vv_table = _get_summed_area_table(values)
+
+    def downsample(self, w, h, method=DS_MEAN, fill_value=None, out=None, src_transform=None, out_transform=None,
+                   parallel=False, num_threads=None, out_valid=None):
+        """
+        Downsample the source grid to a lower resolution by aggregating original grid cells.
+
+        :param w: *int*
+            Grid width, which must be less than or equal to *src.shape[-1]*
+        :param h:  *int*
+            Grid height, which must be less than or equal to *src.shape[-2]*
+        :param method: one of ``DS_MEAN``, ``DS_VAR``, ``DS_STD``, optional
+            Grid cell aggregation method
+        :param fill_value: *scalar*, optional
+            If ``None``, it is taken from the source grid if it is a masked array,
+            otherwise from *out* if it is a masked array,
+            otherwise numpy's default value is used.
+        :param out: N-D *ndarray*, optional
+            Alternate output array in which to place the result. The default is *None*; if provided, it must have the
+            shape ``src.shape[:-2] + (h, w)``.
+        :param src_transform: *affine* transform, optional
+            Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+            column rotation, height of pixel, upper left y-coordinate) of the src grids.
+            Column and row rotation are not supported.
+        :param out_transform: *affine* transform, optional
+            Affine object/tuple/array/list containing (width of pixel, row rotation, upper left x-coordinate,
+            column rotation, height of pixel, upper left y-coordinate) of the out grids.
+            Column and row rotation are not supported.
+        :param parallel: *bool*, optional
+            If ``True``, output rows are split into chunks which are processed by multiple threads.
+            The result is the same as for the serial computation.
+        :param num_threads: *int*, optional
+            Number of threads used if *parallel* is ``True``. Defaults to Numba's current number of threads.
+        :param out_valid: boolean *ndarray*, optional
+            Alternate output array in which to place whether each target grid cell is valid,
+            see :py:func:`downsample_nd`.
+        :return: A downsampled version of the source grid.
+        """
+        if method not in (DS_MEAN, DS_VAR, DS_STD):
+            raise ValueError('invalid downsampling method, must be one of DS_MEAN, DS_VAR, DS_STD')
+        shape = self.src_shape[:-2] + (h, w)
+        if out is None:
+            out = np.zeros(shape, dtype=self.dtype)
+        elif out.shape != shape:
+            raise ValueError("'shape' and 'out' are incompatible")
+        src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, self.src_shape, shape)
+        y_offset, scale_y, x_offset, scale_x = _get_ds_geometry(self.src_shape, shape, src_transform, out_transform)
+        y_idx, y_frac = _get_sat_axis(self.src_shape[-2], h, y_offset, scale_y)
+        x_idx, x_frac = _get_sat_axis(self.src_shape[-1], w, x_offset, scale_x)
+        if fill_value is None:
+            if self._src_masked:
+                fill_value = self._src_fill_value
+            elif isinstance(out, np.ma.MaskedArray):
+                fill_value = out.fill_value
+            else:
+                fill_value = _get_default_fill_value(self.dtype)
+        if out_valid is not None and out_valid.shape != shape:
+            raise ValueError("'out_valid' must have the shape of the result")
+        use_out_mask = self._src_masked or out_valid is not None
+        out_mask = np.zeros(shape, dtype=np.bool_) if use_out_mask else _NOMASK3D
+        n_chunks = _get_chunk_count(parallel, num_threads)
+        kernel = _sat_downsample_parallel if n_chunks > 1 else _sat_downsample
+        out_stack = _as_stack(out)
+        with _num_threads(num_threads if parallel else None):
+            kernel(self._w_table, self._v_table, self._vv_table, self._shift, method, fill_value, out_stack,
+                   _as_stack(out_mask), use_out_mask, y_idx, y_frac, x_idx, x_frac, n_chunks)
+        out = _from_stack(out_stack, out)
+        if out_valid is not None:
+            np.logical_not(out_mask, out=out_valid)
+        if self._src_masked:
+            if isinstance(out, np.ma.MaskedArray):
+                out.mask = out_mask
+            else:
+                out = np.ma.MaskedArray(out, mask=out_mask, copy=False, fill_value=fill_value)
+        return out
+
+
+def _check_2d(src):
+    if src.ndim != 2:
+        raise ValueError("'src' must be a 2-D array")
+
+
+def _check_nd(src):
+    if src.ndim < 2:
+        raise ValueError("'src' must have at least 2 dimensions")
+
+
+def _get_out(out, src, shape, no_op=True):
+    if out is None:
+        return np.zeros(shape, dtype=src.dtype)
+    else:
+        if out.shape != shape:
+            raise ValueError("'shape' and 'out' are incompatible")
+        if no_op and out.shape == src.shape:
+            return None
+        return out
+
+
+def _as_stack(array):
+    """
+    Get a 3-D view of *array*, whose first axis is the product of all batch axes of *array*.
+    A copy is returned only if the batch axes cannot be collapsed without copying.
+    """
+    data = np.ma.getdata(array)
+    return data.reshape((-1,) + data.shape[-2:])
+
+
+def _from_stack(out_stack, out):
+    """
+    Get *out* after the kernels have written into *out_stack*, which is a 3-D view or copy of *out*.
+    """
+    if not np.may_share_memory(out_stack, np.ma.getdata(out)):
+        np.ma.getdata(out)[...] = out_stack.reshape(out.shape)
+    return out
+
+
+def _get_transforms(src_transform, out_transform, src_shape, out_shape):
+    if (src_transform is None) ^ (out_transform is None):
+        raise ValueError("Either no transform should be given, or both")
+    elif src_transform is not None and out_transform is not None:
+        src_transform, out_transform = _check_transform(src_transform, out_transform, src_shape, out_shape)
+    return src_transform, out_transform
+
+
+def _get_ds_transforms(src_transform, out_transform, src_shape, out_shape):
+    src_transform, out_transform = _get_transforms(src_transform, out_transform, src_shape, out_shape)
+    if src_transform is not None:
+        src_dx, src_dy = src_transform[0], src_transform[4]
+        out_dx, out_dy = out_transform[0], out_transform[4]
+        if abs(out_dx) < abs(src_dx) or abs(out_dy) < abs(src_dy):
+            raise ValueError("Invalid cellsize in 'out_transform'")
+    return src_transform, out_transform
+
+
+def _get_us_transforms(src_transform, out_transform, src_shape, out_shape):
+    src_transform, out_transform = _get_transforms(src_transform, out_transform, src_shape, out_shape)
+    if src_transform is not None:
+        src_dx, src_dy = src_transform[0], src_transform[4]
+        out_dx, out_dy = out_transform[0], out_transform[4]
+        if abs(out_dx) > abs(src_dx) or abs(out_dy) > abs(src_dy):
+            raise ValueError("Invalid cellsize in 'out_transform'")
+    return src_transform, out_transform
+
+
+def _check_transform(src_transform, out_transform, src_shape, out_shape):
+    src_transform = np.array(src_transform[:6], dtype=np.float64)
+    out_transform = np.array(out_transform[:6], dtype=np.float64)
+    src_dx, src_xrot, src_xcov0, src_yrot, src_dy, src_ycov0 = src_transform
+    out_dx, out_xrot, out_xcov0, out_yrot, out_dy, out_ycov0 = out_transform
+    src_w = src_shape[-1]
+    src_h = src_shape[-2]
+    out_w = out_shape[-1]
+    out_h = out_shape[-2]
+    src_xcov1 = src_xcov0 + src_w * src_dx
+    out_xcov1 = out_xcov0 + out_w * out_dx
+    src_ycov1 = src_ycov0 + src_h * src_dy
+    out_ycov1 = out_ycov0 + out_h * out_dy
+    if (src_xrot or src_yrot or out_xrot or out_yrot) != 0:
+        raise NotImplementedError("Resampling rotated grids is not supported, use SparseRegridder")
+    if src_dx * out_dx < 0:
+        raise ValueError("Incompatible 'src_transform' and 'out_transform': pixel widths must have the same sign")
+    if src_dy * out_dy < 0:
+        raise ValueError("Incompatible 'src_transform' and 'out_transform': pixel heights must have the same sign")
+    if (out_xcov1 - src_xcov1) * src_dx > 0 or (out_xcov0 - src_xcov0) * src_dx < 0:
+        raise ValueError("Invalid target coverage: target x outside of src")
+    if (out_ycov1 - src_ycov1) * src_dy > 0 or (out_ycov0 - src_ycov0) * src_dy < 0:
+        raise ValueError("Invalid target coverage: target y outside of src")
+    return src_transform, out_transform
+
+
+def _get_mask(src, valid=None):
+    """
+    Get the mask of the invalid cells of *src* and whether it must be used,
+    combining the mask of a masked *src* with the boolean array *valid*.
+    """
+    mask = np.ma.getmask(src) if isinstance(src, np.ma.MaskedArray) else np.ma.nomask
+    if valid is not None:
+        if valid.shape != src.shape:
+            raise ValueError("'valid' must have the shape of 'src'")
+        invalid = np.logical_not(valid)
+        if mask is not np.ma.nomask:
+            invalid |= mask
+        return invalid, True
+    if mask is not np.ma.nomask:
+        return mask, True
+    return _NOMASK3D, False
+
+
+def _get_out_mask(out, src, out_valid):
+    """
+    Get the array into which the kernels write the mask of the invalid cells of *out*, and whether it is needed,
+    i.e. if *src* is a masked array or if *out_valid* is given.
+    """
+    if out_valid is not None:
+        if out_valid.shape != out.shape:
+            raise ValueError("'out_valid' must have the shape of the result")
+    elif not isinstance(src, np.ma.MaskedArray):
+        return _NOMASK3D, False
+    return np.zeros(out.shape, dtype=np.bool_), True
+
+
+def _set_out_mask(out, out_mask, src, fill_value, out_valid):
+    """
+    Apply the mask *out_mask* written by the kernels: place the valid cells into *out_valid* and
+    mask *out* if *src* is a masked array.
+    """
+    if out_valid is not None:
+        np.logical_not(out_mask, out=out_valid)
+    if isinstance(src, np.ma.MaskedArray):
+        if isinstance(out, np.ma.MaskedArray):
+            out.mask = out_mask
+        else:
+            out = np.ma.MaskedArray(out, mask=out_mask, copy=False, fill_value=fill_value)
+    return out
+
+
+def _no_op(src, mask, use_mask, out_valid):
+    """
+    Get the result if *src* needs no resampling.
+    """
+    if out_valid is not None:
+        if out_valid.shape != src.shape:
+            raise ValueError("'out_valid' must have the shape of the result")
+        data = np.ma.getdata(src)
+        if np.issubdtype(data.dtype, np.inexact):
+            np.isfinite(data, out=out_valid)
+        else:
+            out_valid[...] = True
+        if use_mask:
+            out_valid &= np.logical_not(mask)
+    return src
+
+
+def _get_chunk_count(parallel, num_threads):
+    if not parallel:
+        return 1
+    if num_threads is None:
+        return numba.get_num_threads()
+    if num_threads < 1:
+        raise ValueError('num_threads must be >= 1')
+    return int(num_threads)
+
+
+@contextmanager
+def _num_threads(num_threads):
+    """
+    Temporarily set the number of threads used by Numba's parallel loops.
+    Numba cannot use more threads than configured by ``NUMBA_NUM_THREADS``, so *num_threads* is clipped.
+    """
+    if num_threads is None:
+        yield
+        return
+    old_num_threads = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(int(num_threads), numba.config.NUMBA_NUM_THREADS)))
+    try:
+        yield
+    finally:
+        numba.set_num_threads(old_num_threads)
+
+
+def _get_fill_value(fill_value, src, out):
+    if fill_value is None:
+        if isinstance(src, np.ma.MaskedArray):
+            fill_value = src.fill_value
+        elif isinstance(out, np.ma.MaskedArray):
+            fill_value = out.fill_value
+        else:
+            fill_value = _get_default_fill_value(src.dtype)
+    return fill_value
+
+
+def _get_default_fill_value(dtype):
+    # use numpy's default fill_value
+    fill_value = _DEFAULT_FILL_VALUES.get(dtype)
+    if fill_value is None:
+        fill_value = np.ma.array([0], mask=[False], dtype=dtype).fill_value
+        _DEFAULT_FILL_VALUES[dtype] = fill_value
+    return fill_value
+
+
+def _get_ds_axis(src_size, out_size, offset, scale, start=0):
+    """
+    Compute the source cells contributing to each output cell along one axis when downsampling.
+
+    :param src_size: number of source cells
+    :param out_size: number of output cells
+    :param offset: position of the first output cell in units of source cells
+    :param scale: size of an output cell in units of source cells
+    :param start: index of the first output cell, e.g. of a window, whose tables are then identical to the
+        rows *start* to *start + out_size* of the tables of the whole axis
+    :return: tuple (idx, wgt) of (out_size, 2) arrays. *idx* holds the first and last contributing source index,
+        *wgt* holds their contribution weights. Source cells in between have weight one.
+        If output cells line up with source cells, all weights are exactly one. A last source cell covered by
+        less than ``_EPS`` is dropped for all methods, including ``DS_FIRST`` and ``DS_LAST``.
+    """
+    if _is_aligned(offset, scale):
+        # Integer factor, don't let round-off in the transforms introduce tiny edge weights
+        scale = float(round(scale))
+        offset = float(round(offset))
+    src_f0 = offset + scale * np.arange(start, start + out_size, dtype=np.int64)
+    src_f1 = src_f0 + scale
+    src_i0 = src_f0.astype(np.int64)
+    src_i1 = src_f1.astype(np.int64)
+    w0 = 1.0 - (src_f0 - src_i0)
+    w1 = src_f1 - src_i1
+    tiny = w1 < _EPS
+    w1[tiny] = 1.0
+    src_i1[tiny & (src_i1 > src_i0)] -= 1
+    np.minimum(src_i1, src_size - 1, out=src_i1)
+    return np.stack((src_i0, src_i1), axis=-1), np.stack((w0, w1), axis=-1)
+
+
+def _is_aligned(offset, scale):
+    """
+    Test whether output cells line up with source cells, which is the case if and only if all weights computed
+    by :py:func:`_get_ds_axis` are one.
+    """
+    return abs(scale - round(scale)) < _EPS and abs(offset - round(offset)) < _EPS
 
-    if use_transform:
-        src_dx, _, src_xcov0, _, src_dy, src_ycov0 = src_transform
-        out_dx, _, out_xcov0, _, out_dy, out_ycov0 = out_transform
+
+def _get_ds_geometry(src_shape, out_shape, src_transform=None, out_transform=None):
+    """
+    Compute the position of the first output cell and the output cell size in units of source cells
+    as tuple (y_offset, scale_y, x_offset, scale_x).
+    """
+    src_w = src_shape[-1]
+    src_h = src_shape[-2]
+    out_w = out_shape[-1]
+    out_h = out_shape[-2]
+    if src_transform is not None:
+        src_dx, _, src_xcov0, _, src_dy, src_ycov0 = src_transform[:6]
+        out_dx, _, out_xcov0, _, out_dy, out_ycov0 = out_transform[:6]
         scale_x = out_dx / src_dx
         scale_y = out_dy / src_dy
         x_offset = (out_xcov0 - src_xcov0) / src_dx
         y_offset = (out_ycov0 - src_ycov0) / src_dy
     else:
-        if src_w == out_w and src_h == out_h:
-            return src
         if out_w > src_w or out_h > src_h:
             raise ValueError("invalid target size")
         scale_x = src_w / out_w
         scale_y = src_h / out_h
         x_offset = 0.0
         y_offset = 0.0
+    return y_offset, scale_y, x_offset, scale_x
+
+
+def _get_ds_tables(src_shape, out_shape, src_transform=None, out_transform=None):
+    """
+    Compute the per-axis downsampling tables (y_idx, y_wgt, x_idx, x_wgt), see :py:func:`_get_ds_axis`.
+    """
+    y_offset, scale_y, x_offset, scale_x = _get_ds_geometry(src_shape, out_shape, src_transform, out_transform)
+    y_idx, y_wgt = _get_ds_axis(src_shape[-2], out_shape[-2], y_offset, scale_y)
+    x_idx, x_wgt = _get_ds_axis(src_shape[-1], out_shape[-1], x_offset, scale_x)
+    return y_idx, y_wgt, x_idx, x_wgt
+
+
+def _has_unit_weights(y_wgt, x_wgt):
+    """
+    Test whether the downsampling tables describe whole blocks of source cells, e.g. for integer factors.
+    """
+    return bool(np.all(y_wgt == 1.0) and np.all(x_wgt == 1.0))
+
+
+def _get_us_axis(src_size, out_size, method, offset=None, scale=None):
+    """
+    Compute the source cells used to interpolate each output cell along one axis when upsampling.
+
+    :param src_size: number of source cells
+    :param out_size: number of output cells
+    :param method: one of the *US_* constants
+    :param offset: position of the first output cell in units of source cells, optional
+    :param scale: size of an output cell in units of source cells, optional. If *offset* and *scale* are given,
+        the output cells are a window of the grid of this cell size that covers all source cells, and the result
+        equals the corresponding part of the tables of that whole grid.
+    :return: tuple (idx, wgt) of (out_size, 2) arrays. *idx* holds the lower and upper source index,
+        *wgt* holds their interpolation weights.
+    """
+    out_i = np.arange(out_size, dtype=np.int64)
+    if offset is None:
+        full_size = out_size
+        eps = 0.0
+    else:
+        # Global output indices within the grid covering all source cells
+        full_size = src_size / scale
+        out_i = offset / scale + out_i
+        eps = _EPS
+    if method == US_NEAREST:
+        scale = src_size / full_size
+        src_i0 = np.minimum((scale * out_i + eps).astype(np.int64), src_size - 1)
+        src_i1 = src_i0
+        w1 = np.zeros(out_size, dtype=np.float64)
+    elif method == US_LINEAR:
+        scale = (src_size - 1.0) / ((full_size - 1.0) if full_size > 1 else 1.0)
+        src_f = scale * out_i
+        if offset is not None:
+            src_f = np.clip(src_f, 0.0, src_size - 1.0)
+        src_i0 = src_f.astype(np.int64)
+        w1 = src_f - src_i0
+        src_i1 = np.minimum(src_i0 + 1, src_size - 1)
+    else:
+        raise ValueError('invalid upsampling method')
+    return np.stack((src_i0, src_i1), axis=-1), np.stack((1.0 - w1, w1), axis=-1)
+
+
+def _get_us_tables(src_shape, out_shape, method, src_transform=None, out_transform=None):
+    """
+    Compute the per-axis upsampling tables (y_idx, y_wgt, x_idx, x_wgt), see :py:func:`_get_us_axis`.
+    """
+    src_w = src_shape[-1]
+    src_h = src_shape[-2]
+    out_w = out_shape[-1]
+    out_h = out_shape[-2]
+    if src_transform is not None:
+        y_offset, scale_y, x_offset, scale_x = _get_ds_geometry(src_shape, out_shape, src_transform, out_transform)
+        y_idx, y_wgt = _get_us_axis(src_h, out_h, method, y_offset, scale_y)
+        x_idx, x_wgt = _get_us_axis(src_w, out_w, method, x_offset, scale_x)
+        return y_idx, y_wgt, x_idx, x_wgt
+    if out_w < src_w or out_h < src_h:
+        raise ValueError("invalid target size")
+    y_idx, y_wgt = _get_us_axis(src_h, out_h, method)
+    x_idx, x_wgt = _get_us_axis(src_w, out_w, method)
+    return y_idx, y_wgt, x_idx, x_wgt
+
+
+def _get_summed_area_table(values):
+    """
+    Compute the summed-area tables of the stack *values* of shape (n, h, w).
+    The result has shape (n, h + 1, w + 1), its first row and column are zero.
+    """
+    table = np.zeros((values.shape[0], values.shape[1] + 1, values.shape[2] + 1), dtype=np.float64)
+    np.cumsum(values, axis=1, out=table[:, 1:, 1:])
+    np.cumsum(table[:, 1:, 1:], axis=2, out=table[:, 1:, 1:])
+    return table
+
+
+def _get_sat_axis(src_size, out_size, offset, scale):
+    """
+    Compute the positions of the output cell edges along one axis in summed-area table coordinates.
+
+    :return: tuple (idx, frac) of (out_size, 2) arrays holding the integer and fractional parts of the
+        start and end positions of the output cells. Positions are clipped to the source extent and
+        the integer part is less than *src_size*, so that ``idx + 1`` is always a valid table index.
+    """
+    src_f0 = offset + scale * np.arange(out_size, dtype=np.int64)
+    src_f = np.stack((src_f0, src_f0 + scale), axis=-1)
+    np.clip(src_f, 0.0, src_size, out=src_f)
+    src_i = np.minimum(src_f.astype(np.int64), src_size - 1)
+    return src_i, src_f - src_i
+
+
+def _get_cache_key(key):
+    """
+    Hash *key*, a nested tuple of numbers, strings, and arrays, into a file name for :py:class:`WeightCache`.
+    """
+    def normalize(value):
+        if isinstance(value, (tuple, list)):
+            return tuple(normalize(item) for item in value)
+        if isinstance(value, (np.ndarray, np.generic)):
+            return normalize(value.tolist())
+        return value
+
+    return hashlib.sha256(repr((_CACHE_VERSION, normalize(key))).encode('utf-8')).hexdigest()
+
+
+def _get_overlap_matrix(src_shape, out_shape, pixel_transform, n_chunks):
+    """
+    Compute the CSR weight matrix of :py:class:`SparseRegridder` as *dict* of the arrays
+    ``indptr``, ``indices``, and ``weights``.
+    """
+    src_h, src_w = src_shape
+    out_h, out_w = out_shape
+    # Bounding boxes of the output cells in source pixel coordinates give an upper bound of the overlaps
+    corner_x, corner_y = np.meshgrid(np.arange(out_w + 1, dtype=np.float64),
+                                     np.arange(out_h + 1, dtype=np.float64))
+    a, b, c, d, e, f = pixel_transform
+    x_bounds = _get_cell_bounds(a * corner_x + b * corner_y + c, src_w)
+    y_bounds = _get_cell_bounds(d * corner_x + e * corner_y + f, src_h)
+    counts = ((x_bounds[1] - x_bounds[0]) * (y_bounds[1] - y_bounds[0])).reshape((-1,))
+    indptr = np.zeros((counts.shape[0] + 1,), dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.zeros((indptr[-1],), dtype=np.int64)
+    weights = np.zeros((indptr[-1],), dtype=np.float64)
+    get_overlaps = _get_overlaps_parallel if n_chunks > 1 else _get_overlaps
+    get_overlaps(pixel_transform, src_w, out_w, x_bounds[0].reshape((-1,)), x_bounds[1].reshape((-1,)),
+                 y_bounds[0].reshape((-1,)), y_bounds[1].reshape((-1,)), indptr, indices, weights, n_chunks)
+    # Drop the source cells of the bounding boxes that don't overlap, and slivers from round-off
+    keep = weights > _EPS
+    row_counts = np.bincount(np.repeat(np.arange(counts.shape[0]), counts)[keep], minlength=counts.shape[0])
+    indptr = np.zeros((counts.shape[0] + 1,), dtype=np.int64)
+    np.cumsum(row_counts, out=indptr[1:])
+    return dict(indptr=indptr, indices=indices[keep], weights=weights[keep])
+
+
+def _get_pixel_transform(src_transform, out_transform):
+    """
+    Compose the affine transform (a, b, c, d, e, f) that maps output pixel coordinates (x, y) to source pixel
+    coordinates (a * x + b * y + c, d * x + e * y + f).
+    """
+    def to_matrix(transform):
+        dx, xrot, x0, yrot, dy, y0 = np.array(transform[:6], dtype=np.float64)
+        return np.array([[dx, xrot, x0], [yrot, dy, y0], [0.0, 0.0, 1.0]])
+
+    src_matrix = to_matrix(src_transform)
+    out_matrix = to_matrix(out_transform)
+    if src_matrix[0, 0] * src_matrix[1, 1] - src_matrix[0, 1] * src_matrix[1, 0] == 0.0 or \
+            out_matrix[0, 0] * out_matrix[1, 1] - out_matrix[0, 1] * out_matrix[1, 0] == 0.0:
+        raise ValueError("Invalid transform: pixels must have a non-zero area")
+    return np.linalg.solve(src_matrix, out_matrix)[:2].reshape((-1,))
+
+
+def _get_cell_bounds(corners, size):
+    """
+    Compute the ranges [i0, i1) of source pixels along one axis that are touched by each output cell,
+    given the source pixel coordinates of the output cell corners of shape (out_h + 1, out_w + 1).
+    """
+    corners = np.stack((corners[:-1, :-1], corners[:-1, 1:], corners[1:, :-1], corners[1:, 1:]))
+    i0 = np.clip(np.floor(corners.min(axis=0)), 0, size).astype(np.int64)
+    i1 = np.clip(np.ceil(corners.max(axis=0)), 0, size).astype(np.int64)
+    return i0, np.maximum(i0, i1)
+
+
+def _warmup(dtype, methods=None, parallel=False):
+    """
+    Compile the kernels for source grids of data type *dtype*, see :py:func:`gridtools.warmup`.
+    """
+    src = np.arange(64).reshape((8, 8)).astype(dtype)
+    masked_src = np.ma.array(src, mask=np.eye(8, dtype=np.bool_))
+    fill_value = np.nan if np.issubdtype(dtype, np.inexact) else -1.
+    # n_chunks > 1 selects the parallel kernels, even if Numba has a single thread only
+    num_threads = 2 if parallel else None
+    if methods is None:
+        methods = _US_METHODS + _DS_METHODS
+    for s in (src, masked_src):
+        for f in (None, fill_value):
+            for method in methods:
+                if method in _US_METHODS:
+                    upsample_2d(s, 12, 12, method=method, fill_value=f, parallel=parallel, num_threads=num_threads)
+                elif method in _DS_METHODS:
+                    # Fractional weights, and whole blocks for _downsample_blocks()
+                    for w in (3, 4):
+                        downsample_2d(s, w, w, method=method, fill_value=f, parallel=parallel,
+                                      num_threads=num_threads)
+                    if method in (DS_MEAN, DS_VAR, DS_STD):
+                        SummedAreaTable(s).downsample(3, 3, method=method, fill_value=f, parallel=parallel,
+                                                      num_threads=num_threads)
+                else:
+                    raise ValueError('invalid resampling method')
+
+
+def _resample(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out, out_mask, use_out_mask,
+              n_chunks=1, src_transform=None, out_transform=None):
+    """
+    Resample the stack *src* of shape (n, src_h, src_w) into the stack *out* of shape (n, out_h, out_w).
+    """
+    downsample = _downsample_stack
+    upsample = _upsample_stack
+
+    src_w = src.shape[-1]
+    src_h = src.shape[-2]
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+
+    if src_transform is not None:
+        # An axis shrinks if output cells are at least as large as source cells
+        y_offset, scale_y, x_offset, scale_x = _get_ds_geometry(src.shape, out.shape, src_transform, out_transform)
+        shrink_x = scale_x >= 1.0
+        shrink_y = scale_y >= 1.0
+        if shrink_x and shrink_y:
+            return downsample(src, mask, use_mask, ds_method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                              *_get_ds_tables(src.shape, out.shape, src_transform, out_transform), n_chunks)
+        elif shrink_x:
+            ds_idx, ds_wgt = _get_ds_axis(src_w, out_w, x_offset, scale_x)
+            us_idx, us_wgt = _get_us_axis(src_h, out_h, us_method, y_offset, scale_y)
+        elif shrink_y:
+            ds_idx, ds_wgt = _get_ds_axis(src_h, out_h, y_offset, scale_y)
+            us_idx, us_wgt = _get_us_axis(src_w, out_w, us_method, x_offset, scale_x)
+        else:
+            return upsample(src, mask, use_mask, us_method, fill_value, out, out_mask, use_out_mask,
+                            *_get_us_tables(src.shape, out.shape, us_method, src_transform, out_transform), n_chunks)
+        return _resample_fused_stack(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out,
+                                     out_mask, use_out_mask, ds_idx, ds_wgt, us_idx, us_wgt, shrink_x, n_chunks)
+
+    if out_w < src_w and out_h < src_h:
+        return downsample(src, mask, use_mask, ds_method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                          *_get_ds_tables(src.shape, out.shape), n_chunks)
+    elif out_w < src_w:
+        if out_h > src_h:
+            ds_idx, ds_wgt = _get_ds_axis(src_w, out_w, 0.0, src_w / out_w)
+            us_idx, us_wgt = _get_us_axis(src_h, out_h, us_method)
+            return _resample_fused_stack(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out,
+                                         out_mask, use_out_mask, ds_idx, ds_wgt, us_idx, us_wgt, True, n_chunks)
+        else:
+            return downsample(src, mask, use_mask, ds_method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                              *_get_ds_tables(src.shape, out.shape), n_chunks)
+    elif out_h < src_h:
+        if out_w > src_w:
+            ds_idx, ds_wgt = _get_ds_axis(src_h, out_h, 0.0, src_h / out_h)
+            us_idx, us_wgt = _get_us_axis(src_w, out_w, us_method)
+            return _resample_fused_stack(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out,
+                                         out_mask, use_out_mask, ds_idx, ds_wgt, us_idx, us_wgt, False, n_chunks)
+        else:
+            return downsample(src, mask, use_mask, ds_method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                              *_get_ds_tables(src.shape, out.shape), n_chunks)
+    elif out_w > src_w or out_h > src_h:
+        return upsample(src, mask, use_mask, us_method, fill_value, out, out_mask, use_out_mask,
+                        *_get_us_tables(src.shape, out.shape, us_method), n_chunks)
+    return src
+
+
+def _resample_fused_stack(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out, out_mask,
+                          use_out_mask, ds_idx, ds_wgt, us_idx, us_wgt, shrink_x, n_chunks=1):
+    """
+    Resample the stack *src* into the stack *out* if one axis shrinks and the other one grows,
+    see :py:func:`_resample_fused_kernel`. If *shrink_x* is ``True``, x shrinks and y grows, otherwise vice versa.
+    *ds_idx*, *ds_wgt* are the tables of the shrinking axis computed by :py:func:`_get_ds_axis`,
+    *us_idx*, *us_wgt* are the tables of the growing axis computed by :py:func:`_get_us_axis`.
+    """
+    if ds_method not in _DS_METHODS:
+        raise ValueError('invalid downsampling method')
+    if us_method not in _US_KERNELS:
+        raise ValueError('invalid upsampling method')
+    v_min, bin_count = _NO_HISTOGRAM
+    if ds_method == DS_MODE or ds_method == DS_MEDIAN:
+        v_min, bin_count = _get_histogram_range(src) or _NO_HISTOGRAM
+    kernels = _get_fused_kernels(ds_method, us_method, bin_count > 0)
+    resample = kernels[1] if n_chunks > 1 else kernels[0]
+    # The kernel works on contiguous rows
+    src = np.ascontiguousarray(src)
+    mask = np.ascontiguousarray(mask)
+    out_c = np.ascontiguousarray(out)
+    out_mask_c = np.ascontiguousarray(out_mask)
+    resample(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out_c, out_mask_c, use_out_mask,
+             ds_idx, ds_wgt, us_idx, us_wgt, shrink_x, v_min, bin_count, n_chunks)
+    if out_c is not out:
+        out[...] = out_c
+    if out_mask_c is not out_mask:
+        out_mask[...] = out_mask_c
+    return out
+
+
+def _get_fused_kernels(ds_method, us_method, histogram):
+    """
+    Get the (serial, parallel) pair of :py:func:`_resample_fused_kernel` specialized to the serial kernels of
+    *ds_method* and *us_method*, created on first use. If *histogram* is ``True``, DS_MODE and DS_MEDIAN use
+    value histograms, see :py:func:`_get_histogram_range`.
+    """
+    if ds_method == DS_MODE and histogram:
+        downsample = _fused_downsample_mode_histogram
+    elif ds_method == DS_MEDIAN:
+        downsample = _fused_downsample_median_histogram if histogram else _fused_downsample_median
+    else:
+        downsample = _FUSED_DS_KERNELS[_DS_KERNELS[ds_method][0]]
+    upsample = _US_KERNELS[us_method][0]
+    name = '_resample_fused_%s_%s' % (_kernel_name(downsample)[len('_fused_downsample_'):],
+                                      _kernel_name(upsample)[len('_upsample_'):])
+    kernels = _FUSED_KERNELS.get(name)
+    if kernels is None:
+        kernels = _jit_kernels(_bind_globals(_resample_fused_kernel, name,
+                                             _fused_downsample=downsample, _fused_upsample=upsample))
+        _FUSED_KERNELS[name] = kernels
+    return kernels
+
+
+def _upsample_stack(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask, y_idx, y_wgt, x_idx, x_wgt,
+                    n_chunks=1):
+    """
+    Upsample the stack *src* into the stack *out* using the tables computed by :py:func:`_get_us_tables`.
+    """
+    kernels = _US_KERNELS.get(method)
+    if kernels is None:
+        raise ValueError('invalid upsampling method')
+    upsample = kernels[1] if n_chunks > 1 else kernels[0]
+    return upsample(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask, y_idx, y_wgt, x_idx, x_wgt,
+                    n_chunks)
+
+
+def _downsample_stack(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                      y_idx, y_wgt, x_idx, x_wgt, n_chunks=1, unit_weights=None, value_range=None):
+    """
+    Downsample the stack *src* into the stack *out* using the tables computed by :py:func:`_get_ds_tables`.
+    *unit_weights* overrides :py:func:`_has_unit_weights` of the tables, e.g. if they are a subset.
+    *value_range* overrides :py:func:`_get_histogram_range` of *src*, e.g. if it is a strip of a larger grid,
+    :py:data:`_NO_HISTOGRAM` for none.
+    """
+    if unit_weights is None:
+        unit_weights = _has_unit_weights(y_wgt, x_wgt)
+    if (method == DS_MEAN or method == DS_VAR or method == DS_STD) and unit_weights:
+        downsample_blocks = _downsample_blocks_parallel if n_chunks > 1 else _downsample_blocks
+        return downsample_blocks(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask,
+                                 y_idx, x_idx, n_chunks)
+    if method == DS_MEDIAN:
+        return _downsample_quantiles_stack(src, mask, use_mask, fill_value, np.array([0.5]), out[:, np.newaxis],
+                                           out_mask[:, np.newaxis], use_out_mask,
+                                           y_idx, y_wgt, x_idx, x_wgt, n_chunks, value_range=value_range)[:, 0]
+    if method == DS_MODE:
+        if value_range is None:
+            value_range = _get_histogram_range(src) or _NO_HISTOGRAM
+        v_min, bin_count = value_range
+        if bin_count > 0:
+            downsample_mode = _downsample_mode_histogram_parallel if n_chunks > 1 else _downsample_mode_histogram
+            return downsample_mode(src, mask, use_mask, fill_value, mode_rank, out, out_mask, use_out_mask,
+                                   y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, n_chunks)
+    kernels = _DS_KERNELS.get(method)
+    if kernels is None:
+        raise ValueError('invalid downsampling method')
+    downsample = kernels[1] if n_chunks > 1 else kernels[0]
+    return downsample(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                      y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+
+
+def _downsample_quantiles_stack(src, mask, use_mask, fill_value, quantiles, out, out_mask, use_out_mask,
+                                y_idx, y_wgt, x_idx, x_wgt, n_chunks=1, value_range=None):
+    """
+    Downsample the stack *src* into the weighted *quantiles* *out* of shape (n, len(quantiles), h, w),
+    using value histograms for integer grids of a limited value range. *value_range* overrides
+    :py:func:`_get_histogram_range` of *src*, see :py:func:`_downsample_stack`.
+    """
+    if value_range is None:
+        value_range = _get_histogram_range(src) or _NO_HISTOGRAM
+    v_min, bin_count = value_range
+    if bin_count > 0:
+        downsample = _downsample_quantiles_histogram_parallel if n_chunks > 1 else _downsample_quantiles_histogram
+        return downsample(src, mask, use_mask, fill_value, quantiles, out, out_mask, use_out_mask,
+                          y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, n_chunks)
+    downsample = _downsample_quantiles_parallel if n_chunks > 1 else _downsample_quantiles
+    return downsample(src, mask, use_mask, fill_value, quantiles, out, out_mask, use_out_mask,
+                      y_idx, y_wgt, x_idx, x_wgt, n_chunks)
+
+
+def _get_histogram_range(src, max_rows=None):
+    """
+    Get the tuple (v_min, bin_count) of value histograms of the integer grid *src*,
+    or None, if *src* isn't an integer grid or its value range exceeds :py:data:`_MAX_HISTOGRAM_BINS`.
+    If *max_rows* is given, the 2-D array-like *src* is read in strips of as many rows, see
+    :py:func:`downsample_tiled_2d`.
+    """
+    if not np.issubdtype(src.dtype, np.integer) or 0 in src.shape:
+        return None
+    if max_rows is None:
+        v_min = int(src.min())
+        v_max = int(src.max())
+    else:
+        v_min = v_max = int(src[0, 0])
+        for y0 in range(0, src.shape[-2], max_rows):
+            strip = np.asarray(src[y0:y0 + max_rows])
+            v_min = min(v_min, int(strip.min()))
+            v_max = max(v_max, int(strip.max()))
+    bin_count = v_max - v_min + 1
+    if bin_count > _MAX_HISTOGRAM_BINS:
+        return None
+    return v_min, bin_count
+
+
+def _downsample_classes_2d(src, valid, fill_value, modes, weights, classes, fractions, src_transform, out_transform,
+                           parallel, num_threads):
+    """
+    Compute top-k modes and class fractions of the 2-D integer grid *src*, see :py:func:`_downsample_classes_kernel`.
+    """
+    out_shape = fractions.shape[-2:]
+    src_transform, out_transform = _get_ds_transforms(src_transform, out_transform, src.shape, out_shape)
+    y_idx, y_wgt, x_idx, x_wgt = _get_ds_tables(src.shape, out_shape, src_transform, out_transform)
+    value_range = _get_histogram_range(np.ma.getdata(src))
+    if value_range is None:
+        raise ValueError("'src' must be of an integer type whose value range spans at most %d values"
+                         % _MAX_HISTOGRAM_BINS)
+    v_min, bin_count = value_range
+    class_bins = classes - v_min
+    class_bins[(class_bins < 0) | (class_bins >= bin_count)] = -1
+    mask, use_mask = _get_mask(src, valid)
+    n_chunks = _get_chunk_count(parallel, num_threads)
+    downsample_classes = _downsample_classes_parallel if n_chunks > 1 else _downsample_classes
+    with _num_threads(num_threads if parallel else None):
+        downsample_classes(_as_stack(src), _as_stack(mask), use_mask, fill_value, modes[np.newaxis],
+                           weights[np.newaxis], class_bins, fractions[np.newaxis], y_idx, y_wgt, x_idx, x_wgt,
+                           v_min, bin_count, n_chunks)
+
+
+def _jit_kernels(func):
+    """
+    JIT-compile *func* twice: as a serial kernel and as a kernel whose ``prange`` loops run in parallel.
+    Compiling with ``parallel=True`` is considerably slower, so serial callers don't pay for it.
+
+    Both are cached on disk. Numba names cache files after the function's qualified name and doesn't key
+    them by compiler flags, so the parallel kernel is compiled from a renamed copy of *func*.
+    """
+    parallel_func = FunctionType(func.__code__, func.__globals__, func.__name__ + '_parallel',
+                                 func.__defaults__, func.__closure__)
+    parallel_func.__qualname__ = func.__qualname__ + '_parallel'
+    return jit(nopython=True, cache=True)(func), jit(nopython=True, parallel=True, cache=True)(parallel_func)
+
+
+def _bind_globals(func, name, **bound):
+    """
+    Copy *func* as a function named *name* whose global names in *bound* refer to the given objects instead,
+    e.g. to specialize a kernel template to the kernels it calls. The name keeps Numba's disk caches of
+    copies apart, see :py:func:`_jit_kernels`.
+    """
+    func_globals = dict(func.__globals__)
+    func_globals.update(bound)
+    bound_func = FunctionType(func.__code__, func_globals, name, func.__defaults__, func.__closure__)
+    bound_func.__qualname__ = name
+    return bound_func
+
 
-    if method == DS_FIRST or method == DS_LAST:
-        for out_y in range(out_h):
-            src_yf0 = y_offset + scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            if src_y1 == src_yf1 and src_y1 > src_y0:
-                src_y1 -= 1
+def _kernel_name(kernel):
+    """
+    Get the name of the Python function of the JIT-compiled *kernel*, less a ``_kernel`` suffix.
+    """
+    name = getattr(kernel, 'py_func', kernel).__name__
+    return name[:-len('_kernel')] if name.endswith('_kernel') else name
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# The upsampling kernels all have the same signature, see _US_KERNELS. src and out are stacks of 2-D grids
+# of shape (n, h, w). The source cells of the output rows and columns are given by the tables computed by
+# _get_us_tables(). Unused arguments are ignored.
+#
+# The n * out_h output rows are split into n_chunks contiguous chunks which are processed in parallel
+# by the *_parallel variants. n_chunks=1 yields the serial computation.
+#
+# US_NEAREST
+#
+def _upsample_nearest_kernel(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask,
+                             y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y = y_idx[out_y, 0]
             for out_x in range(out_w):
-                src_xf0 = x_offset + scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                if src_x1 == src_xf1 and src_x1 > src_x0:
-                    src_x1 -= 1
+                src_x = x_idx[out_x, 0]
+                value = src[i, src_y, src_x]
+                ok = np.isfinite(value) and not (use_mask and mask[i, src_y, src_x])
+                if ok:
+                    out[i, out_y, out_x] = value
+                else:
+                    out[i, out_y, out_x] = fill_value
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = not ok
+
+    return out
+
+
+_upsample_nearest, _upsample_nearest_parallel = _jit_kernels(_upsample_nearest_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# US_LINEAR, see _upsample_nearest_kernel()
+#
+def _upsample_linear_kernel(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask,
+                            y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy = y_wgt[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                wx = x_wgt[out_x, 1]
+                v00 = src[i, src_y0, src_x0]
+                v01 = src[i, src_y0, src_x1]
+                v10 = src[i, src_y1, src_x0]
+                v11 = src[i, src_y1, src_x1]
+                if use_mask:
+                    v00_ok = np.isfinite(v00) and not mask[i, src_y0, src_x0]
+                    v01_ok = np.isfinite(v01) and not mask[i, src_y0, src_x1]
+                    v10_ok = np.isfinite(v10) and not mask[i, src_y1, src_x0]
+                    v11_ok = np.isfinite(v11) and not mask[i, src_y1, src_x1]
+                else:
+                    v00_ok = np.isfinite(v00)
+                    v01_ok = np.isfinite(v01)
+                    v10_ok = np.isfinite(v10)
+                    v11_ok = np.isfinite(v11)
+                if v00_ok and v01_ok and v10_ok and v11_ok:
+                    ok = True
+                    v0 = v00 + wx * (v01 - v00)
+                    v1 = v10 + wx * (v11 - v10)
+                    value = v0 + wy * (v1 - v0)
+                elif wx < 0.5:
+                    # NEAREST according to weight
+                    if wy < 0.5:
+                        ok = v00_ok
+                        value = v00
+                    else:
+                        ok = v10_ok
+                        value = v10
+                else:
+                    # NEAREST according to weight
+                    if wy < 0.5:
+                        ok = v01_ok
+                        value = v01
+                    else:
+                        ok = v11_ok
+                        value = v11
+                if ok:
+                    out[i, out_y, out_x] = value
+                else:
+                    out[i, out_y, out_x] = fill_value
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = not ok
+
+    return out
+
+
+_upsample_linear, _upsample_linear_parallel = _jit_kernels(_upsample_linear_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# The downsampling kernels all have the same signature, see _DS_KERNELS. src and out are stacks of 2-D grids
+# of shape (n, h, w). The source cells of the output rows and columns are given by the tables computed by
+# _get_ds_tables(). Unused arguments are ignored.
+#
+# The n * out_h output rows are split into n_chunks contiguous chunks which are processed in parallel
+# by the *_parallel variants. n_chunks=1 yields the serial computation.
+#
+# DS_FIRST and DS_LAST
+#
+def _downsample_first_last_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                                  y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
                 done = False
+                found = False
                 value = fill_value
                 for src_y in range(src_y0, src_y1 + 1):
                     for src_x in range(src_x0, src_x1 + 1):
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
                             value = v
+                            found = True
                             if method == DS_FIRST:
                                 done = True
                                 break
                     if done:
                         break
-                out[out_y, out_x] = value
-
-    elif method == DS_MODE:
-        max_value_count = int(scale_x + 1) * int(scale_y + 1)
-        values = np.zeros((max_value_count,), dtype=src.dtype)
-        frequencies = np.zeros((max_value_count,), dtype=np.uint32)
-        for out_y in range(out_h):
-            src_yf0 = y_offset + scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
+                out[i, out_y, out_x] = value
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = not found
+
+    return out
+
+
+_downsample_first_last, _downsample_first_last_parallel = _jit_kernels(_downsample_first_last_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# DS_MIN and DS_MAX, see _downsample_first_last_kernel()
+#
+def _downsample_min_max_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                               y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                found = False
+                value = src[i, src_y0, src_x0]
+                for src_y in range(src_y0, src_y1 + 1):
+                    for src_x in range(src_x0, src_x1 + 1):
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
+                            if not found or (v < value if method == DS_MIN else v > value):
+                                value = v
+                                found = True
+                if found:
+                    out[i, out_y, out_x] = value
+                else:
+                    out[i, out_y, out_x] = fill_value
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = not found
+
+    return out
+
+
+_downsample_min_max, _downsample_min_max_parallel = _jit_kernels(_downsample_min_max_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# DS_MODE, see _downsample_first_last_kernel()
+#
+def _downsample_mode_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                            y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    max_value_count = 0
+    for out_y in range(out_h):
+        for out_x in range(out_w):
+            value_count = (y_idx[out_y, 1] - y_idx[out_y, 0] + 1) * (x_idx[out_x, 1] - x_idx[out_x, 0] + 1)
+            if value_count > max_value_count:
+                max_value_count = value_count
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    values = np.zeros((n_chunks, max_value_count), dtype=src.dtype)
+    frequencies = np.zeros((n_chunks, max_value_count), dtype=np.float64)
+    max_frequencies = np.zeros((n_chunks, mode_rank), dtype=np.float64)
+    indices = np.zeros((n_chunks, mode_rank), dtype=np.int64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy0 = y_wgt[out_y, 0]
+            wy1 = y_wgt[out_y, 1]
             for out_x in range(out_w):
-                src_xf0 = x_offset + scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                wx0 = x_wgt[out_x, 0]
+                wx1 = x_wgt[out_x, 1]
                 value_count = 0
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
                     for src_x in range(src_x0, src_x1 + 1):
                         wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = float(src[i, src_y, src_x])
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
                             w = wx * wy
                             found = False
-                            for i in range(value_count):
-                                if v == values[i]:
-                                    frequencies[i] += w
+                            for k in range(value_count):
+                                if v == values[chunk, k]:
+                                    frequencies[chunk, k] += w
                                     found = True
                                     break
                             if not found:
-                                values[value_count] = v
-                                frequencies[value_count] = w
+                                values[chunk, value_count] = v
+                                frequencies[chunk, value_count] = w
                                 value_count += 1
                 w_max = -1.
                 value = fill_value
                 if mode_rank == 1:
-                    for i in range(value_count):
-                        w = frequencies[i]
+                    for k in range(value_count):
+                        w = frequencies[chunk, k]
                         if w > w_max:
                             w_max = w
-                            value = values[i]
-                elif mode_rank <= max_value_count:
-                    max_frequencies = np.full(mode_rank, -1.0, dtype=np.float64)
-                    indices = np.zeros(mode_rank, dtype=np.int64)
-                    for i in range(value_count):
-                        w = frequencies[i]
-                        for j in range(mode_rank):
-                            if w > max_frequencies[j]:
-                                max_frequencies[j] = w
-                                indices[j] = i
-                                break
-                    value = values[indices[mode_rank - 1]]
-
-                out[out_y, out_x] = value
-
-    elif method == DS_MEAN:
-        for out_y in range(out_h):
-            src_yf0 = y_offset + scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
+                            value = values[chunk, k]
+                elif mode_rank <= value_count:
+                    # Insertion into the top-k, see _rank_bins()
+                    n = 0
+                    for k in range(value_count):
+                        w = frequencies[chunk, k]
+                        if n < mode_rank:
+                            pos = n
+                            n += 1
+                        elif w > max_frequencies[chunk, mode_rank - 1]:
+                            pos = mode_rank - 1
+                        else:
+                            continue
+                        while pos > 0 and max_frequencies[chunk, pos - 1] < w:
+                            max_frequencies[chunk, pos] = max_frequencies[chunk, pos - 1]
+                            indices[chunk, pos] = indices[chunk, pos - 1]
+                            pos -= 1
+                        max_frequencies[chunk, pos] = w
+                        indices[chunk, pos] = k
+                    value = values[chunk, indices[chunk, mode_rank - 1]]
+
+                out[i, out_y, out_x] = value
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = value_count < mode_rank
+
+    return out
+
+
+_downsample_mode, _downsample_mode_parallel = _jit_kernels(_downsample_mode_kernel)
+
+
+@jit(nopython=True, cache=True)
+def _accumulate_histogram(src, mask, use_mask, i, out_y, out_x, y_idx, y_wgt, x_idx, x_wgt, v_min, hist, touched):
+    """
+    Accumulate the weights of the valid source cells of target cell (*out_y*, *out_x*) of grid *i* in the
+    value histogram *hist*, indexed by value - *v_min*. Bins are appended to *touched* when first hit.
+    Return the tuple (number of touched bins, sum of weights).
+    """
+    src_y0 = y_idx[out_y, 0]
+    src_y1 = y_idx[out_y, 1]
+    wy0 = y_wgt[out_y, 0]
+    wy1 = y_wgt[out_y, 1]
+    src_x0 = x_idx[out_x, 0]
+    src_x1 = x_idx[out_x, 1]
+    wx0 = x_wgt[out_x, 0]
+    wx1 = x_wgt[out_x, 1]
+    touched_count = 0
+    w_sum = 0.0
+    for src_y in range(src_y0, src_y1 + 1):
+        wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
+        for src_x in range(src_x0, src_x1 + 1):
+            if use_mask and mask[i, src_y, src_x]:
+                continue
+            wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
+            b = np.int64(src[i, src_y, src_x]) - v_min
+            if hist[b] == 0.0:
+                touched[touched_count] = b
+                touched_count += 1
+            w = wx * wy
+            hist[b] += w
+            w_sum += w
+    return touched_count, w_sum
+
+
+@jit(nopython=True, cache=True)
+def _rank_bins(hist, bins, bin_count, k, top_bins, top_weights):
+    """
+    Find the *k* bins of highest weight *hist[bin]* among the first *bin_count* entries of *bins*.
+    Of bins with equal weights, those listed first in *bins* rank higher.
+    The bins are written to *top_bins* in decreasing order of weight, their weights to *top_weights*.
+    Return the number of bins found, min(k, bin_count).
+    """
+    n = 0
+    for j in range(bin_count):
+        b = bins[j]
+        w = hist[b]
+        if n < k:
+            pos = n
+            n += 1
+        elif w > top_weights[k - 1]:
+            pos = k - 1
+        else:
+            continue
+        while pos > 0 and top_weights[pos - 1] < w:
+            top_weights[pos] = top_weights[pos - 1]
+            top_bins[pos] = top_bins[pos - 1]
+            pos -= 1
+        top_weights[pos] = w
+        top_bins[pos] = b
+    return n
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# DS_MODE for integer grids whose values lie in the range v_min to v_min + bin_count - 1.
+# Weights are accumulated in a dense histogram per chunk, indexed by value - v_min, so that the cost
+# per output cell is linear in the number of contributing source cells. Bins are listed in the order they
+# are first touched, so that they can be ranked and reset without scanning the whole histogram.
+#
+def _downsample_mode_histogram_kernel(src, mask, use_mask, fill_value, mode_rank, out, out_mask, use_out_mask,
+                                      y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    max_value_count = 0
+    for out_y in range(out_h):
+        for out_x in range(out_w):
+            value_count = (y_idx[out_y, 1] - y_idx[out_y, 0] + 1) * (x_idx[out_x, 1] - x_idx[out_x, 0] + 1)
+            if value_count > max_value_count:
+                max_value_count = value_count
+    max_value_count = min(max_value_count, bin_count)
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    hist = np.zeros((n_chunks, bin_count), dtype=np.float64)
+    touched = np.zeros((n_chunks, max_value_count), dtype=np.int64)
+    top_bins = np.zeros((n_chunks, mode_rank), dtype=np.int64)
+    top_weights = np.zeros((n_chunks, mode_rank), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
             for out_x in range(out_w):
-                src_xf0 = x_offset + scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
-                v_sum = 0.0
+                touched_count, _ = _accumulate_histogram(src, mask, use_mask, i, out_y, out_x, y_idx, y_wgt,
+                                                         x_idx, x_wgt, v_min, hist[chunk], touched[chunk])
+                n = _rank_bins(hist[chunk], touched[chunk], touched_count, mode_rank,
+                               top_bins[chunk], top_weights[chunk])
+                if n < mode_rank:
+                    out[i, out_y, out_x] = fill_value
+                else:
+                    out[i, out_y, out_x] = v_min + top_bins[chunk, mode_rank - 1]
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = n < mode_rank
+                for j in range(touched_count):
+                    hist[chunk, touched[chunk, j]] = 0.0
+
+    return out
+
+
+_downsample_mode_histogram, _downsample_mode_histogram_parallel = _jit_kernels(_downsample_mode_histogram_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Top-k modes and class fractions of integer grids in a single pass, using the value histograms of
+# _downsample_mode_histogram_kernel(). modes and weights are of shape (n, k, out_h, out_w), fractions is of
+# shape (n, class_count, out_h, out_w). class_bins holds the histogram bin of each class, or -1 for classes
+# outside the value range. k and class_count may be zero.
+#
+def _downsample_classes_kernel(src, mask, use_mask, fill_value, modes, weights, class_bins, fractions,
+                               y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, n_chunks):
+    out_w = fractions.shape[-1]
+    out_h = fractions.shape[-2]
+    row_count = src.shape[0] * out_h
+    k = modes.shape[1]
+    class_count = class_bins.shape[0]
+
+    max_value_count = 0
+    for out_y in range(out_h):
+        for out_x in range(out_w):
+            value_count = (y_idx[out_y, 1] - y_idx[out_y, 0] + 1) * (x_idx[out_x, 1] - x_idx[out_x, 0] + 1)
+            if value_count > max_value_count:
+                max_value_count = value_count
+    max_value_count = min(max_value_count, bin_count)
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    hist = np.zeros((n_chunks, bin_count), dtype=np.float64)
+    touched = np.zeros((n_chunks, max_value_count), dtype=np.int64)
+    top_bins = np.zeros((n_chunks, max(k, 1)), dtype=np.int64)
+    top_weights = np.zeros((n_chunks, max(k, 1)), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            for out_x in range(out_w):
+                touched_count, w_sum = _accumulate_histogram(src, mask, use_mask, i, out_y, out_x, y_idx, y_wgt,
+                                                             x_idx, x_wgt, v_min, hist[chunk], touched[chunk])
+                if k > 0:
+                    n = _rank_bins(hist[chunk], touched[chunk], touched_count, k, top_bins[chunk], top_weights[chunk])
+                    for r in range(k):
+                        if r < n:
+                            modes[i, r, out_y, out_x] = v_min + top_bins[chunk, r]
+                            weights[i, r, out_y, out_x] = top_weights[chunk, r] / w_sum
+                        else:
+                            modes[i, r, out_y, out_x] = fill_value
+                            weights[i, r, out_y, out_x] = 0.0
+                for c in range(class_count):
+                    b = class_bins[c]
+                    if w_sum == 0.0:
+                        fractions[i, c, out_y, out_x] = np.nan
+                    elif b >= 0:
+                        fractions[i, c, out_y, out_x] = hist[chunk, b] / w_sum
+                    else:
+                        fractions[i, c, out_y, out_x] = 0.0
+                for j in range(touched_count):
+                    hist[chunk, touched[chunk, j]] = 0.0
+
+    return modes, weights, fractions
+
+
+_downsample_classes, _downsample_classes_parallel = _jit_kernels(_downsample_classes_kernel)
+
+
+@jit(nopython=True, cache=True)
+def _weighted_select(values, weights, count, target):
+    """
+    Find the smallest of the first *count* *values* for which the *weights* of all values less than or equal to it
+    add up to at least *target*, or the largest value, if the weights never reach *target*.
+    Values and weights are reordered in place. The expected cost is linear in *count*: the range holding the result
+    is narrowed by three-way partitioning around median-of-three pivots, as in quickselect.
+    """
+    lo = 0
+    hi = count
+    w_below = 0.0
+    while hi - lo > _SELECT_SORT_SIZE:
+        a = values[lo]
+        b = values[(lo + hi) // 2]
+        c = values[hi - 1]
+        pivot = max(min(a, b), min(max(a, b), c))
+        # Partition into values[lo:lt] < pivot, values[lt:gt] == pivot, values[gt:hi] > pivot
+        lt = lo
+        gt = hi
+        j = lo
+        w_lt = 0.0
+        w_eq = 0.0
+        while j < gt:
+            v = values[j]
+            w = weights[j]
+            if v < pivot:
+                w_lt += w
+                values[j] = values[lt]
+                weights[j] = weights[lt]
+                values[lt] = v
+                weights[lt] = w
+                lt += 1
+                j += 1
+            elif v > pivot:
+                gt -= 1
+                values[j] = values[gt]
+                weights[j] = weights[gt]
+                values[gt] = v
+                weights[gt] = w
+            else:
+                w_eq += w
+                j += 1
+        if lt > lo and w_below + w_lt >= target:
+            hi = lt
+        elif gt == hi or w_below + w_lt + w_eq >= target:
+            return pivot
+        else:
+            w_below += w_lt + w_eq
+            lo = gt
+    for j in range(lo + 1, hi):
+        v = values[j]
+        w = weights[j]
+        k = j - 1
+        while k >= lo and values[k] > v:
+            values[k + 1] = values[k]
+            weights[k + 1] = weights[k]
+            k -= 1
+        values[k + 1] = v
+        weights[k + 1] = w
+    for j in range(lo, hi):
+        w_below += weights[j]
+        if w_below >= target:
+            return values[j]
+    return values[hi - 1]
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Weighted quantiles, see downsample_quantiles_2d(). out is of shape (n, len(quantiles), out_h, out_w).
+# The valid values of a target cell and their weights are gathered in scratch buffers, one per chunk, from which
+# each quantile is found by _weighted_select(). Targets are lowered by a relative _EPS, so that round-off in the
+# weights doesn't skip values whose cumulated weight is exactly on the quantile.
+#
+def _downsample_quantiles_kernel(src, mask, use_mask, fill_value, quantiles, out, out_mask, use_out_mask,
+                                 y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+    q_count = quantiles.shape[0]
+
+    max_value_count = 0
+    for out_y in range(out_h):
+        for out_x in range(out_w):
+            value_count = (y_idx[out_y, 1] - y_idx[out_y, 0] + 1) * (x_idx[out_x, 1] - x_idx[out_x, 0] + 1)
+            if value_count > max_value_count:
+                max_value_count = value_count
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    values = np.zeros((n_chunks, max_value_count), dtype=np.float64)
+    weights = np.zeros((n_chunks, max_value_count), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy0 = y_wgt[out_y, 0]
+            wy1 = y_wgt[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                wx0 = x_wgt[out_x, 0]
+                wx1 = x_wgt[out_x, 1]
+                value_count = 0
+                w_sum = 0.0
+                for src_y in range(src_y0, src_y1 + 1):
+                    wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
+                    for src_x in range(src_x0, src_x1 + 1):
+                        wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
+                            w = wx * wy
+                            values[chunk, value_count] = v
+                            weights[chunk, value_count] = w
+                            value_count += 1
+                            w_sum += w
+                for q in range(q_count):
+                    if value_count == 0:
+                        out[i, q, out_y, out_x] = fill_value
+                    else:
+                        target = quantiles[q] * w_sum * (1.0 - _EPS)
+                        out[i, q, out_y, out_x] = _weighted_select(values[chunk], weights[chunk], value_count,
+                                                                   target)
+                    if use_out_mask:
+                        out_mask[i, q, out_y, out_x] = value_count == 0
+
+    return out
+
+
+_downsample_quantiles, _downsample_quantiles_parallel = _jit_kernels(_downsample_quantiles_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Weighted quantiles of integer grids, using the value histograms of _downsample_mode_histogram_kernel().
+# If the touched bins span a narrow value range, the quantiles are found by cumulating the histogram over that
+# range, otherwise by _weighted_select() on the touched bins, so that the cost per output cell stays linear
+# in the number of contributing source cells.
+#
+def _downsample_quantiles_histogram_kernel(src, mask, use_mask, fill_value, quantiles, out, out_mask, use_out_mask,
+                                           y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+    q_count = quantiles.shape[0]
+
+    max_value_count = 0
+    for out_y in range(out_h):
+        for out_x in range(out_w):
+            value_count = (y_idx[out_y, 1] - y_idx[out_y, 0] + 1) * (x_idx[out_x, 1] - x_idx[out_x, 0] + 1)
+            if value_count > max_value_count:
+                max_value_count = value_count
+    max_value_count = min(max_value_count, bin_count)
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    hist = np.zeros((n_chunks, bin_count), dtype=np.float64)
+    touched = np.zeros((n_chunks, max_value_count), dtype=np.int64)
+    bins = np.zeros((n_chunks, max_value_count), dtype=np.float64)
+    weights = np.zeros((n_chunks, max_value_count), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            for out_x in range(out_w):
+                touched_count, w_sum = _accumulate_histogram(src, mask, use_mask, i, out_y, out_x, y_idx, y_wgt,
+                                                             x_idx, x_wgt, v_min, hist[chunk], touched[chunk])
+                for q in range(q_count):
+                    if use_out_mask:
+                        out_mask[i, q, out_y, out_x] = touched_count == 0
+                    if touched_count == 0:
+                        out[i, q, out_y, out_x] = fill_value
+                if touched_count == 0:
+                    continue
+                b_min = touched[chunk, 0]
+                b_max = touched[chunk, 0]
+                for j in range(1, touched_count):
+                    b_min = min(b_min, touched[chunk, j])
+                    b_max = max(b_max, touched[chunk, j])
+                dense = b_max - b_min < 4 * touched_count + 64
+                if not dense:
+                    for j in range(touched_count):
+                        bins[chunk, j] = touched[chunk, j]
+                        weights[chunk, j] = hist[chunk, touched[chunk, j]]
+                for q in range(q_count):
+                    target = quantiles[q] * w_sum * (1.0 - _EPS)
+                    if dense:
+                        b = b_min
+                        w_below = hist[chunk, b]
+                        while w_below < target and b < b_max:
+                            b += 1
+                            w_below += hist[chunk, b]
+                    else:
+                        b = np.int64(_weighted_select(bins[chunk], weights[chunk], touched_count, target))
+                    out[i, q, out_y, out_x] = v_min + b
+                for j in range(touched_count):
+                    hist[chunk, touched[chunk, j]] = 0.0
+
+    return out
+
+
+_downsample_quantiles_histogram, _downsample_quantiles_histogram_parallel = \
+    _jit_kernels(_downsample_quantiles_histogram_kernel)
+
+# Placeholders for the kernels called by the templates below, replaced in their copies by _bind_globals()
+_downsample_kernel = _fused_downsample = _fused_upsample = None
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# The downsampling step of _resample_fused_kernel(). The fused kernel calls its downsampling step with the
+# signature of the _DS_KERNELS, less n_chunks and plus the histogram range v_min, bin_count of integer grids.
+# This template is specialized to each kernel of _DS_KERNELS by binding the name _downsample_kernel,
+# see _FUSED_DS_KERNELS.
+#
+def _fused_downsample_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                             y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count):
+    _downsample_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                       y_idx, y_wgt, x_idx, x_wgt, 1)
+
+
+@jit(nopython=True, cache=True)
+def _fused_downsample_mode_histogram(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask,
+                                     use_out_mask, y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count):
+    """
+    The downsampling step of :py:func:`_resample_fused_kernel` for DS_MODE of integer grids.
+    """
+    _downsample_mode_histogram(src, mask, use_mask, fill_value, mode_rank, out, out_mask, use_out_mask,
+                               y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, 1)
+
+
+@jit(nopython=True, cache=True)
+def _fused_downsample_median(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                             y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count):
+    """
+    The downsampling step of :py:func:`_resample_fused_kernel` for DS_MEDIAN.
+    """
+    _downsample_quantiles(src, mask, use_mask, fill_value, np.full(1, 0.5),
+                          out.reshape((out.shape[0], 1, out.shape[1], out.shape[2])),
+                          out_mask.reshape((out_mask.shape[0], 1, out_mask.shape[1], out_mask.shape[2])),
+                          use_out_mask, y_idx, y_wgt, x_idx, x_wgt, 1)
+
+
+@jit(nopython=True, cache=True)
+def _fused_downsample_median_histogram(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask,
+                                       use_out_mask, y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count):
+    """
+    The downsampling step of :py:func:`_resample_fused_kernel` for DS_MEDIAN of integer grids.
+    """
+    _downsample_quantiles_histogram(src, mask, use_mask, fill_value, np.full(1, 0.5),
+                                    out.reshape((out.shape[0], 1, out.shape[1], out.shape[2])),
+                                    out_mask.reshape((out_mask.shape[0], 1, out_mask.shape[1], out_mask.shape[2])),
+                                    use_out_mask, y_idx, y_wgt, x_idx, x_wgt, v_min, bin_count, 1)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Resampling where one axis shrinks and the other one grows, e.g. from (src_h, src_w) to (2 * src_h, src_w // 2).
+# Source cells are aggregated along the shrinking axis, using the tables ds_idx and ds_wgt of _get_ds_axis(),
+# and the aggregates are interpolated along the growing axis, using the tables us_idx and us_wgt of
+# _get_us_axis(). Each chunk holds just the aggregated rows it currently needs:
+#
+# - shrink_x: output row out_y interpolates the source rows us_idx[out_y], which are aggregated along x into
+#   the two row buffers of the chunk. Consecutive output rows mostly share their source rows, so each source row
+#   is aggregated about once.
+# - otherwise: output row out_y aggregates the source rows ds_idx[out_y] into one row buffer of the chunk,
+#   which is interpolated along x.
+#
+# Aggregates without valid source cells are fill_value, and they are masked for the interpolation, whether or not
+# use_mask is true. v_min and bin_count are the histogram range of integer grids, see _get_histogram_range().
+#
+# This is a template: the steps call the serial kernels bound to the names _fused_downsample and _fused_upsample,
+# see _get_fused_kernels(), so that just the kernels of the methods in use are compiled.
+#
+def _resample_fused_kernel(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out, out_mask,
+                           use_out_mask, ds_idx, ds_wgt, us_idx, us_wgt, shrink_x, v_min, bin_count, n_chunks):
+    src_w = src.shape[-1]
+    src_h = src.shape[-2]
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+    buffer_w = out_w if shrink_x else src_w
+
+    # Tables of the axis that isn't resampled in either step
+    unit_idx = np.zeros((1, 2), dtype=np.int64)
+    unit_wgt = np.ones((1, 2), dtype=np.float64)
+    ds_same_idx = np.empty((buffer_w, 2), dtype=np.int64)
+    us_same_wgt = np.empty((out_w, 2), dtype=np.float64)
+    for k in range(buffer_w):
+        ds_same_idx[k, 0] = k
+        ds_same_idx[k, 1] = k
+    ds_same_wgt = np.ones((buffer_w, 2), dtype=np.float64)
+    for k in range(out_w):
+        us_same_wgt[k, 0] = 1.0
+        us_same_wgt[k, 1] = 0.0
+    # Scratch buffers, one per chunk, so that parallel chunks don't share them
+    rows = np.zeros((n_chunks, 2, buffer_w), dtype=src.dtype)
+    rows_mask = np.zeros((n_chunks, 2, buffer_w), dtype=np.bool_)
+    # Grid and source row of the aggregates in the row buffers, -1 for none
+    rows_id = np.full((n_chunks, 2), -1, dtype=np.int64)
+    row_idx = np.zeros((n_chunks, 1, 2), dtype=np.int64)
+    row_wgt = np.zeros((n_chunks, 1, 2), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            out_row = out[i, out_y].reshape((1, 1, out_w))
+            out_mask_row = out_mask[i, out_y].reshape((1, 1, out_w)) if use_out_mask else out_mask
+            if shrink_x:
+                for j in range(2):
+                    src_y = us_idx[out_y, j]
+                    row_id = i * src_h + src_y
+                    if rows_id[chunk, 0] == row_id:
+                        slot = 0
+                    elif rows_id[chunk, 1] == row_id:
+                        slot = 1
+                    else:
+                        # Don't overwrite the other source row of this output row
+                        if j == 0:
+                            slot = 1 if rows_id[chunk, 0] == i * src_h + us_idx[out_y, 1] else 0
+                        else:
+                            slot = 1 - row_idx[chunk, 0, 0]
+                        src_row = src[i, src_y].reshape((1, 1, src_w))
+                        src_mask = mask[i, src_y].reshape((1, 1, src_w)) if use_mask else mask
+                        _fused_downsample(src_row, src_mask, use_mask, ds_method, fill_value, mode_rank,
+                                          rows[chunk, slot].reshape((1, 1, out_w)),
+                                          rows_mask[chunk, slot].reshape((1, 1, out_w)), True,
+                                          unit_idx, unit_wgt, ds_idx, ds_wgt, v_min, bin_count)
+                        rows_id[chunk, slot] = row_id
+                    row_idx[chunk, 0, j] = slot
+                    row_wgt[chunk, 0, j] = us_wgt[out_y, j]
+                _fused_upsample(rows[chunk].reshape((1, 2, out_w)), rows_mask[chunk].reshape((1, 2, out_w)),
+                                True, us_method, fill_value, out_row, out_mask_row, use_out_mask,
+                                row_idx[chunk], row_wgt[chunk], ds_same_idx, us_same_wgt, 1)
+            else:
+                src_y0 = ds_idx[out_y, 0]
+                src_y1 = ds_idx[out_y, 1]
+                row_idx[chunk, 0, 0] = 0
+                row_idx[chunk, 0, 1] = src_y1 - src_y0
+                row_wgt[chunk, 0, 0] = ds_wgt[out_y, 0]
+                row_wgt[chunk, 0, 1] = ds_wgt[out_y, 1]
+                src_rows = src[i, src_y0:src_y1 + 1].reshape((1, src_y1 - src_y0 + 1, src_w))
+                src_mask = mask[i, src_y0:src_y1 + 1].reshape((1, src_y1 - src_y0 + 1, src_w)) \
+                    if use_mask else mask
+                _fused_downsample(src_rows, src_mask, use_mask, ds_method, fill_value, mode_rank,
+                                  rows[chunk, 0].reshape((1, 1, src_w)), rows_mask[chunk, 0].reshape((1, 1, src_w)),
+                                  True, row_idx[chunk], row_wgt[chunk], ds_same_idx, ds_same_wgt, v_min, bin_count)
+                row_idx[chunk, 0, 1] = 0
+                row_wgt[chunk, 0, 0] = 1.0
+                row_wgt[chunk, 0, 1] = 0.0
+                _fused_upsample(rows[chunk, 0].reshape((1, 1, src_w)), rows_mask[chunk, 0].reshape((1, 1, src_w)),
+                                True, us_method, fill_value, out_row, out_mask_row, use_out_mask,
+                                row_idx[chunk], row_wgt[chunk], us_idx, us_wgt, 1)
+
+    return out
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# DS_VAR and DS_STD, see _downsample_first_last_kernel()
+#
+def _downsample_var_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                           y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy0 = y_wgt[out_y, 0]
+            wy1 = y_wgt[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                wx0 = x_wgt[out_x, 0]
+                wx1 = x_wgt[out_x, 1]
                 w_sum = 0.0
+                wv_sum = 0.0
+                wvv_sum = 0.0
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
                     for src_x in range(src_x0, src_x1 + 1):
                         wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = float(src[i, src_y, src_x])
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
                             w = wx * wy
-                            v_sum += w * v
                             w_sum += w
+                            wv_sum += w * v
+                            wvv_sum += w * v * v
+                if w_sum < _EPS:
+                    out[i, out_y, out_x] = fill_value
+                else:
+                    out[i, out_y, out_x] = (wvv_sum * w_sum - wv_sum * wv_sum) / w_sum / w_sum
+                    if method == DS_STD:
+                        # Round-off may yield slightly negative variances
+                        out[i, out_y, out_x] = np.sqrt(max(out[i, out_y, out_x], 0.0))
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = w_sum < _EPS
+
+    return out
+
+
+_downsample_var, _downsample_var_parallel = _jit_kernels(_downsample_var_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# DS_MEAN, see _downsample_first_last_kernel().
+#
+# DS_MEAN weights wx * wy are separable, so the mean is computed in two passes: each contributing source row
+# is first reduced along x into the row buffers v_row and w_row, which are then accumulated along y into v_acc and
+# w_acc. Source rows are shared by at most two neighbouring output rows, so the last reduced row is reused.
+# Weight sums are taken from the tables unless a reduced segment turns out to contain masked or NaN cells,
+# gappy segments take the NaN-aware loop which carries the weight sums of the valid cells.
+#
+def _downsample_mean_kernel(src, mask, use_mask, method, fill_value, mode_rank, out, out_mask, use_out_mask,
+                            y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    x_wsum = np.zeros(out_w, dtype=np.float64)
+    for out_x in range(out_w):
+        x_wsum[out_x] = x_wgt[out_x, 0]
+        if x_idx[out_x, 1] > x_idx[out_x, 0]:
+            x_wsum[out_x] += (x_idx[out_x, 1] - x_idx[out_x, 0] - 1) + x_wgt[out_x, 1]
+
+    # Scratch buffers, one row per chunk, so that parallel chunks don't share them
+    v_row = np.zeros((n_chunks, out_w), dtype=np.float64)
+    w_row = np.zeros((n_chunks, out_w), dtype=np.float64)
+    v_acc = np.zeros((n_chunks, out_w), dtype=np.float64)
+    w_acc = np.zeros((n_chunks, out_w), dtype=np.float64)
+    for chunk in prange(n_chunks):
+        last_i = -1
+        last_y = -1
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy0 = y_wgt[out_y, 0]
+            wy1 = y_wgt[out_y, 1]
+            for out_x in range(out_w):
+                v_acc[chunk, out_x] = 0.0
+                w_acc[chunk, out_x] = 0.0
+            for src_y in range(src_y0, src_y1 + 1):
+                if i != last_i or src_y != last_y:
+                    # Pass 1: reduce source row src_y along x
+                    try_fast = not use_mask
+                    for out_x in range(out_w):
+                        src_x0 = x_idx[out_x, 0]
+                        src_x1 = x_idx[out_x, 1]
+                        wx0 = x_wgt[out_x, 0]
+                        wx1 = x_wgt[out_x, 1]
+                        v_sum = np.nan
+                        if try_fast:
+                            # NaNs propagate, so a non-finite sum tells that the NaN-aware loop is needed
+                            v_sum = wx0 * src[i, src_y, src_x0]
+                            if src_x1 > src_x0:
+                                for src_x in range(src_x0 + 1, src_x1):
+                                    v_sum += src[i, src_y, src_x]
+                                v_sum += wx1 * src[i, src_y, src_x1]
+                        if np.isfinite(v_sum):
+                            w_sum = x_wsum[out_x]
+                        else:
+                            v_sum = 0.0
+                            w_sum = 0.0
+                            invalid_count = 0
+                            for src_x in range(src_x0, src_x1 + 1):
+                                wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
+                                v = src[i, src_y, src_x]
+                                # Selects rather than branches, gaps are hard to predict
+                                ok = np.isfinite(v) and not (use_mask and mask[i, src_y, src_x])
+                                wx = wx if ok else 0.0
+                                v_sum += wx * (v if ok else 0.0)
+                                w_sum += wx
+                                invalid_count += 0 if ok else 1
+                            # Gaps tend to cluster, so stay on the NaN-aware loop while they last
+                            try_fast = not use_mask and invalid_count == 0
+                        v_row[chunk, out_x] = v_sum
+                        w_row[chunk, out_x] = w_sum
+                    last_i = i
+                    last_y = src_y
+                # Pass 2: accumulate the reduced row along y
+                wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
+                for out_x in range(out_w):
+                    v_acc[chunk, out_x] += wy * v_row[chunk, out_x]
+                    w_acc[chunk, out_x] += wy * w_row[chunk, out_x]
+            for out_x in range(out_w):
+                w_sum = w_acc[chunk, out_x]
                 if w_sum < _EPS:
-                    out[out_y, out_x] = fill_value
+                    out[i, out_y, out_x] = fill_value
                 else:
-                    out[out_y, out_x] = v_sum / w_sum
-
-    elif method == DS_VAR or method == DS_STD:
-        for out_y in range(out_h):
-            src_yf0 = y_offset + scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
+                    out[i, out_y, out_x] = v_acc[chunk, out_x] / w_sum
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = w_sum < _EPS
+
+    return out
+
+
+_downsample_mean, _downsample_mean_parallel = _jit_kernels(_downsample_mean_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# The statistics of STATS in one traversal. The output stacks mean_out to count_out are of shape (n, out_h, out_w),
+# use_stats[s] is true if statistic STATS[s] is requested. The stacks of the others are ignored.
+# Mean, variance and standard deviation are weighted as for DS_MEAN, DS_VAR and DS_STD, count is the sum of the
+# weights of the valid source cells.
+#
+def _downsample_stats_kernel(src, mask, use_mask, fill_value, use_stats, mean_out, var_out, std_out, min_out, max_out,
+                             count_out, y_idx, y_wgt, x_idx, x_wgt, n_chunks):
+    out_w = x_idx.shape[0]
+    out_h = y_idx.shape[0]
+    row_count = src.shape[0] * out_h
+    use_mean = use_stats[0]
+    use_var = use_stats[1]
+    use_std = use_stats[2]
+    use_min = use_stats[3]
+    use_max = use_stats[4]
+    use_count = use_stats[5]
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            src_y0 = y_idx[out_y, 0]
+            src_y1 = y_idx[out_y, 1]
+            wy0 = y_wgt[out_y, 0]
+            wy1 = y_wgt[out_y, 1]
             for out_x in range(out_w):
-                src_xf0 = x_offset + scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
-                v_sum = 0.0
+                src_x0 = x_idx[out_x, 0]
+                src_x1 = x_idx[out_x, 1]
+                wx0 = x_wgt[out_x, 0]
+                wx1 = x_wgt[out_x, 1]
                 w_sum = 0.0
                 wv_sum = 0.0
                 wvv_sum = 0.0
+                v_min = np.inf
+                v_max = -np.inf
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
                     for src_x in range(src_x0, src_x1 + 1):
                         wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = float(src[i, src_y, src_x])
+                        if np.isfinite(v) and not (use_mask and mask[i, src_y, src_x]):
                             w = wx * wy
-                            v_sum += v
                             w_sum += w
                             wv_sum += w * v
                             wvv_sum += w * v * v
+                            v_min = min(v_min, v)
+                            v_max = max(v_max, v)
+                if use_count:
+                    count_out[i, out_y, out_x] = w_sum
                 if w_sum < _EPS:
-                    out[out_y, out_x] = fill_value
-                else:
-                    out[out_y, out_x] = (wvv_sum * w_sum - wv_sum * wv_sum) / w_sum / w_sum
-        if method == DS_STD:
-            out = np.sqrt(out).astype(out.dtype)
+                    if use_mean:
+                        mean_out[i, out_y, out_x] = fill_value
+                    if use_var:
+                        var_out[i, out_y, out_x] = fill_value
+                    if use_std:
+                        std_out[i, out_y, out_x] = fill_value
+                    if use_min:
+                        min_out[i, out_y, out_x] = fill_value
+                    if use_max:
+                        max_out[i, out_y, out_x] = fill_value
+                    continue
+                if use_mean:
+                    mean_out[i, out_y, out_x] = wv_sum / w_sum
+                if use_var or use_std:
+                    var = (wvv_sum * w_sum - wv_sum * wv_sum) / w_sum / w_sum
+                    if use_var:
+                        var_out[i, out_y, out_x] = var
+                    if use_std:
+                        # Round-off may yield slightly negative variances
+                        std_out[i, out_y, out_x] = np.sqrt(max(var, 0.0))
+                if use_min:
+                    min_out[i, out_y, out_x] = v_min
+                if use_max:
+                    max_out[i, out_y, out_x] = v_max
+
+
+_downsample_stats, _downsample_stats_parallel = _jit_kernels(_downsample_stats_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Downsampling by whole blocks of source cells, see _has_unit_weights(). All weights are one, so sums become
+# plain counts and there is no edge weight logic. Only DS_MEAN, DS_VAR and DS_STD benefit, DS_FIRST and DS_LAST
+# don't use weights and DS_MODE is dominated by counting values, so these use the kernels in _DS_KERNELS.
+#
+def _downsample_blocks_kernel(src, mask, use_mask, method, fill_value, out, out_mask, use_out_mask, y_idx, x_idx,
+                              n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    if method == DS_MEAN or method == DS_VAR or method == DS_STD:
+        for chunk in prange(n_chunks):
+            for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+                i = row // out_h
+                out_y = row - i * out_h
+                src_y0 = y_idx[out_y, 0]
+                src_y1 = y_idx[out_y, 1]
+                for out_x in range(out_w):
+                    src_x0 = x_idx[out_x, 0]
+                    src_x1 = x_idx[out_x, 1]
+                    v_sum = np.nan
+                    vv_sum = 0.0
+                    if not use_mask:
+                        # NaNs propagate, so a non-finite sum tells that the NaN-aware loop is needed.
+                        # Two interleaved sums shorten the chain of dependent additions.
+                        v_sum0 = 0.0
+                        v_sum1 = 0.0
+                        vv_sum0 = 0.0
+                        vv_sum1 = 0.0
+                        for src_y in range(src_y0, src_y1 + 1):
+                            src_x = src_x0
+                            while src_x < src_x1:
+                                v0 = float(src[i, src_y, src_x])
+                                v1 = float(src[i, src_y, src_x + 1])
+                                v_sum0 += v0
+                                v_sum1 += v1
+                                if method != DS_MEAN:
+                                    vv_sum0 += v0 * v0
+                                    vv_sum1 += v1 * v1
+                                src_x += 2
+                            if src_x == src_x1:
+                                v0 = float(src[i, src_y, src_x])
+                                v_sum0 += v0
+                                if method != DS_MEAN:
+                                    vv_sum0 += v0 * v0
+                        v_sum = v_sum0 + v_sum1
+                        vv_sum = vv_sum0 + vv_sum1
+                    if np.isfinite(v_sum) and np.isfinite(vv_sum):
+                        count = (src_y1 - src_y0 + 1) * (src_x1 - src_x0 + 1)
+                    else:
+                        count = 0
+                        v_sum = 0.0
+                        vv_sum = 0.0
+                        for src_y in range(src_y0, src_y1 + 1):
+                            for src_x in range(src_x0, src_x1 + 1):
+                                v = float(src[i, src_y, src_x])
+                                # Selects rather than branches, gaps are hard to predict
+                                ok = np.isfinite(v) and not (use_mask and mask[i, src_y, src_x])
+                                v = v if ok else 0.0
+                                count += 1 if ok else 0
+                                v_sum += v
+                                if method != DS_MEAN:
+                                    vv_sum += v * v
+                    if use_out_mask:
+                        out_mask[i, out_y, out_x] = count == 0
+                    if count == 0:
+                        out[i, out_y, out_x] = fill_value
+                    elif method == DS_MEAN:
+                        out[i, out_y, out_x] = v_sum / count
+                    else:
+                        out[i, out_y, out_x] = (vv_sum * count - v_sum * v_sum) / count / count
+                        if method == DS_STD:
+                            # Round-off may yield slightly negative variances
+                            out[i, out_y, out_x] = np.sqrt(max(out[i, out_y, out_x], 0.0))
+
     else:
-        raise ValueError('invalid upsampling method')
+        raise ValueError('invalid downsampling method')
+
+    return out
+
+
+_downsample_blocks, _downsample_blocks_parallel = _jit_kernels(_downsample_blocks_kernel)
+
+
+@jit(nopython=True, cache=True)
+def _sat_integral(table, i, y_idx, y_frac, x_idx, x_frac):
+    # Bilinear interpolation of a summed-area table yields the exact integral of the
+    # piecewise constant grid from its origin to the fractional position (y, x)
+    t00 = table[i, y_idx, x_idx]
+    t01 = table[i, y_idx, x_idx + 1]
+    t10 = table[i, y_idx + 1, x_idx]
+    t11 = table[i, y_idx + 1, x_idx + 1]
+    t0 = t00 + x_frac * (t01 - t00)
+    t1 = t10 + x_frac * (t11 - t10)
+    return t0 + y_frac * (t1 - t0)
+
+
+@jit(nopython=True, cache=True)
+def _sat_sum(table, i, y_idx, y_frac, out_y, x_idx, x_frac, out_x):
+    return (_sat_integral(table, i, y_idx[out_y, 1], y_frac[out_y, 1], x_idx[out_x, 1], x_frac[out_x, 1])
+            - _sat_integral(table, i, y_idx[out_y, 0], y_frac[out_y, 0], x_idx[out_x, 1], x_frac[out_x, 1])
+            - _sat_integral(table, i, y_idx[out_y, 1], y_frac[out_y, 1], x_idx[out_x, 0], x_frac[out_x, 0])
+            + _sat_integral(table, i, y_idx[out_y, 0], y_frac[out_y, 0], x_idx[out_x, 0], x_frac[out_x, 0]))
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# w_table, v_table, vv_table are the summed-area tables of shape (n, h + 1, w + 1) of the valid cell weights,
+# values and squared values. The values of grid i have been shifted by shift[i].
+# The output cell edges are given by the tables computed by _get_sat_axis().
+#
+# The n * out_h output rows are split into n_chunks contiguous chunks which are processed in parallel
+# by the _sat_downsample_parallel variant. n_chunks=1 yields the serial computation.
+#
+def _sat_downsample_kernel(w_table, v_table, vv_table, shift, method, fill_value, out, out_mask, use_out_mask,
+                           y_idx, y_frac, x_idx, x_frac, n_chunks):
+    out_w = out.shape[-1]
+    out_h = out.shape[-2]
+    row_count = out.shape[0] * out_h
+
+    for chunk in prange(n_chunks):
+        for row in range((chunk * row_count) // n_chunks, ((chunk + 1) * row_count) // n_chunks):
+            i = row // out_h
+            out_y = row - i * out_h
+            for out_x in range(out_w):
+                w_sum = _sat_sum(w_table, i, y_idx, y_frac, out_y, x_idx, x_frac, out_x)
+                if use_out_mask:
+                    out_mask[i, out_y, out_x] = w_sum < _EPS
+                if w_sum < _EPS:
+                    out[i, out_y, out_x] = fill_value
+                    continue
+                wv_sum = _sat_sum(v_table, i, y_idx, y_frac, out_y, x_idx, x_frac, out_x)
+                if method == DS_MEAN:
+                    out[i, out_y, out_x] = shift[i] + wv_sum / w_sum
+                else:
+                    wvv_sum = _sat_sum(vv_table, i, y_idx, y_frac, out_y, x_idx, x_frac, out_x)
+                    var = (wvv_sum * w_sum - wv_sum * wv_sum) / w_sum / w_sum
+                    if method == DS_STD:
+                        # Round-off may yield slightly negative variances
+                        out[i, out_y, out_x] = np.sqrt(max(var, 0.0))
+                    else:
+                        out[i, out_y, out_x] = var
+
+    return out
+
+
+_sat_downsample, _sat_downsample_parallel = _jit_kernels(_sat_downsample_kernel)
+
+
+@jit(nopython=True, cache=True)
+def _clip_polygon(px, py, n, qx, qy, axis, bound, sign):
+    """
+    Clip the convex polygon of the *n* vertices *px*, *py* to the half-plane where
+    ``sign * (coordinate - bound) >= 0``, with coordinate x if *axis* is 0, else y.
+    Write the vertices of the clipped polygon into *qx*, *qy* and return their count.
+    """
+    m = 0
+    for j in range(n):
+        k = j + 1 if j + 1 < n else 0
+        dj = sign * ((px[j] if axis == 0 else py[j]) - bound)
+        dk = sign * ((px[k] if axis == 0 else py[k]) - bound)
+        if dj >= 0.0:
+            qx[m] = px[j]
+            qy[m] = py[j]
+            m += 1
+        if (dj >= 0.0) != (dk >= 0.0):
+            t = dj / (dj - dk)
+            qx[m] = px[j] + t * (px[k] - px[j])
+            qy[m] = py[j] + t * (py[k] - py[j])
+            m += 1
+    return m
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Computes the overlap areas of each output cell with the source cells of its bounding box
+# [x0, x1) x [y0, y1) in source pixel coordinates, into the CSR arrays indices and weights.
+# m is the affine transform from output to source pixel coordinates, see _get_pixel_transform().
+# Each output cell is a parallelogram in source pixel coordinates, which is clipped to each source cell.
+#
+# The output cells are split into n_chunks contiguous chunks which are processed in parallel
+# by the _get_overlaps_parallel variant. n_chunks=1 yields the serial computation.
+#
+def _get_overlaps_kernel(m, src_w, out_w, x0, x1, y0, y1, indptr, indices, weights, n_chunks):
+    cell_count = indptr.shape[0] - 1
+
+    for chunk in prange(n_chunks):
+        corner_x = np.zeros(4)
+        corner_y = np.zeros(4)
+        px = np.zeros(16)
+        py = np.zeros(16)
+        qx = np.zeros(16)
+        qy = np.zeros(16)
+        for cell in range((chunk * cell_count) // n_chunks, ((chunk + 1) * cell_count) // n_chunks):
+            out_y = cell // out_w
+            out_x = cell - out_y * out_w
+            # Corners in order around the cell
+            for j in range(4):
+                u = out_x + (1 if j == 1 or j == 2 else 0)
+                v = out_y + (1 if j >= 2 else 0)
+                corner_x[j] = m[0] * u + m[1] * v + m[2]
+                corner_y[j] = m[3] * u + m[4] * v + m[5]
+            k = indptr[cell]
+            for src_y in range(y0[cell], y1[cell]):
+                for src_x in range(x0[cell], x1[cell]):
+                    px[:4] = corner_x
+                    py[:4] = corner_y
+                    n = _clip_polygon(px, py, 4, qx, qy, 0, src_x, 1.0)
+                    n = _clip_polygon(qx, qy, n, px, py, 0, src_x + 1, -1.0)
+                    n = _clip_polygon(px, py, n, qx, qy, 1, src_y, 1.0)
+                    n = _clip_polygon(qx, qy, n, px, py, 1, src_y + 1, -1.0)
+                    area = 0.0
+                    for j in range(n):
+                        j1 = j + 1 if j + 1 < n else 0
+                        area += px[j] * py[j1] - px[j1] * py[j]
+                    indices[k] = src_y * src_w + src_x
+                    weights[k] = 0.5 * abs(area)
+                    k += 1
+
+    return weights
+
+
+_get_overlaps, _get_overlaps_parallel = _jit_kernels(_get_overlaps_kernel)
+
+
+# This function will be JIT-compiled by Numba with nopython=True,
+# therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# src has shape (n, src_h * src_w) and out has shape (n, out_h * out_w), i.e. the grids of a stack are rows.
+# Output cell k of grid i is the mean of the valid src[i, indices[j]] weighted by weights[j]
+# for j in [indptr[k], indptr[k + 1]).
+#
+# The out_h * out_w output cells are split into n_chunks contiguous chunks which are processed in parallel
+# by the _sparse_mean_parallel variant. n_chunks=1 yields the serial computation.
+#
+def _sparse_mean_kernel(src, mask, use_mask, fill_value, out, out_mask, use_out_mask, indptr, indices, weights,
+                        n_chunks):
+    cell_count = out.shape[-1]
+
+    for chunk in prange(n_chunks):
+        for cell in range((chunk * cell_count) // n_chunks, ((chunk + 1) * cell_count) // n_chunks):
+            # The weights of the cell are reused for all grids of the stack
+            for i in range(out.shape[0]):
+                v_sum = 0.0
+                w_sum = 0.0
+                for j in range(indptr[cell], indptr[cell + 1]):
+                    src_cell = indices[j]
+                    value = src[i, src_cell]
+                    if np.isfinite(value) and not (use_mask and mask[i, src_cell]):
+                        weight = weights[j]
+                        v_sum += weight * value
+                        w_sum += weight
+                if w_sum < _EPS:
+                    out[i, cell] = fill_value
+                else:
+                    out[i, cell] = v_sum / w_sum
+                if use_out_mask:
+                    out_mask[i, cell] = w_sum < _EPS
+
+    return out
+
+
+_sparse_mean, _sparse_mean_parallel = _jit_kernels(_sparse_mean_kernel)
+
+
+# Kernels by method, as (serial, parallel) pairs. Numba compiles a kernel on its first call only,
+# so users of a single method don't pay for compiling the others.
+_US_KERNELS = {
+    US_NEAREST: (_upsample_nearest, _upsample_nearest_parallel),
+    US_LINEAR: (_upsample_linear, _upsample_linear_parallel),
+}
+_DS_KERNELS = {
+    DS_FIRST: (_downsample_first_last, _downsample_first_last_parallel),
+    DS_LAST: (_downsample_first_last, _downsample_first_last_parallel),
+    DS_MIN: (_downsample_min_max, _downsample_min_max_parallel),
+    DS_MAX: (_downsample_min_max, _downsample_min_max_parallel),
+    DS_MEAN: (_downsample_mean, _downsample_mean_parallel),
+    DS_MODE: (_downsample_mode, _downsample_mode_parallel),
+    DS_VAR: (_downsample_var, _downsample_var_parallel),
+    DS_STD: (_downsample_var, _downsample_var_parallel),
+}
 
-    return out
\ No newline at end of file
+# Downsampling steps of _resample_fused_kernel() by the kernel of _DS_KERNELS they call
+_FUSED_DS_KERNELS = {kernel: jit(nopython=True, cache=True)(_bind_globals(_fused_downsample_kernel,
+                                                                          '_fused' + _kernel_name(kernel),
+                                                                          _downsample_kernel=kernel))
+                     for kernel in set(kernels[0] for kernels in _DS_KERNELS.values())}
+# Specializations of _resample_fused_kernel() as (serial, parallel) pairs, by the names of their steps
+_FUSED_KERNELS = {}
@@ -0,0 +1,16 @@
+import numpy as np
+
+
+def make_src(shape, seed, v_max=None, nan_fraction=0.0, dtype=np.float64, v_min=0):
+    """
+    Make a reproducible random test grid of *shape*: integers from *v_min* to *v_max* of type *dtype*,
+    or values from 0 to 1 if *v_max* is None. A fraction *nan_fraction* of the cells is NaN.
+    """
+    rs = np.random.RandomState(seed)
+    if v_max is None:
+        src = rs.rand(*shape).astype(dtype)
+    else:
+        src = rs.randint(v_min, v_max + 1, size=shape).astype(dtype)
+    if nan_fraction > 0.0:
+        src[rs.rand(*shape) < nan_fraction] = np.nan
+    return src
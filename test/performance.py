@@ -1,31 +1,249 @@
+import os
+import subprocess
+import sys
+import tempfile
 import timeit
 
+import numba
 import numpy as np
 
+import gridtools.gapfilling as gtg
 import gridtools.resampling as gts
 
-MAIN = 'from __main__ import np, gts, a, out, out_shape'
+MAIN = 'from __main__ import np, gtg, gts, a, out, out_shape'
 times = 100
 N = 8
 
+# Compiles the kernels for the given methods in a fresh process, prints compile time and peak memory increase
+COMPILE = """
+import resource, sys, time
+import numpy as np
+import gridtools.gapfilling as gtg
+import gridtools.resampling as gts
+src = np.random.rand(8, 8)
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+for name in sys.argv[1:]:
+    if name.startswith('US_'):
+        gts.upsample_2d(src, 12, 12, method=getattr(gts, name))
+    else:
+        gts.downsample_2d(src, 3, 3, method=getattr(gts, name))
+t1 = time.perf_counter()
+rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print('%f\t%f' % (t1 - t0, (rss1 - rss0) / 1024.))
+"""
+
+print('\nCompile time and memory per method (fresh process, empty cache):')
+print('Methods\tTime\tMemory [MB]')
+all_methods = ['DS_FIRST', 'DS_LAST', 'DS_MIN', 'DS_MAX', 'DS_MEAN', 'DS_MEDIAN', 'DS_MODE', 'DS_VAR', 'DS_STD', 'US_NEAREST', 'US_LINEAR']
+for methods in [[method] for method in all_methods if method not in ('DS_LAST', 'DS_MAX', 'DS_STD')] + [all_methods]:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+        result = subprocess.check_output([sys.executable, '-c', COMPILE] + methods, env=env)
+    print('%s\t%s' % ('all' if methods is all_methods else methods[0], result.decode().strip()))
+
 print('\nUpsampling:')
-print('No\tSize\tPython\tNumba\tNumba-Gain')
+print('No\tSize\tTime')
 src_size = 4
 for i in range(N):
     a = np.random.rand(src_size, src_size)
     out_shape = int(src_size * 2.5), int(src_size * 2.1)
     out = np.zeros(out_shape, dtype=np.float64)
-    t1 = timeit.timeit(setup=MAIN, number=times, stmt='gts.upsample2d(a, out_shape[-1], out_shape[-2], out=out)')
+    t1 = timeit.timeit(setup=MAIN, number=times, stmt='gts.upsample_2d(a, out_shape[-1], out_shape[-2], out=out)')
     print('%d\t%d\t%f' % (i + 1, src_size, t1))
     src_size *= 2
 
 print('\nDownsampling:')
-print('No\tSize\tPython\tNumba\tNumba-Gain')
+print('No\tSize\tTime')
 src_size = 4
 for i in range(N):
     a = np.random.rand(src_size, src_size)
     out_shape = int(src_size / 2.5), int(src_size / 2.1)
     out = np.zeros(out_shape, dtype=np.float64)
-    t1 = timeit.timeit(setup=MAIN, number=times, stmt='gts.downsample2d(a, out_shape[-1], out_shape[-2], out=out)')
+    t1 = timeit.timeit(setup=MAIN, number=times, stmt='gts.downsample_2d(a, out_shape[-1], out_shape[-2], out=out)')
     print('%d\t%d\t%f' % (i + 1, src_size, t1))
     src_size *= 2
+
+print('\nParallel downsampling (%d threads):' % numba.get_num_threads())
+print('Method\tSize\tSerial\tParallel\tGain')
+src_size = 4096
+a = np.random.rand(src_size, src_size).astype(np.float32)
+out_shape = int(src_size / 2.5), int(src_size / 2.1)
+out = np.zeros(out_shape, dtype=np.float32)
+for method_name in ('DS_MEAN', 'DS_VAR', 'DS_MODE'):
+    stmt = 'gts.downsample_2d(a, out_shape[-1], out_shape[-2], method=gts.%s, out=out, parallel=%s)'
+    # Compile first
+    timeit.timeit(setup=MAIN, number=1, stmt=stmt % (method_name, False))
+    timeit.timeit(setup=MAIN, number=1, stmt=stmt % (method_name, True))
+    t1 = timeit.timeit(setup=MAIN, number=3, stmt=stmt % (method_name, False))
+    t2 = timeit.timeit(setup=MAIN, number=3, stmt=stmt % (method_name, True))
+    print('%s\t%d\t%f\t%f\t%f' % (method_name, src_size, t1, t2, t1 / t2))
+
+print('\nDS_MEAN on a 4000 x 4000 grid, without gaps, with random gaps, and with a block gap:')
+print('Factor\tNo gaps\tRandom\tBlock')
+a_full = np.random.rand(4000, 4000)
+a_random = a_full.copy()
+a_random[np.random.rand(4000, 4000) < 0.1] = np.nan
+a_block = a_full.copy()
+a_block[1000:2000, 1000:2000] = np.nan
+for factor in (2.5, 10, 40):
+    out_shape = (int(4000 / factor), int(4000 / factor))
+    out = np.zeros(out_shape, dtype=np.float64)
+    ts = []
+    for a in (a_full, a_random, a_block):
+        gts.downsample_2d(a, out_shape[-1], out_shape[-2], out=out)
+        ts.append(timeit.timeit(setup=MAIN, number=3, stmt='gts.downsample_2d(a, out_shape[-1], out_shape[-2], out=out)'))
+    print('%s\t%f\t%f\t%f' % (factor, ts[0], ts[1], ts[2]))
+
+print('\nInteger factors on a 4000 x 4000 grid, block kernel vs. general kernel:')
+print('Method\tFactor\tGeneral\tBlocks\tGain')
+a = np.random.rand(1, 4000, 4000)
+a[0, 1000:2000, 1000:2000] = np.nan
+for method_name in ('DS_MEAN', 'DS_VAR'):
+    for factor in (2, 4, 10):
+        out_shape = (1, 4000 // factor, 4000 // factor)
+        out = np.zeros(out_shape, dtype=np.float64)
+        y_idx, y_wgt, x_idx, x_wgt = gts._get_ds_tables(a.shape, out.shape)
+        general = ('gts._DS_KERNELS[gts.%s][0](a, gts._NOMASK3D, False, gts.%s, np.nan, 1, out, '
+                   'gts._NOMASK3D, False, y_idx, y_wgt, x_idx, x_wgt, 1)' % (method_name, method_name))
+        blocks = ('gts._downsample_blocks(a, gts._NOMASK3D, False, gts.%s, np.nan, out, gts._NOMASK3D, False, '
+                  'y_idx, x_idx, 1)' % method_name)
+        setup = MAIN + ', y_idx, y_wgt, x_idx, x_wgt'
+        timeit.timeit(setup=setup, number=1, stmt=general)
+        timeit.timeit(setup=setup, number=1, stmt=blocks)
+        t1 = timeit.timeit(setup=setup, number=3, stmt=general)
+        t2 = timeit.timeit(setup=setup, number=3, stmt=blocks)
+        print('%s\t%d\t%f\t%f\t%f' % (method_name, factor, t1, t2, t1 / t2))
+
+print('\nDS_MODE on a 2000 x 2000 uint16 class grid, histogram vs. general kernel:')
+print('Classes\tFactor\tGeneral\tHistogram\tGain')
+for n_classes in (8, 64, 1000):
+    a = np.random.randint(0, n_classes, size=(1, 2000, 2000)).astype(np.uint16)
+    for factor in (2.5, 10):
+        out_shape = (1, int(2000 / factor), int(2000 / factor))
+        out = np.zeros(out_shape, dtype=np.uint16)
+        tables = gts._get_ds_tables(a.shape, out.shape)
+        general = ('gts._downsample_mode(a, gts._NOMASK3D, False, gts.DS_MODE, 0, 1, out, gts._NOMASK3D, False, '
+                   '*tables, 1)')
+        histogram = ('gts._downsample_mode_histogram(a, gts._NOMASK3D, False, 0, 1, out, gts._NOMASK3D, False, '
+                     '*tables, 0, n_classes, 1)')
+        setup = MAIN + ', tables, n_classes'
+        timeit.timeit(setup=setup, number=1, stmt=general)
+        timeit.timeit(setup=setup, number=1, stmt=histogram)
+        t1 = timeit.timeit(setup=setup, number=3, stmt=general)
+        t2 = timeit.timeit(setup=setup, number=3, stmt=histogram)
+        print('%d\t%s\t%f\t%f\t%f' % (n_classes, factor, t1, t2, t1 / t2))
+
+print('\nRegridder vs. downsample_2d on small tiles:')
+print('Size\tdownsample_2d\tRegridder\tGain')
+a = np.random.rand(64, 64)
+out_shape = (25, 30)
+out = np.zeros(out_shape, dtype=np.float64)
+regridder = gts.Regridder(a.shape, out_shape)
+regridder(a, out=out)
+t1 = timeit.timeit(setup=MAIN, number=10000, stmt='gts.downsample_2d(a, out_shape[-1], out_shape[-2], out=out)')
+t2 = timeit.timeit(setup=MAIN + ', regridder', number=10000, stmt='regridder(a, out=out)')
+print('%d\t%f\t%f\t%f' % (a.shape[-1], t1, t2, t1 / t2))
+
+print('\nSummed-area tables vs. downsample_2d, DS_MEAN on a 4000 x 4000 grid:')
+print('Factor\tdownsample_2d\tSummedAreaTable\tGain')
+a = np.random.rand(4000, 4000)
+sat = gts.SummedAreaTable(a)
+for factor in (4, 40, 400):
+    out_shape = (4000 // factor, 4000 // factor)
+    out = np.zeros(out_shape, dtype=np.float64)
+    sat.downsample(out_shape[-1], out_shape[-2], out=out)
+    t1 = timeit.timeit(setup=MAIN, number=3, stmt='gts.downsample_2d(a, out_shape[-1], out_shape[-2], out=out)')
+    t2 = timeit.timeit(setup=MAIN + ', sat', number=3, stmt='sat.downsample(out_shape[-1], out_shape[-2], out=out)')
+    print('%d\t%f\t%f\t%f' % (factor, t1, t2, t1 / t2))
+
+print('\nAll statistics on a 2000 x 2000 grid, downsample_stats_2d vs. one downsample_2d call per method:')
+print('Factor\tdownsample_2d\tdownsample_stats_2d\tGain')
+a = np.random.rand(2000, 2000)
+a[500:1000, 500:1000] = np.nan
+methods = 'gts.DS_MEAN, gts.DS_VAR, gts.DS_STD, gts.DS_MIN, gts.DS_MAX'
+for factor in (2.5, 10):
+    out_shape = (int(2000 / factor), int(2000 / factor))
+    separate = ('[gts.downsample_2d(a, out_shape[-1], out_shape[-2], method=m) for m in (%s)]' % methods)
+    stats = 'gts.downsample_stats_2d(a, out_shape[-1], out_shape[-2])'
+    timeit.timeit(setup=MAIN, number=1, stmt=separate)
+    timeit.timeit(setup=MAIN, number=1, stmt=stats)
+    t1 = timeit.timeit(setup=MAIN, number=3, stmt=separate)
+    t2 = timeit.timeit(setup=MAIN, number=3, stmt=stats)
+    print('%s\t%f\t%f\t%f' % (factor, t1, t2, t1 / t2))
+
+print('\nDS_MEDIAN vs. DS_MEAN on 2000 x 2000 grids:')
+print('Grid\tFactor\tDS_MEAN\tDS_MEDIAN\tRatio')
+for name, a in (('float64', np.random.rand(2000, 2000)),
+                ('uint8', np.random.randint(0, 20, size=(2000, 2000)).astype(np.uint8)),
+                ('uint16', np.random.randint(0, 1000, size=(2000, 2000)).astype(np.uint16))):
+    for factor in (2.5, 10):
+        out_shape = (int(2000 / factor), int(2000 / factor))
+        stmt = 'gts.downsample_2d(a, out_shape[-1], out_shape[-2], method=gts.%s)'
+        timeit.timeit(setup=MAIN, number=1, stmt=stmt % 'DS_MEAN')
+        timeit.timeit(setup=MAIN, number=1, stmt=stmt % 'DS_MEDIAN')
+        t1 = timeit.timeit(setup=MAIN, number=3, stmt=stmt % 'DS_MEAN')
+        t2 = timeit.timeit(setup=MAIN, number=3, stmt=stmt % 'DS_MEDIAN')
+        print('%s\t%s\t%f\t%f\t%f' % (name, factor, t1, t2, t2 / t1))
+
+print('\nresample_2d() on a 2000 x 4000 grid, shrinking one axis and growing the other:')
+print('Size\tTime')
+a = np.random.rand(2000, 4000)
+for out_shape in ((4000, 1000), (1000, 8000)):
+    out = np.zeros(out_shape, dtype=np.float64)
+    gts.resample_2d(a, out_shape[-1], out_shape[-2], out=out)
+    t1 = timeit.timeit(setup=MAIN, number=3, stmt='gts.resample_2d(a, out_shape[-1], out_shape[-2], out=out)')
+    print('%s\t%f' % (out_shape, t1))
+
+print('\nSparseRegridder from a 2000 x 2000 grid to a rotated 500 x 500 grid, build vs. apply to 10 grids:')
+print('Build\tApply\tdownsample_nd')
+src_transform = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+out_transform = (3.0 * np.cos(0.2), -3.0 * np.sin(0.2), 300.0, 3.0 * np.sin(0.2), 3.0 * np.cos(0.2), 100.0)
+a = np.random.rand(10, 2000, 2000)
+out = np.zeros((10, 500, 500), dtype=np.float64)
+gts.SparseRegridder((300, 300), (50, 50), src_transform, out_transform)(a[:, :300, :300])
+t1 = timeit.timeit(setup=MAIN + ', src_transform, out_transform', number=1,
+                   stmt='gts.SparseRegridder(a.shape, out.shape, src_transform, out_transform)')
+regridder = gts.SparseRegridder(a.shape, out.shape, src_transform, out_transform)
+t2 = timeit.timeit(setup=MAIN + ', regridder', number=3, stmt='regridder(a, out=out)') / 3
+t3 = timeit.timeit(setup=MAIN, number=3, stmt='gts.downsample_nd(a, 500, 500, out=out)') / 3
+print('%f\t%f\t%f' % (t1, t2, t3))
+
+print('\nA 256 x 256 window of a 2000 x 2000 target grid, downsample_window_2d vs. downsample_2d:')
+print('Source\tdownsample_2d\tdownsample_window_2d\tGain')
+for src_size in (4000, 8000):
+    a = np.random.rand(src_size, src_size).astype(np.float32)
+    stmt = 'gts.downsample_window_2d(a, 2000, 2000, (1000, 500, 256, 256))'
+    timeit.timeit(setup=MAIN, number=1, stmt=stmt)
+    t1 = timeit.timeit(setup=MAIN, number=3, stmt='gts.downsample_2d(a, 2000, 2000)') / 3
+    t2 = timeit.timeit(setup=MAIN, number=3, stmt=stmt) / 3
+    print('%d\t%f\t%f\t%f' % (src_size, t1, t2, t1 / t2))
+
+print('\nfillgaps_lowpass_2d() on a 2000 x 2000 grid with a square gap:')
+print('Gap\tTime')
+for gap_size in (100, 1000):
+    a = np.random.rand(2000, 2000)
+    a[500:500 + gap_size, 500:500 + gap_size] = np.nan
+    gtg.fillgaps_lowpass_2d(a[:10, :10])
+    t1 = timeit.timeit(setup=MAIN, number=1, stmt='gtg.fillgaps_lowpass_2d(a)')
+    print('%d\t%f' % (gap_size, t1))
+
+print('\nfillgaps_normconv_2d() on a 2000 x 2000 grid with 30% gaps, direct vs. FFT convolution:')
+print('Kernel\tDirect\tFFT\tGain')
+a = np.random.rand(2000, 2000)
+a[np.random.rand(2000, 2000) < 0.3] = np.nan
+for kernel_size in (5, 11, 31):
+    stmt = 'gtg.fillgaps_normconv_2d(a, kernel=np.ones((%d, %d)), fft=%s)'
+    gtg.fillgaps_normconv_2d(a[:20, :20], kernel=np.ones((kernel_size, kernel_size)), fft=False)
+    t1 = timeit.timeit(setup=MAIN, number=1, stmt=stmt % (kernel_size, kernel_size, False))
+    t2 = timeit.timeit(setup=MAIN, number=1, stmt=stmt % (kernel_size, kernel_size, True))
+    print('%d\t%f\t%f\t%f' % (kernel_size, t1, t2, t1 / t2))
+
+print('\nfillgaps_nearest_2d() on uint8 class grids with 1% valid cells:')
+print('Size\tTime')
+for size in (1000, 4000):
+    a = np.random.randint(0, 10, size=(size, size)).astype(np.uint8)
+    valid = np.random.rand(size, size) < 0.01
+    gtg.fillgaps_nearest_2d(a[:10, :10], valid=valid[:10, :10])
+    t1 = timeit.timeit(setup=MAIN + ', valid', number=1, stmt='gtg.fillgaps_nearest_2d(a, valid=valid)')
+    print('%d\t%f' % (size, t1))
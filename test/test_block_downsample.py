@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+def _downsample_general(src, w, h, method, fill_value, src_transform=None, out_transform=None):
+    # Bypass the block kernel
+    y_idx, y_wgt, x_idx, x_wgt = gtr._get_ds_tables(src.shape, (h, w), src_transform, out_transform)
+    src = src.reshape((1,) + src.shape)
+    out = np.zeros((1, h, w), dtype=src.dtype)
+    downsample = gtr._DS_KERNELS[method][0]
+    downsample(src, gtr._NOMASK3D, False, method, fill_value, 1, out, gtr._NOMASK3D, False,
+               y_idx, y_wgt, x_idx, x_wgt, 1)
+    return out[0]
+
+
+class BlockDownsampleTest(unittest.TestCase):
+    def test_unit_weights(self):
+        self.assertTrue(gtr._has_unit_weights(*gtr._get_ds_tables((40, 30), (10, 15))[1::2]))
+        self.assertFalse(gtr._has_unit_weights(*gtr._get_ds_tables((40, 30), (10, 14))[1::2]))
+        # Factor 3 with transforms suffering from round-off
+        tables = gtr._get_ds_tables((30, 30), (10, 9),
+                                    (0.1, 0.0, 0.0, 0.0, -0.1, 3.0), (0.3, 0.0, 0.3, 0.0, -0.3, 3.0))
+        self.assertTrue(gtr._has_unit_weights(*tables[1::2]))
+        assert_equal(tables[2][0], [3, 5])
+
+    def test_methods(self):
+        src = make_src((40, 30), 17, v_max=4, nan_fraction=0.1)
+        for method in (gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_VAR, gtr.DS_STD):
+            for w, h in ((15, 20), (10, 10), (3, 4), (1, 1)):
+                actual = gtr.downsample_2d(src, w, h, method=method, fill_value=-1.)
+                desired = _downsample_general(src, w, h, method, -1.)
+                assert_almost_equal(actual, desired)
+
+    def test_transform(self):
+        src = make_src((30, 30), 17, v_max=4, nan_fraction=0.1)
+        src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 3.0)
+        out_transform = (0.3, 0.0, 0.3, 0.0, -0.3, 3.0)
+        for method in (gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_VAR, gtr.DS_STD):
+            actual = gtr.downsample_2d(src, 9, 10, method=method, fill_value=-1.,
+                                       src_transform=src_transform, out_transform=out_transform)
+            desired = _downsample_general(src, 9, 10, method, -1., src_transform, out_transform)
+            assert_almost_equal(actual, desired)
+
+    def test_large_integers(self):
+        # Squared values overflow in the integer type
+        for dtype in (np.int32, np.int64):
+            src = make_src((40, 30), 17, v_max=4, dtype=dtype) * (np.iinfo(dtype).max // 8)
+            for method in (gtr.DS_VAR, gtr.DS_STD):
+                actual = gtr.downsample_2d(src, 15, 20, method=method, out=np.zeros((20, 15)))
+                desired = _downsample_general(src.astype(np.float64), 15, 20, method, 0.)
+                assert_almost_equal(actual / desired.max(), desired / desired.max())
+
+    def test_mask(self):
+        rs = np.random.RandomState(3)
+        src = np.ma.array(rs.rand(20, 20), mask=rs.rand(20, 20) < 0.3)
+        src.mask[:4, :4] = True
+        actual = gtr.downsample_2d(src, 5, 5, method=gtr.DS_MEAN, fill_value=-1.)
+        desired = np.array([[src[y:y + 4, x:x + 4].mean() if x or y else -1. for x in range(0, 20, 4)]
+                            for y in range(0, 20, 4)])
+        assert_equal(actual.mask, desired == -1.)
+        assert_almost_equal(actual.data, desired)
+
+    def test_resample(self):
+        src = make_src((40, 30), 17, v_max=4, nan_fraction=0.1)
+        actual = gtr.resample_2d(src, 10, 80, ds_method=gtr.DS_MODE, us_method=gtr.US_NEAREST, fill_value=-1.)
+        desired = gtr.upsample_2d(_downsample_general(src, 10, 40, gtr.DS_MODE, -1.), 10, 80,
+                                  method=gtr.US_NEAREST, fill_value=-1.)
+        assert_equal(actual, desired)
+
+    def test_parallel(self):
+        src = make_src((3, 40, 30), 17, v_max=4, nan_fraction=0.1)
+        for method in (gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_STD):
+            desired = gtr.downsample_nd(src, 10, 10, method=method, fill_value=-1.)
+            actual = gtr.downsample_nd(src, 10, 10, method=method, fill_value=-1., parallel=True, num_threads=4)
+            assert_equal(actual, desired)
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class DownsampleModesTest(unittest.TestCase):
+    def test_modes_equal_mode_ranks(self):
+        src = make_src((30, 25), 31, v_max=5, dtype=np.uint8)
+        modes, weights = gtr.downsample_modes_2d(src, 7, 9, 3, fill_value=99)
+        self.assertEqual(modes.shape, (3, 9, 7))
+        self.assertEqual(modes.dtype, np.uint8)
+        for r in range(3):
+            assert_equal(modes[r], gtr.downsample_2d(src, 7, 9, method=gtr.DS_MODE, mode_rank=r + 1, fill_value=99))
+        # Weights decrease with rank and are consistent with the class fractions
+        self.assertTrue(np.all(weights[:-1] >= weights[1:]))
+        fractions = gtr.downsample_fractions_2d(src, 7, 9, range(6))
+        for r in range(3):
+            assert_almost_equal(weights[r], np.take_along_axis(fractions, modes[r:r + 1].astype(np.int64), 0)[0])
+
+    def test_example(self):
+        src = np.array([[1, 1, 2, 3],
+                        [1, 2, 3, 3],
+                        [4, 4, 4, 4],
+                        [4, 4, 4, 5]], dtype=np.int16)
+        modes, weights = gtr.downsample_modes_2d(src, 2, 2, 3, fill_value=-1)
+        assert_equal(modes, [[[1, 3], [4, 4]],
+                             [[2, 2], [-1, 5]],
+                             [[-1, -1], [-1, -1]]])
+        assert_almost_equal(weights, [[[0.75, 0.75], [1.0, 0.75]],
+                                      [[0.25, 0.25], [0.0, 0.25]],
+                                      [[0.0, 0.0], [0.0, 0.0]]])
+
+    def test_masked(self):
+        src = np.ma.array(make_src((8, 8), 31, v_max=5, dtype=np.uint8), mask=np.zeros((8, 8), dtype=bool))
+        src.mask[:4, :4] = True
+        modes, weights = gtr.downsample_modes_2d(src, 2, 2, 2, fill_value=99)
+        assert_equal(modes.mask[:, 0, 0], [True, True])
+        assert_equal(weights[:, 0, 0], [0.0, 0.0])
+        assert_equal(modes[0], gtr.downsample_2d(src, 2, 2, method=gtr.DS_MODE, fill_value=99))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_modes_2d(np.zeros((4, 4)), 2, 2, 1)
+        with self.assertRaises(ValueError):
+            gtr.downsample_modes_2d(np.zeros((4, 4), dtype=np.int32), 2, 2, 0)
+        with self.assertRaises(ValueError):
+            gtr.downsample_modes_2d(np.zeros((4, 4), dtype=np.int32), 2, 2, 2, out=np.zeros((1, 2, 2)))
+
+
+class DownsampleFractionsTest(unittest.TestCase):
+    def test_fractions(self):
+        src = np.array([[10, 10, 20, 30],
+                        [10, 20, 30, 30],
+                        [40, 40, 40, 40],
+                        [40, 40, 40, 50]], dtype=np.uint16)
+        actual = gtr.downsample_fractions_2d(src, 2, 2, [10, 20, 30, 40, 50, 60, 0])
+        assert_almost_equal(actual, [[[0.75, 0.0], [0.0, 0.0]],
+                                     [[0.25, 0.25], [0.0, 0.0]],
+                                     [[0.0, 0.75], [0.0, 0.0]],
+                                     [[0.0, 0.0], [1.0, 0.75]],
+                                     [[0.0, 0.0], [0.0, 0.25]],
+                                     [[0.0, 0.0], [0.0, 0.0]],
+                                     [[0.0, 0.0], [0.0, 0.0]]])
+
+    def test_fractional_weights(self):
+        src = make_src((30, 25), 31, v_max=5, dtype=np.uint8)
+        actual = gtr.downsample_fractions_2d(src, 7, 9, range(6))
+        assert_almost_equal(actual.sum(axis=0), np.ones((9, 7)))
+        # Class fractions are class means
+        for c in range(6):
+            assert_almost_equal(actual[c], gtr.downsample_2d((src == c).astype(np.float64), 7, 9, method=gtr.DS_MEAN))
+
+    def test_masked(self):
+        src = np.ma.array(make_src((8, 8), 31, v_max=5, dtype=np.uint8), mask=np.zeros((8, 8), dtype=bool))
+        src.mask[:4, :4] = True
+        src.mask[4:, 4:6] = True
+        actual = gtr.downsample_fractions_2d(src, 2, 2, range(6))
+        assert_equal(actual[:, 0, 0], np.nan)
+        assert_almost_equal(actual.sum(axis=0)[1:], np.ones((1, 2)))
+        assert_almost_equal(actual[:, 1, 1].sum(), 1.0)
+
+    def test_parallel(self):
+        src = make_src((40, 30), 31, v_max=20, dtype=np.uint8)
+        desired = gtr.downsample_fractions_2d(src, 7, 9, range(21))
+        actual = gtr.downsample_fractions_2d(src, 7, 9, range(21), parallel=True, num_threads=4)
+        assert_equal(actual, desired)
+        desired = gtr.downsample_modes_2d(src, 7, 9, 4)
+        actual = gtr.downsample_modes_2d(src, 7, 9, 4, parallel=True, num_threads=4)
+        assert_equal(actual, desired)
@@ -0,0 +1,113 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+
+def _quantile(src, valid, w, h, q, fill_value):
+    # Reference: sort the valid values of each target cell and cumulate their weights
+    y_idx, y_wgt, x_idx, x_wgt = gtr._get_ds_tables(src.shape, (h, w))
+    out = np.zeros((h, w), dtype=src.dtype)
+    for out_y in range(h):
+        for out_x in range(w):
+            pairs = []
+            for src_y in range(y_idx[out_y, 0], y_idx[out_y, 1] + 1):
+                wy = y_wgt[out_y, 0] if src_y == y_idx[out_y, 0] else \
+                    y_wgt[out_y, 1] if src_y == y_idx[out_y, 1] else 1.0
+                for src_x in range(x_idx[out_x, 0], x_idx[out_x, 1] + 1):
+                    wx = x_wgt[out_x, 0] if src_x == x_idx[out_x, 0] else \
+                        x_wgt[out_x, 1] if src_x == x_idx[out_x, 1] else 1.0
+                    if valid[src_y, src_x]:
+                        pairs.append((src[src_y, src_x], wx * wy))
+            if not pairs:
+                out[out_y, out_x] = fill_value
+                continue
+            pairs.sort(key=lambda pair: pair[0])
+            target = q * sum(weight for _, weight in pairs) * (1.0 - gtr._EPS)
+            w_below = 0.0
+            for v, weight in pairs:
+                w_below += weight
+                if w_below >= target:
+                    break
+            out[out_y, out_x] = v
+    return out
+
+
+class WeightedSelectTest(unittest.TestCase):
+    def test_select(self):
+        rs = np.random.RandomState(2)
+        for count in (1, 5, 16, 17, 100, 1000):
+            values = rs.randint(0, 50, size=count).astype(np.float64)
+            weights = rs.rand(count)
+            order = np.argsort(values, kind='stable')
+            cumulated = np.cumsum(weights[order])
+            for q in (0.0, 0.1, 0.5, 0.9, 1.0):
+                target = q * cumulated[-1] * (1.0 - gtr._EPS)
+                desired = values[order][min(np.searchsorted(cumulated, target), count - 1)]
+                self.assertEqual(gtr._weighted_select(values.copy(), weights.copy(), count, target), desired)
+
+
+class DownsampleQuantilesTest(unittest.TestCase):
+    def test_median_unweighted(self):
+        src = np.array([[1., 5., 2., 2.],
+                        [3., 4., 2., 8.],
+                        [9., 9., 1., 2.],
+                        [7., 7., 3., 4.]])
+        # Lower median for an even number of values
+        assert_equal(gtr.downsample_2d(src, 2, 2, method=gtr.DS_MEDIAN), [[3., 2.], [7., 2.]])
+
+    def test_fractional_weights(self):
+        rs = np.random.RandomState(8)
+        src = rs.rand(61, 47)
+        src[rs.rand(61, 47) < 0.2] = np.nan
+        src[:20, :20] = np.nan
+        for w, h in ((1, 1), (5, 7), (13, 10), (46, 60)):
+            actual = gtr.downsample_quantiles_2d(src, w, h, (0.1, 0.5, 0.9), fill_value=-1.)
+            for k, q in enumerate((0.1, 0.5, 0.9)):
+                assert_equal(actual[k], _quantile(src, np.isfinite(src), w, h, q, -1.))
+            assert_equal(actual[1], gtr.downsample_2d(src, w, h, method=gtr.DS_MEDIAN, fill_value=-1.))
+
+    def test_extremes(self):
+        src = np.random.RandomState(1).rand(40, 30)
+        actual = gtr.downsample_quantiles_2d(src, 7, 9, (0.0, 1.0))
+        assert_equal(actual[0], gtr.downsample_2d(src, 7, 9, method=gtr.DS_MIN))
+        assert_equal(actual[1], gtr.downsample_2d(src, 7, 9, method=gtr.DS_MAX))
+
+    def test_integers(self):
+        rs = np.random.RandomState(6)
+        for dtype, v_max in ((np.uint8, 5), (np.int16, 200), (np.int32, 60000), (np.int64, 10 ** 9)):
+            src = rs.randint(0, v_max, size=(40, 30)).astype(dtype)
+            valid = np.ones(src.shape, dtype=bool)
+            for w, h in ((7, 9), (6, 8), (2, 2)):
+                actual = gtr.downsample_quantiles_2d(src, w, h, (0.0, 0.25, 0.5, 1.0))
+                self.assertEqual(actual.dtype, dtype)
+                for k, q in enumerate((0.0, 0.25, 0.5, 1.0)):
+                    assert_equal(actual[k], _quantile(src, valid, w, h, q, 0))
+
+    def test_mask(self):
+        rs = np.random.RandomState(4)
+        for dtype in (np.uint16, np.float32):
+            data = rs.randint(0, 100, size=(30, 25)).astype(dtype)
+            mask = rs.rand(30, 25) < 0.4
+            mask[:10, :10] = True
+            actual = gtr.downsample_2d(np.ma.array(data, mask=mask), 5, 6, method=gtr.DS_MEDIAN, fill_value=999)
+            desired = _quantile(data, ~mask, 5, 6, 0.5, 999)
+            assert_equal(actual.data, desired)
+            assert_equal(actual.mask, desired == 999)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_quantiles_2d(np.zeros((4, 4)), 2, 2, (0.5, 1.5))
+        with self.assertRaises(ValueError):
+            gtr.downsample_quantiles_2d(np.zeros((4, 4)), 2, 2, (np.nan,))
+        with self.assertRaises(ValueError):
+            gtr.downsample_quantiles_2d(np.zeros((4, 4)), 2, 2, (0.5,), out=np.zeros((2, 2, 2)))
+
+    def test_parallel(self):
+        rs = np.random.RandomState(3)
+        for src in (rs.rand(3, 40, 30), rs.randint(0, 1000, size=(3, 40, 30)).astype(np.int16)):
+            desired = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MEDIAN)
+            actual = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MEDIAN, parallel=True, num_threads=4)
+            assert_equal(actual, desired)
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class DownsampleMinMaxTest(unittest.TestCase):
+    def test_blocks(self):
+        src = make_src((40, 30), 13, nan_fraction=0.2)
+        src[:10, :10] = np.nan
+        for method, reduce in ((gtr.DS_MIN, np.nanmin), (gtr.DS_MAX, np.nanmax)):
+            actual = gtr.downsample_2d(src, 6, 8, method=method, fill_value=-1.)
+            desired = np.array([[reduce(src[y:y + 5, x:x + 5]) if x >= 10 or y >= 10 else -1.
+                                 for x in range(0, 30, 5)] for y in range(0, 40, 5)])
+            assert_equal(actual, desired)
+
+    def test_fractional_weights(self):
+        # Partly covered cells take part with any weight
+        src = np.arange(25, dtype=np.int16).reshape((5, 5))
+        assert_equal(gtr.downsample_2d(src, 2, 2, method=gtr.DS_MIN), [[0, 2], [10, 12]])
+        assert_equal(gtr.downsample_2d(src, 2, 2, method=gtr.DS_MAX), [[12, 14], [22, 24]])
+
+    def test_mask(self):
+        src = np.ma.array(np.arange(16.).reshape((4, 4)), mask=np.zeros((4, 4), dtype=bool))
+        src.mask[0, 0] = True
+        src.mask[2:, 2:] = True
+        actual = gtr.downsample_2d(src, 2, 2, method=gtr.DS_MIN, fill_value=-1.)
+        assert_equal(actual.data, [[1., 2.], [8., -1.]])
+        assert_equal(actual.mask, [[False, False], [False, True]])
+
+
+class DownsampleStatsTest(unittest.TestCase):
+    def test_equals_methods(self):
+        src = make_src((40, 30), 13, nan_fraction=0.2)
+        src[:10, :10] = np.nan
+        for w, h in ((7, 9), (6, 8), (1, 1)):
+            actual = gtr.downsample_stats_2d(src, w, h, fill_value=-1.)
+            self.assertEqual(sorted(actual), sorted(gtr.STATS))
+            for name, method in (('mean', gtr.DS_MEAN), ('var', gtr.DS_VAR), ('std', gtr.DS_STD),
+                                 ('min', gtr.DS_MIN), ('max', gtr.DS_MAX)):
+                assert_almost_equal(actual[name], gtr.downsample_2d(src, w, h, method=method, fill_value=-1.))
+            count = gtr.downsample_2d(np.isfinite(src).astype(np.float64), w, h, method=gtr.DS_MEAN)
+            assert_almost_equal(actual['count'], count * (40. / h) * (30. / w))
+
+    def test_subset_and_out(self):
+        src = make_src((40, 30), 13, nan_fraction=0.2)
+        src[:10, :10] = np.nan
+        out = {'max': np.zeros((8, 6), dtype=np.float32)}
+        actual = gtr.downsample_stats_2d(src, 6, 8, stats=('max', 'count'), out=out)
+        self.assertEqual(sorted(actual), ['count', 'max'])
+        self.assertIs(actual['max'], out['max'])
+        assert_equal(actual['max'], gtr.downsample_2d(src, 6, 8, method=gtr.DS_MAX, fill_value=np.nan)
+                     .astype(np.float32))
+        assert_equal(actual['max'][0, 0], np.nan)
+        assert_equal(actual['count'][0, 0], 0.0)
+
+    def test_out_is_written_in_place(self):
+        src = make_src((40, 30), 13, nan_fraction=0.2)
+        src[:10, :10] = np.nan
+        out = {'mean': np.zeros((6, 8)).T, 'count': np.zeros((8, 6))}
+        actual = gtr.downsample_stats_2d(src, 6, 8, stats=('mean', 'count', 'min'), out=out)
+        self.assertIs(actual['mean'], out['mean'])
+        self.assertIs(actual['count'], out['count'])
+        self.assertEqual(actual['min'].dtype, np.float64)
+        assert_almost_equal(out['mean'], gtr.downsample_2d(src, 6, 8, method=gtr.DS_MEAN, fill_value=np.nan))
+        assert_equal(out['count'][0, 0], 0.0)
+
+    def test_masked_integers(self):
+        src = np.ma.array(np.arange(16, dtype=np.uint8).reshape((4, 4)), mask=np.zeros((4, 4), dtype=bool))
+        src.mask[:2, :2] = True
+        actual = gtr.downsample_stats_2d(src, 2, 2)
+        assert_equal(actual['count'], [[0., 4.], [4., 4.]])
+        assert_equal(actual['min'], [[np.nan, 2.], [8., 10.]])
+        assert_almost_equal(actual['mean'], [[np.nan, 4.5], [10.5, 12.5]])
+        assert_almost_equal(actual['var'], [[np.nan, 4.25], [4.25, 4.25]])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, stats=('median',))
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, out={'mean': np.zeros((3, 3))})
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, out={'count': np.zeros((2, 2), dtype=np.int32)})
+        read_only = np.zeros((2, 2))
+        read_only.flags.writeable = False
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, out={'mean': read_only})
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, stats=('mean',), out={'std': np.zeros((2, 2))})
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, out={'median': np.zeros((2, 2))})
+
+    def test_parallel(self):
+        src = make_src((40, 30), 13, nan_fraction=0.2)
+        src[:10, :10] = np.nan
+        desired = gtr.downsample_stats_2d(src, 7, 9)
+        actual = gtr.downsample_stats_2d(src, 7, 9, parallel=True, num_threads=4)
+        for name in gtr.STATS:
+            assert_equal(actual[name], desired[name])
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class DownsampleTiledTest(unittest.TestCase):
+    def test_identical_to_in_memory(self):
+        src = make_src((97, 61), 37, v_max=6, nan_fraction=0.2)
+        row_bytes = 61 * 8
+        for method in (gtr.DS_FIRST, gtr.DS_MIN, gtr.DS_MEAN, gtr.DS_MEDIAN, gtr.DS_MODE, gtr.DS_VAR):
+            for w, h in ((13, 11), (61, 97), (1, 1)):
+                desired = gtr.downsample_2d(src, w, h, method=method, fill_value=-1.)
+                for tile_rows in (1, 5, 16, 200):
+                    actual = gtr.downsample_tiled_2d(src, w, h, method=method, fill_value=-1.,
+                                                     tile_bytes=tile_rows * row_bytes)
+                    assert_equal(actual, desired)
+
+    def test_unit_weights_of_blocks(self):
+        # Some row blocks have unit weights, the whole grid hasn't
+        src = make_src((40, 30), 37, v_max=6, nan_fraction=0.2)
+        desired = gtr.downsample_2d(src, 10, 15, method=gtr.DS_STD, fill_value=-1.)
+        actual = gtr.downsample_tiled_2d(src, 10, 15, method=gtr.DS_STD, fill_value=-1., tile_bytes=3 * 30 * 8)
+        assert_equal(actual, desired)
+
+    def test_histogram_range_of_whole_grid(self):
+        # Each strip spans a narrow value range, the whole grid a range too wide for histograms
+        src = (np.arange(60, dtype=np.int64) * 10000).reshape((60, 1)) + make_src((60, 20), 37, v_max=6, dtype=np.int64)
+        self.assertIsNone(gtr._get_histogram_range(src, 7))
+        self.assertEqual(gtr._get_histogram_range(src[:30], 7), gtr._get_histogram_range(src[:30]))
+        for method in (gtr.DS_MODE, gtr.DS_MEDIAN):
+            desired = gtr.downsample_2d(src, 7, 9, method=method, mode_rank=2)
+            with mock.patch.object(gtr, '_get_histogram_range', wraps=gtr._get_histogram_range) as get_range:
+                actual = gtr.downsample_tiled_2d(src, 7, 9, method=method, mode_rank=2, tile_bytes=7 * 20 * 8)
+            self.assertEqual(get_range.call_count, 1)
+            assert_equal(actual, desired)
+
+    def test_memmap(self):
+        src = make_src((120, 50), 37, v_max=6, dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_map = np.memmap(os.path.join(tmp_dir, 'src.raw'), dtype=np.uint8, mode='w+', shape=src.shape)
+            src_map[...] = src
+            valid_map = np.memmap(os.path.join(tmp_dir, 'valid.raw'), dtype=np.bool_, mode='w+', shape=src.shape)
+            valid_map[...] = src != 3
+            out_map = np.memmap(os.path.join(tmp_dir, 'out.raw'), dtype=np.uint8, mode='w+', shape=(9, 7))
+            out_valid_map = np.memmap(os.path.join(tmp_dir, 'out_valid.raw'), dtype=np.bool_, mode='w+',
+                                      shape=(9, 7))
+            actual = gtr.downsample_tiled_2d(src_map, 7, 9, method=gtr.DS_MODE, fill_value=99, out=out_map,
+                                             tile_bytes=1000, valid=valid_map, out_valid=out_valid_map)
+            self.assertIs(actual, out_map)
+            desired = gtr.downsample_2d(np.ma.array(src, mask=src == 3), 7, 9, method=gtr.DS_MODE, fill_value=99)
+            assert_equal(np.array(out_map), desired.data)
+            assert_equal(np.array(out_valid_map), ~desired.mask)
+            del src_map, valid_map, out_map, out_valid_map, actual
+
+    def test_transform(self):
+        src = make_src((30, 30), 37, v_max=6, nan_fraction=0.2)
+        src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 3.0)
+        out_transform = (0.25, 0.0, 0.2, 0.0, -0.25, 2.8)
+        desired = gtr.downsample_2d(src, 9, 10, fill_value=-1., src_transform=src_transform,
+                                    out_transform=out_transform)
+        actual = gtr.downsample_tiled_2d(src, 9, 10, fill_value=-1., src_transform=src_transform,
+                                         out_transform=out_transform, tile_bytes=4 * 30 * 8)
+        assert_equal(actual, desired)
+
+    def test_parallel(self):
+        src = make_src((97, 61), 37, v_max=6, nan_fraction=0.2)
+        desired = gtr.downsample_2d(src, 13, 11, fill_value=-1.)
+        actual = gtr.downsample_tiled_2d(src, 13, 11, fill_value=-1., tile_bytes=20 * 61 * 8, parallel=True,
+                                         num_threads=4)
+        assert_equal(actual, desired)
@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class DownsampleWindowTest(unittest.TestCase):
+    def test_windows(self):
+        src = make_src((90, 70), 37, v_max=8, nan_fraction=0.1)
+        for method in (gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_MEDIAN, gtr.DS_STD, gtr.DS_MAX):
+            # Integer factor, fractional factor, and a single target cell
+            for w, h in ((35, 30), (13, 17), (1, 1)):
+                desired = gtr.downsample_2d(src, w, h, method=method, fill_value=-1.)
+                for x, y, win_w, win_h in ((0, 0, w, h), (w // 2, h // 3, (w + 1) // 2, h // 3 + 1),
+                                           (w - 1, h - 1, 1, 1)):
+                    actual = gtr.downsample_window_2d(src, w, h, (x, y, win_w, win_h), method=method, fill_value=-1.)
+                    assert_equal(actual, desired[y:y + win_h, x:x + win_w])
+
+    def test_transform(self):
+        src = make_src((30, 30), 37, v_max=8, nan_fraction=0.1)
+        src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 3.0)
+        out_transform = (0.3, 0.0, 0.3, 0.0, -0.3, 3.0)
+        desired = gtr.downsample_2d(src, 9, 10, src_transform=src_transform, out_transform=out_transform)
+        actual = gtr.downsample_window_2d(src, 9, 10, (2, 3, 5, 4),
+                                          src_transform=src_transform, out_transform=out_transform)
+        assert_equal(actual, desired[3:7, 2:7])
+
+    def test_masked_and_valid(self):
+        src = make_src((40, 50), 37, v_max=8, nan_fraction=0.1)
+        mask = np.isnan(src)
+        desired = gtr.downsample_2d(np.ma.array(src, mask=mask), 15, 12, fill_value=-1.)
+        actual = gtr.downsample_window_2d(np.ma.array(src, mask=mask), 15, 12, (3, 4, 8, 6), fill_value=-1.)
+        assert_equal(actual.mask, desired.mask[4:10, 3:11])
+        assert_equal(actual.data, desired.data[4:10, 3:11])
+        out = np.zeros((6, 8))
+        out_valid = np.zeros((6, 8), dtype=bool)
+        actual = gtr.downsample_window_2d(np.nan_to_num(src), 15, 12, (3, 4, 8, 6), fill_value=-1., out=out,
+                                          valid=~mask, out_valid=out_valid)
+        self.assertIs(actual, out)
+        assert_equal(out_valid, ~desired.mask[4:10, 3:11])
+        assert_equal(actual, desired.data[4:10, 3:11])
+
+    def test_no_op(self):
+        src = make_src((20, 30), 37, v_max=8, nan_fraction=0.1)
+        assert_equal(gtr.downsample_window_2d(src, 30, 20, (5, 6, 10, 4)), src[6:10, 5:15])
+
+    def test_invalid(self):
+        src = make_src((20, 30), 37, v_max=8, nan_fraction=0.1)
+        with self.assertRaises(ValueError):
+            gtr.downsample_window_2d(src, 10, 10, (5, 6, 10, 4))
+        with self.assertRaises(ValueError):
+            gtr.downsample_window_2d(src, 10, 10, (-1, 0, 2, 2))
+        with self.assertRaises(ValueError):
+            gtr.downsample_window_2d(src, 10, 10, (0, 0, 2, 2), out=np.zeros((10, 10)))
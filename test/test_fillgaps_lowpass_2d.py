@@ -1,7 +1,7 @@
 import unittest
 
 import numpy as np
-from numpy.testing import assert_almost_equal
+from numpy.testing import assert_almost_equal, assert_array_equal
 
 import gridtools.gapfilling as gtg
 
@@ -10,6 +10,30 @@ GAP = np.nan
 KERNEL = np.ones((3, 3), dtype=np.float64)
 
 
+def _fillgaps_full_passes(src, kernel, threshold):
+    # Reference: low-pass filter passes over the whole grid until no more gaps are filled
+    data = np.array(src)
+    h, w = data.shape
+    kh, kw = kernel.shape
+    while True:
+        out = data.copy()
+        for y, x in zip(*np.nonzero(~np.isfinite(data))):
+            v_sum = 0.
+            k_sum = 0.
+            for ky in range(kh):
+                for kx in range(kw):
+                    yy = y + ky - kh // 2
+                    xx = x + kx - kw // 2
+                    if 0 <= yy < h and 0 <= xx < w and np.isfinite(data[yy, xx]):
+                        v_sum += kernel[ky, kx] * data[yy, xx]
+                        k_sum += kernel[ky, kx]
+            if k_sum != 0 and k_sum >= threshold:
+                out[y, x] = v_sum / k_sum
+        if np.array_equal(out, data, equal_nan=True):
+            return out
+        data = out
+
+
 class FillgapsLowpass2d(unittest.TestCase):
     def _test_fillgaps(self, src, desired_out, desired_gaps_filled):
         src = np.array(src)
@@ -121,3 +145,57 @@ class FillgapsLowpass2d(unittest.TestCase):
                              [5.0, F1_, F2_, F3_],
                              [9.0, F4_, F6_, F7_],
                              [13., F5_, F8_, F9_]], 9)
+
+    def test_equals_full_passes(self):
+        rs = np.random.RandomState(11)
+        for kernel, threshold in ((gtg.DEFAULT_KERNEL, 1), (rs.rand(5, 3), 1), (rs.rand(2, 4), 0.5)):
+            for h, w in ((1, 7), (13, 17), (20, 20)):
+                src = rs.rand(h, w)
+                src[rs.rand(h, w) < 0.6] = GAP
+                src[h // 4:h // 2, w // 4:w // 2] = GAP
+                assert_array_equal(gtg.fillgaps_lowpass_2d(src, kernel=kernel, threshold=threshold),
+                                   _fillgaps_full_passes(src, kernel, threshold))
+
+    def test_stall(self):
+        # The isolated pixel never reaches the threshold, which used to loop forever
+        src = np.full((5, 5), GAP)
+        src[2, 2] = 1.0
+        out, info = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, threshold=2, return_info=True)
+        assert_array_equal(out, src)
+        self.assertEqual(info.iterations, 1)
+        self.assertEqual(info.gap_count, 24)
+        self.assertTrue(info.stalled)
+        self.assertFalse(info.truncated)
+
+    def test_max_iter_and_progress(self):
+        src = np.full((1, 10), GAP)
+        src[0, 0] = 1.0
+        reports = []
+        out, info = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, max_iter=4, return_info=True,
+                                            progress=lambda i, gap_count: reports.append((i, gap_count)))
+        self.assertEqual(gtg.count_gaps(out), 5)
+        self.assertEqual(reports, [(1, 8), (2, 7), (3, 6), (4, 5)])
+        self.assertEqual(info[:4], (4, 5, False, True))
+        self.assertEqual(len(info.times), 4)
+        out, info = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, return_info=True)
+        self.assertEqual(info[:4], (9, 0, False, False))
+        out, info = gtg.fillgaps_lowpass_2d(np.full((3, 3), GAP), return_info=True)
+        self.assertEqual(info[:4], (0, 9, False, False))
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_lowpass_2d(src, max_iter=-1)
+
+    def test_separable(self):
+        self.assertIsNone(gtg._get_separable_factors(gtg.DEFAULT_KERNEL))
+        assert_array_equal(gtg._get_separable_factors(KERNEL), (np.ones(3), np.ones(3)))
+        rs = np.random.RandomState(13)
+        kernel = np.outer(rs.rand(5), rs.rand(3))
+        kernel_y, kernel_x = gtg._get_separable_factors(kernel)
+        assert_almost_equal(np.outer(kernel_y, kernel_x), kernel)
+        for kernel, threshold in ((KERNEL, 2), (kernel, 0.5), (np.ones((1, 4)), 1)):
+            src = rs.rand(20, 20)
+            src[rs.rand(20, 20) < 0.6] = GAP
+            src[5:12, 4:15] = GAP
+            actual = gtg.fillgaps_lowpass_2d(src, kernel=kernel, threshold=threshold)
+            desired = _fillgaps_full_passes(src, kernel, threshold)
+            assert_array_equal(np.isnan(actual), np.isnan(desired))
+            assert_almost_equal(actual, desired)
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_array_equal
+
+import gridtools.gapfilling as gtg
+
+GAP = np.nan
+
+
+def _distances(valid):
+    # Reference: squared distances to the nearest valid pixel by brute force
+    vy, vx = np.nonzero(valid)
+    y, x = np.indices(valid.shape)
+    return ((y[..., np.newaxis] - vy) ** 2 + (x[..., np.newaxis] - vx) ** 2).min(axis=-1)
+
+
+class FillgapsNearest2d(unittest.TestCase):
+    def test_example(self):
+        src = np.array([[1.0, GAP, GAP, GAP],
+                        [GAP, GAP, GAP, GAP],
+                        [GAP, GAP, GAP, 2.0]])
+        out, distances = gtg.fillgaps_nearest_2d(src, return_distances=True)
+        assert_array_equal(out, [[1.0, 1.0, 1.0, 2.0],
+                                 [1.0, 1.0, 2.0, 2.0],
+                                 [1.0, 2.0, 2.0, 2.0]])
+        assert_almost_equal(distances, np.sqrt([[0, 1, 4, 4],
+                                                [1, 2, 2, 1],
+                                                [4, 4, 1, 0]]))
+
+    def test_random(self):
+        rs = np.random.RandomState(43)
+        for h, w, gap_fraction in ((1, 9, 0.5), (9, 1, 0.5), (20, 30, 0.9), (25, 25, 0.99), (16, 12, 0.3)):
+            src = rs.rand(h, w)
+            src[rs.rand(h, w) < gap_fraction] = GAP
+            src.flat[rs.randint(h * w)] = 0.5
+            valid = np.isfinite(src)
+            out, distances = gtg.fillgaps_nearest_2d(src, return_distances=True)
+            desired = _distances(valid)
+            assert_almost_equal(distances ** 2, desired)
+            assert_array_equal(out[valid], src[valid])
+            # Each gap takes the value of a valid pixel at the minimum distance
+            for y, x in zip(*np.nonzero(~valid)):
+                vy, vx = np.nonzero(valid & (src == out[y, x]))
+                self.assertIn(desired[y, x], (vy - y) ** 2 + (vx - x) ** 2)
+
+    def test_classes(self):
+        src = np.array([[3, 0, 0],
+                        [0, 0, 0],
+                        [0, 0, 7]], dtype=np.uint8)
+        out = gtg.fillgaps_nearest_2d(src, valid=src != 0)
+        self.assertEqual(out.dtype, np.uint8)
+        assert_array_equal(out, [[3, 3, 3],
+                                 [3, 3, 7],
+                                 [3, 7, 7]])
+
+    def test_no_valid(self):
+        src = np.full((3, 4), GAP)
+        out, distances = gtg.fillgaps_nearest_2d(src, return_distances=True)
+        assert_array_equal(out, src)
+        self.assertTrue(np.all(np.isinf(distances)))
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_nearest_2d(src, valid=np.ones((4, 3), dtype=bool))
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_array_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+
+from . import make_src
+
+GAP = np.nan
+
+
+class FillgapsNormconv2d(unittest.TestCase):
+    def test_equals_single_lowpass_pass(self):
+        src = make_src((40, 50), 41, nan_fraction=0.4)
+        src[10:20, 12:25] = GAP
+        rs = np.random.RandomState(5)
+        for kernel, threshold in ((gtg.DEFAULT_KERNEL, 1), (np.ones((11, 11)), 3), (rs.rand(7, 4), 0.5),
+                                  (np.ones((1, 15)), 1)):
+            desired = gtg.fillgaps_lowpass_2d(src, kernel=kernel, threshold=threshold, max_iter=1)
+            assert_array_equal(gtg.fillgaps_normconv_2d(src, kernel=kernel, threshold=threshold, fft=False),
+                               desired)
+            actual = gtg.fillgaps_normconv_2d(src, kernel=kernel, threshold=threshold, fft=True)
+            assert_equal(np.isnan(actual), np.isnan(desired))
+            assert_almost_equal(actual, desired)
+
+    def test_single_pass(self):
+        # All gaps within the kernel radius are filled at once, the others are left
+        src = np.full((40, 40), GAP)
+        src[20, 20] = 2.0
+        kernel = np.ones((15, 15))
+        actual = gtg.fillgaps_normconv_2d(src, kernel=kernel)
+        desired = np.full((40, 40), GAP)
+        desired[13:28, 13:28] = 2.0
+        assert_almost_equal(actual, desired)
+
+    def test_no_gaps_and_no_valid(self):
+        src = make_src((20, 20), 41)
+        src[...] = 1.0
+        assert_array_equal(gtg.fillgaps_normconv_2d(src, kernel=np.ones((11, 11))), src)
+        src[...] = GAP
+        assert_array_equal(gtg.fillgaps_normconv_2d(src, kernel=np.ones((11, 11))), src)
+
+    def test_fft_size(self):
+        self.assertEqual([gtg._get_fft_size(n) for n in (1, 7, 11, 17, 2002)], [1, 8, 12, 18, 2025])
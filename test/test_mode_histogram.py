@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+def _mode(src, mask, w, h, mode_rank, fill_value):
+    # Reference: weights per value in order of first occurrence, ranked by decreasing weight
+    y_idx, y_wgt, x_idx, x_wgt = gtr._get_ds_tables(src.shape, (h, w))
+    out = np.zeros((h, w), dtype=src.dtype)
+    for out_y in range(h):
+        for out_x in range(w):
+            weights = {}
+            for src_y in range(y_idx[out_y, 0], y_idx[out_y, 1] + 1):
+                wy = y_wgt[out_y, 0] if src_y == y_idx[out_y, 0] else \
+                    y_wgt[out_y, 1] if src_y == y_idx[out_y, 1] else 1.0
+                for src_x in range(x_idx[out_x, 0], x_idx[out_x, 1] + 1):
+                    wx = x_wgt[out_x, 0] if src_x == x_idx[out_x, 0] else \
+                        x_wgt[out_x, 1] if src_x == x_idx[out_x, 1] else 1.0
+                    if not mask[src_y, src_x]:
+                        v = src[src_y, src_x]
+                        weights[v] = weights.get(v, 0.0) + wx * wy
+            ranked = sorted(weights.items(), key=lambda item: -item[1])
+            out[out_y, out_x] = ranked[mode_rank - 1][0] if len(ranked) >= mode_rank else fill_value
+    return out
+
+
+class ModeHistogramTest(unittest.TestCase):
+    def test_histogram_range(self):
+        self.assertEqual(gtr._get_histogram_range(np.array([[3, -2], [7, 0]], dtype=np.int16)), (-2, 10))
+        self.assertIsNone(gtr._get_histogram_range(np.array([[3., 1.]])))
+        self.assertIsNone(gtr._get_histogram_range(np.array([[0, 70000]], dtype=np.int32)))
+
+    def test_fractional_weights(self):
+        no_mask = np.zeros((30, 25), dtype=bool)
+        for dtype in (np.uint8, np.int16, np.uint16, np.int32):
+            src = make_src((30, 25), 23, v_max=7, dtype=dtype)
+            for w, h in ((7, 9), (10, 10), (1, 1)):
+                for mode_rank in (1, 2, 3):
+                    actual = gtr.downsample_2d(src, w, h, method=gtr.DS_MODE, fill_value=99, mode_rank=mode_rank)
+                    assert_equal(actual, _mode(src, no_mask, w, h, mode_rank, 99))
+
+    def test_weights_are_not_truncated(self):
+        # Target cell (0, 0) covers source cell (0, 0) of class 1 with weight 1 and the three partly covered
+        # cells of class 2 with weights 2/3, 2/3 and 4/9
+        src = np.array([[1, 2, 0, 0, 0],
+                        [2, 2, 0, 0, 0],
+                        [0, 0, 0, 0, 0],
+                        [0, 0, 0, 0, 0],
+                        [0, 0, 0, 0, 0]], dtype=np.uint8)
+        mask = src == 0
+        for dtype in (np.uint8, np.float64):
+            actual = gtr.downsample_2d(np.ma.array(src.astype(dtype), mask=mask), 3, 3, method=gtr.DS_MODE,
+                                       fill_value=9)
+            assert_equal(actual.data, _mode(src, mask, 3, 3, 1, 9))
+            self.assertEqual(actual[0, 0], 2)
+
+    def test_mask(self):
+        src = make_src((30, 25), 23, v_min=60000, v_max=60010, dtype=np.uint16)
+        mask = np.random.RandomState(4).rand(30, 25) < 0.4
+        mask[:10, :10] = True
+        actual = gtr.downsample_2d(np.ma.array(src, mask=mask), 5, 6, method=gtr.DS_MODE, fill_value=7)
+        desired = _mode(src, mask, 5, 6, 1, 7)
+        assert_equal(actual.data, desired)
+        assert_equal(actual.mask, desired == 7)
+
+    def test_negative_values(self):
+        src = make_src((20, 20), 23, v_min=-1000, v_max=-995, dtype=np.int32)
+        assert_equal(gtr.downsample_2d(src, 6, 6, method=gtr.DS_MODE),
+                     _mode(src, np.zeros(src.shape, dtype=bool), 6, 6, 1, 0))
+
+    def test_wide_range_falls_back(self):
+        src = make_src((20, 20), 23, v_max=7, dtype=np.int64) * 100000
+        for mode_rank in (1, 2, 3):
+            assert_equal(gtr.downsample_2d(src, 6, 6, method=gtr.DS_MODE, mode_rank=mode_rank),
+                         _mode(src, np.zeros(src.shape, dtype=bool), 6, 6, mode_rank, 0))
+
+    def test_float_mode_rank(self):
+        no_mask = np.zeros((30, 25), dtype=bool)
+        src = make_src((30, 25), 23, v_max=7, dtype=np.float64)
+        for w, h in ((7, 9), (1, 1)):
+            for mode_rank in (1, 2, 3):
+                actual = gtr.downsample_2d(src, w, h, method=gtr.DS_MODE, fill_value=99, mode_rank=mode_rank)
+                assert_equal(actual, _mode(src, no_mask, w, h, mode_rank, 99))
+        row = np.array([[1, 1, 1, 2, 2, 3, 3, 3, 3, 3]])
+        for dtype in (np.int32, np.float64):
+            actual = [gtr.downsample_2d(row.astype(dtype), 1, 1, method=gtr.DS_MODE, mode_rank=mode_rank)[0, 0]
+                      for mode_rank in (1, 2, 3)]
+            assert_equal(actual, [3, 1, 2])
+
+    def test_parallel(self):
+        src = make_src((3, 30, 25), 23, v_max=7, dtype=np.uint8)
+        desired = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MODE)
+        actual = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MODE, parallel=True, num_threads=4)
+        assert_equal(actual, desired)
@@ -0,0 +1,119 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class OutputMaskTest(unittest.TestCase):
+    def test_value_equal_to_fill_value(self):
+        # A valid aggregate that equals fill_value must not be masked
+        src = np.ma.array(np.zeros((8, 8)), mask=np.zeros((8, 8), dtype=bool))
+        src.mask[:4, :4] = True
+        for method in (gtr.DS_MEAN, gtr.DS_MIN, gtr.DS_MEDIAN, gtr.DS_MODE, gtr.DS_VAR):
+            actual = gtr.downsample_2d(src, 2, 2, method=method, fill_value=0.)
+            assert_equal(actual.mask, [[True, False], [False, False]])
+        actual = gtr.upsample_2d(src, 16, 16, method=gtr.US_NEAREST, fill_value=0.)
+        assert_equal(actual.mask, np.repeat(np.repeat(src.mask, 2, axis=0), 2, axis=1))
+
+    def test_valid(self):
+        data = make_src((30, 25), 29, v_max=4)
+        mask = make_src((30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        src = np.ma.array(data, mask=mask)
+        for method in (gtr.DS_FIRST, gtr.DS_MAX, gtr.DS_MEAN, gtr.DS_MEDIAN, gtr.DS_MODE, gtr.DS_STD):
+            for w, h in ((7, 9), (5, 5)):
+                desired = gtr.downsample_2d(src, w, h, method=method, fill_value=-1.)
+                actual = gtr.downsample_2d(data, w, h, method=method, fill_value=-1., valid=~mask)
+                self.assertNotIsInstance(actual, np.ma.MaskedArray)
+                assert_almost_equal(actual, desired.data)
+        for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            for w, h in ((60, 50), (10, 50)):
+                desired = gtr.resample_2d(src, w, h, us_method=us_method, fill_value=-1.)
+                actual = gtr.resample_2d(data, w, h, us_method=us_method, fill_value=-1., valid=~mask)
+                assert_almost_equal(actual, desired.data)
+
+    def test_valid_and_mask(self):
+        data = make_src((30, 25), 29, v_max=4)
+        mask = make_src((30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        valid = np.ones(mask.shape, dtype=bool)
+        valid[20:, 20:] = False
+        actual = gtr.downsample_2d(np.ma.array(data, mask=mask), 5, 6, fill_value=-1., valid=valid)
+        desired = gtr.downsample_2d(np.ma.array(data, mask=mask | ~valid), 5, 6, fill_value=-1.)
+        assert_equal(actual.mask, desired.mask)
+        assert_almost_equal(actual.data, desired.data)
+        with self.assertRaises(ValueError):
+            gtr.downsample_2d(data, 5, 6, valid=valid[1:])
+
+    def test_out_valid(self):
+        data = make_src((30, 25), 29, v_max=4)
+        mask = make_src((30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        src = np.ma.array(data, mask=mask)
+        for w, h in ((5, 6), (50, 60), (10, 60), (50, 6)):
+            desired = gtr.resample_2d(src, w, h, fill_value=-1.)
+            out_valid = np.zeros((h, w), dtype=bool)
+            actual = gtr.resample_2d(data, w, h, fill_value=-1., valid=~mask, out_valid=out_valid)
+            assert_equal(out_valid, ~desired.mask)
+            assert_almost_equal(actual, desired.data)
+        out_valid = np.zeros((3, 1, 3), dtype=bool)
+        quantiles = gtr.downsample_quantiles_2d(src, 3, 1, [0.1, 0.5, 0.9], out_valid=out_valid)
+        assert_equal(out_valid, ~quantiles.mask)
+        with self.assertRaises(ValueError):
+            gtr.downsample_2d(data, 5, 6, out_valid=np.zeros((5, 6), dtype=bool))
+
+    def test_masked_out(self):
+        data = make_src((30, 25), 29, v_max=4)
+        mask = make_src((30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        src = np.ma.array(data, mask=mask)
+        out = np.ma.array(np.zeros((6, 5)), mask=np.ones((6, 5), dtype=bool))
+        actual = gtr.downsample_2d(src, 5, 6, fill_value=-1., out=out)
+        self.assertIs(actual, out)
+        assert_equal(out.mask, out.data == -1.)
+        self.assertTrue(np.any(out.mask) and not np.all(out.mask))
+
+    def test_no_copy(self):
+        data = make_src((30, 25), 29, v_max=4)
+        mask = make_src((30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        out = np.zeros((6, 5))
+        actual = gtr.downsample_2d(np.ma.array(data, mask=mask), 5, 6, fill_value=-1., out=out)
+        self.assertTrue(np.shares_memory(actual.data, out))
+
+    def test_regridder_and_summed_area_table(self):
+        data = make_src((2, 30, 25), 29, v_max=4)
+        mask = make_src((2, 30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        src = np.ma.array(data, mask=mask)
+        desired = gtr.downsample_nd(src, 5, 6, fill_value=-1.)
+        out_valid = np.zeros((2, 6, 5), dtype=bool)
+        actual = gtr.Regridder(src.shape, (6, 5), fill_value=-1.)(data, valid=~mask, out_valid=out_valid)
+        assert_equal(out_valid, ~desired.mask)
+        assert_almost_equal(actual, desired.data)
+        out_valid[...] = False
+        actual = gtr.SummedAreaTable(data, valid=~mask).downsample(5, 6, fill_value=-1., out_valid=out_valid)
+        assert_equal(out_valid, ~desired.mask)
+        assert_almost_equal(actual, desired.data)
+        actual = gtr.SummedAreaTable(src).downsample(5, 6, fill_value=-1.)
+        assert_equal(actual.mask, desired.mask)
+
+    def test_parallel(self):
+        data = make_src((3, 30, 25), 29, v_max=4)
+        mask = make_src((3, 30, 25), 30) < 0.3
+        mask[..., :8, :8] = True
+        src = np.ma.array(data, mask=mask)
+        for method in (gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_MEDIAN):
+            desired = gtr.downsample_nd(src, 7, 9, method=method, fill_value=-1.)
+            actual = gtr.downsample_nd(src, 7, 9, method=method, fill_value=-1., parallel=True, num_threads=4)
+            assert_equal(actual.mask, desired.mask)
+            assert_equal(actual.data, desired.data)
+        desired = gtr.resample_nd(src, 10, 50, fill_value=-1.)
+        actual = gtr.resample_nd(src, 10, 50, fill_value=-1., parallel=True, num_threads=4)
+        assert_equal(actual.mask, desired.mask)
+        assert_equal(actual.data, desired.data)
+
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+DS_METHODS = (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_VAR, gtr.DS_STD)
+US_METHODS = (gtr.US_NEAREST, gtr.US_LINEAR)
+
+
+class ParallelTest(unittest.TestCase):
+    def test_downsample_2d(self):
+        src = make_src((37, 29), 42, v_max=4, nan_fraction=0.1)
+        for method in DS_METHODS:
+            for num_threads in (1, 2, 3, 8, 64):
+                desired = gtr.downsample_2d(src, 11, 7, method=method, fill_value=-1.)
+                actual = gtr.downsample_2d(src, 11, 7, method=method, fill_value=-1.,
+                                           parallel=True, num_threads=num_threads)
+                assert_equal(actual, desired)
+
+    def test_downsample_2d_mode_rank(self):
+        src = make_src((37, 29), 42, v_max=4, nan_fraction=0.1)
+        desired = gtr.downsample_2d(src, 5, 4, method=gtr.DS_MODE, fill_value=-1., mode_rank=2)
+        actual = gtr.downsample_2d(src, 5, 4, method=gtr.DS_MODE, fill_value=-1., mode_rank=2,
+                                   parallel=True, num_threads=3)
+        assert_equal(actual, desired)
+
+    def test_downsample_2d_masked(self):
+        src = make_src((20, 20), 42, v_max=4, nan_fraction=0.1)
+        src = np.ma.array(src, mask=src == 2.)
+        desired = gtr.downsample_2d(src, 6, 7, method=gtr.DS_MEAN, fill_value=-1.)
+        actual = gtr.downsample_2d(src, 6, 7, method=gtr.DS_MEAN, fill_value=-1., parallel=True, num_threads=4)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, desired.mask)
+        assert_equal(actual, desired)
+
+    def test_upsample_2d(self):
+        src = make_src((13, 11), 42, v_max=4, nan_fraction=0.1)
+        for method in US_METHODS:
+            desired = gtr.upsample_2d(src, 31, 40, method=method, fill_value=-1.)
+            actual = gtr.upsample_2d(src, 31, 40, method=method, fill_value=-1., parallel=True, num_threads=4)
+            assert_equal(actual, desired)
+
+    def test_resample_2d(self):
+        src = make_src((13, 11), 42, v_max=4, nan_fraction=0.1)
+        for w, h in ((5, 4), (5, 30), (30, 4), (30, 40)):
+            desired = gtr.resample_2d(src, w, h, fill_value=-1.)
+            actual = gtr.resample_2d(src, w, h, fill_value=-1., parallel=True, num_threads=4)
+            assert_equal(actual, desired)
+
+    def test_default_num_threads(self):
+        src = make_src((13, 11), 42, v_max=4, nan_fraction=0.1)
+        desired = gtr.downsample_2d(src, 5, 4)
+        actual = gtr.downsample_2d(src, 5, 4, parallel=True)
+        assert_equal(actual, desired)
+
+    def test_invalid_num_threads(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_2d(make_src((13, 11), 42, v_max=4, nan_fraction=0.1), 5, 4, parallel=True, num_threads=0)
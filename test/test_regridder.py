@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class RegridderTest(unittest.TestCase):
+    def test_downsample(self):
+        src = make_src((13, 11), 3, v_max=4, nan_fraction=0.1)
+        for method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_VAR, gtr.DS_STD):
+            regridder = gtr.Regridder(src.shape, (5, 4), method=method, fill_value=-1.)
+            assert_equal(regridder(src), gtr.downsample_2d(src, 4, 5, method=method, fill_value=-1.))
+
+    def test_upsample(self):
+        src = make_src((5, 4), 3, v_max=4, nan_fraction=0.1)
+        for method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            regridder = gtr.Regridder(src.shape, (13, 11), method=method, fill_value=-1.)
+            assert_equal(regridder(src), gtr.upsample_2d(src, 11, 13, method=method, fill_value=-1.))
+
+    def test_transform(self):
+        src = make_src((4, 4), 3, v_max=4, nan_fraction=0.1)
+        src_transform = (1.0, 0.0, 0.0, 0.0, -1.0, 4.0)
+        out_transform = (1.0, 0.0, 0.5, 0.0, -1.0, 3.5)
+        regridder = gtr.Regridder((4, 4), (2, 2), src_transform=src_transform, out_transform=out_transform)
+        assert_equal(regridder(src),
+                     gtr.downsample_2d(src, 2, 2, src_transform=src_transform, out_transform=out_transform))
+
+    def test_reuse_with_stack_and_out(self):
+        regridder = gtr.Regridder((13, 11), (5, 4), fill_value=-1.)
+        src = make_src((3, 13, 11), 3, v_max=4, nan_fraction=0.1)
+        out = np.zeros((3, 5, 4))
+        self.assertIs(regridder(src, out=out), out)
+        for t in range(3):
+            assert_equal(out[t], gtr.downsample_2d(src[t], 4, 5, fill_value=-1.))
+            assert_equal(regridder(src[t]), out[t])
+
+    def test_unit_weights_once(self):
+        src = make_src((2, 12, 8), 3, v_max=4, nan_fraction=0.1)
+        with mock.patch.object(gtr, '_has_unit_weights', wraps=gtr._has_unit_weights) as has_unit_weights:
+            regridder = gtr.Regridder(src.shape, (4, 4), method=gtr.DS_VAR, fill_value=-1.)
+            actual = [regridder(src[t]) for t in range(2)]
+        self.assertEqual(has_unit_weights.call_count, 1)
+        for t in range(2):
+            assert_equal(actual[t], gtr.downsample_2d(src[t], 4, 4, method=gtr.DS_VAR, fill_value=-1.))
+
+    def test_masked(self):
+        src = make_src((8, 8), 3, v_max=4, nan_fraction=0.1)
+        src = np.ma.array(src, mask=src == 1.)
+        actual = gtr.Regridder(src.shape, (4, 4), fill_value=-1.)(src)
+        desired = gtr.downsample_2d(src, 4, 4, fill_value=-1.)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, desired.mask)
+        assert_equal(actual.data, desired.data)
+
+    def test_parallel(self):
+        src = make_src((13, 11), 3, v_max=4, nan_fraction=0.1)
+        regridder = gtr.Regridder(src.shape, (5, 4), method=gtr.DS_MODE, parallel=True, num_threads=3)
+        assert_equal(regridder(src), gtr.downsample_2d(src, 4, 5, method=gtr.DS_MODE))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            gtr.Regridder((4, 4), (2, 2), method=99)
+        with self.assertRaises(ValueError):
+            gtr.Regridder((4, 4), (8, 8), method=gtr.DS_MEAN)
+        with self.assertRaises(ValueError):
+            gtr.Regridder((4, 4), (2, 2), method=gtr.US_LINEAR)
+        with self.assertRaises(ValueError):
+            gtr.Regridder((4, 4), (2, 2))(np.zeros((5, 4)))
+        with self.assertRaises(ValueError):
+            gtr.Regridder((4, 4), (2, 2))(np.zeros((4, 4)), out=np.zeros((3, 3)))
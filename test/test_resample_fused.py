@@ -0,0 +1,117 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+DS_METHODS = (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MIN, gtr.DS_MAX, gtr.DS_MEAN, gtr.DS_MEDIAN, gtr.DS_MODE,
+              gtr.DS_VAR, gtr.DS_STD)
+
+
+def _resample_two_steps(src, w, h, ds_method, us_method, fill_value, mode_rank=1):
+    # Reference: downsample along the shrinking axis, then upsample each column or row along the growing one.
+    # Aggregates without valid source cells aren't interpolated.
+    if w < src.shape[-1]:
+        valid = np.zeros((src.shape[-2], w), dtype=bool)
+        temp = gtr.downsample_2d(src, w, src.shape[-2], method=ds_method, fill_value=fill_value, mode_rank=mode_rank,
+                                 out_valid=valid)
+        lines = [gtr.upsample_2d(temp[:, x:x + 1], 1, h, method=us_method, fill_value=fill_value,
+                                 valid=valid[:, x:x + 1]) for x in range(w)]
+        return np.ma.concatenate(lines, axis=1) if np.ma.isMaskedArray(temp) else np.concatenate(lines, axis=1)
+    valid = np.zeros((h, src.shape[-1]), dtype=bool)
+    temp = gtr.downsample_2d(src, src.shape[-1], h, method=ds_method, fill_value=fill_value, mode_rank=mode_rank,
+                             out_valid=valid)
+    lines = [gtr.upsample_2d(temp[y:y + 1], w, 1, method=us_method, fill_value=fill_value, valid=valid[y:y + 1])
+             for y in range(h)]
+    return np.ma.concatenate(lines, axis=0) if np.ma.isMaskedArray(temp) else np.concatenate(lines, axis=0)
+
+
+class ResampleFusedTest(unittest.TestCase):
+    def test_methods(self):
+        src = make_src((12, 17), 19, v_max=5, nan_fraction=0.2)
+        for ds_method in DS_METHODS:
+            for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+                for w, h in ((5, 30), (30, 5), (1, 13), (40, 1), (16, 13)):
+                    actual = gtr.resample_2d(src, w, h, ds_method=ds_method, us_method=us_method, fill_value=-1.)
+                    desired = _resample_two_steps(src, w, h, ds_method, us_method, -1.)
+                    assert_almost_equal(actual, desired)
+
+    def test_integer_mode_and_median(self):
+        # Integer grids use value histograms, as in downsample_2d()
+        row = np.array([[1, 1, 1, 2, 2, 3, 3, 3, 3, 3]], dtype=np.int32)
+        assert_equal(gtr.resample_2d(row, 1, 2, ds_method=gtr.DS_MODE, mode_rank=2), [[1], [1]])
+        src = np.random.RandomState(7).randint(0, 6, size=(12, 17)).astype(np.int16)
+        for w, h in ((5, 30), (30, 5)):
+            for mode_rank in (1, 2, 3):
+                actual = gtr.resample_2d(src, w, h, ds_method=gtr.DS_MODE, us_method=gtr.US_NEAREST, fill_value=-1,
+                                         mode_rank=mode_rank)
+                assert_equal(actual, _resample_two_steps(src, w, h, gtr.DS_MODE, gtr.US_NEAREST, -1, mode_rank))
+            actual = gtr.resample_2d(src, w, h, ds_method=gtr.DS_MEDIAN, us_method=gtr.US_NEAREST, fill_value=-1)
+            assert_equal(actual, _resample_two_steps(src, w, h, gtr.DS_MEDIAN, gtr.US_NEAREST, -1))
+
+    def test_kernels_per_method(self):
+        self.assertEqual(gtr._kernel_name(gtr._get_fused_kernels(gtr.DS_MODE, gtr.US_LINEAR, True)[0]),
+                         '_resample_fused_mode_histogram_linear')
+        self.assertEqual(gtr._kernel_name(gtr._get_fused_kernels(gtr.DS_LAST, gtr.US_NEAREST, False)[1]),
+                         '_resample_fused_first_last_nearest_parallel')
+        self.assertIs(gtr._get_fused_kernels(gtr.DS_FIRST, gtr.US_NEAREST, True),
+                      gtr._get_fused_kernels(gtr.DS_LAST, gtr.US_NEAREST, False))
+
+    def test_empty_aggregates_are_not_interpolated(self):
+        src = np.random.RandomState(1).rand(4, 6)
+        src[0] = np.nan
+        actual = gtr.resample_2d(src, 3, 8)
+        assert_equal(actual[:2], 1e20)
+        self.assertTrue(np.all(actual[2:] <= 1.0))
+        actual = gtr.resample_2d(src.T, 8, 3)
+        assert_equal(actual[:, :2], 1e20)
+        self.assertTrue(np.all(actual[:, 2:] <= 1.0))
+
+    def test_nan_fill_value(self):
+        src = make_src((12, 17), 19, v_max=5, nan_fraction=0.2)
+        src[:, :6] = np.nan
+        for w, h in ((5, 30), (30, 5)):
+            actual = gtr.resample_2d(src, w, h, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR, fill_value=np.nan)
+            assert_almost_equal(actual, _resample_two_steps(src, w, h, gtr.DS_MEAN, gtr.US_LINEAR, np.nan))
+
+    def test_mask(self):
+        data = np.arange(16.).reshape((4, 4))
+        mask = np.zeros((4, 4), dtype=bool)
+        mask[:, :2] = True
+        src = np.ma.array(data, mask=mask)
+        # Aggregates of masked cells are masked, whatever the mask of the source cell at the same index is
+        actual = gtr.resample_2d(src, 2, 8, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR, fill_value=-1.)
+        assert_equal(actual.mask[:, 0], True)
+        assert_equal(actual.mask[:, 1], False)
+        assert_almost_equal(actual.data[:, 1], np.linspace(2.5, 14.5, 8))
+        actual = gtr.resample_2d(src.T, 8, 2, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR, fill_value=-1.)
+        assert_equal(actual.mask[0], True)
+        assert_almost_equal(actual.data[1], np.linspace(2.5, 14.5, 8))
+
+    def test_mask_is_not_interpolated(self):
+        src = np.ma.array(make_src((12, 17), 19, v_max=5, nan_fraction=0.2), mask=make_src((12, 17), 5) < 0.3)
+        for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            for w, h in ((5, 30), (30, 5)):
+                actual = gtr.resample_2d(src, w, h, ds_method=gtr.DS_MEAN, us_method=us_method, fill_value=-1.)
+                desired = _resample_two_steps(src, w, h, gtr.DS_MEAN, us_method, -1.)
+                assert_equal(actual.mask, desired.mask)
+                assert_almost_equal(actual.data, desired.data)
+
+    def test_stack_and_parallel(self):
+        src = make_src((3, 2, 12, 17), 19, v_max=5, nan_fraction=0.2)
+        for w, h in ((5, 30), (30, 5)):
+            desired = np.array([[_resample_two_steps(src[t, b], w, h, gtr.DS_MEAN, gtr.US_LINEAR, -1.)
+                                 for b in range(2)] for t in range(3)])
+            actual = gtr.resample_nd(src, w, h, fill_value=-1.)
+            assert_almost_equal(actual, desired)
+            assert_equal(gtr.resample_nd(src, w, h, fill_value=-1., parallel=True, num_threads=4), actual)
+
+    def test_non_contiguous(self):
+        src = make_src((17, 12), 19, v_max=5, nan_fraction=0.2).T
+        out = np.zeros((30, 5)).T
+        actual = gtr.resample_2d(src, 30, 5, ds_method=gtr.DS_MEAN, fill_value=-1., out=out)
+        self.assertIs(actual, out)
+        assert_almost_equal(actual, _resample_two_steps(src, 30, 5, gtr.DS_MEAN, gtr.US_LINEAR, -1.))
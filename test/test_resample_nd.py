@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class ResampleNdTest(unittest.TestCase):
+    def test_downsample_nd(self):
+        src = make_src((3, 2, 13, 11), 7, v_max=4, nan_fraction=0.1)
+        for method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_MODE, gtr.DS_VAR, gtr.DS_STD):
+            actual = gtr.downsample_nd(src, 4, 5, method=method, fill_value=-1.)
+            self.assertEqual(actual.shape, (3, 2, 5, 4))
+            for t in range(3):
+                for b in range(2):
+                    desired = gtr.downsample_2d(src[t, b], 4, 5, method=method, fill_value=-1.)
+                    assert_equal(actual[t, b], desired)
+
+    def test_upsample_nd(self):
+        src = make_src((4, 6, 5), 7, v_max=4, nan_fraction=0.1)
+        for method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            actual = gtr.upsample_nd(src, 9, 13, method=method, fill_value=-1.)
+            self.assertEqual(actual.shape, (4, 13, 9))
+            for t in range(4):
+                assert_equal(actual[t], gtr.upsample_2d(src[t], 9, 13, method=method, fill_value=-1.))
+
+    def test_resample_nd(self):
+        src = make_src((4, 6, 5), 7, v_max=4, nan_fraction=0.1)
+        for w, h in ((3, 4), (3, 9), (9, 4), (9, 13)):
+            actual = gtr.resample_nd(src, w, h, fill_value=-1.)
+            for t in range(4):
+                assert_equal(actual[t], gtr.resample_2d(src[t], w, h, fill_value=-1.))
+
+    def test_2d_src(self):
+        src = make_src((13, 11), 7, v_max=4, nan_fraction=0.1)
+        assert_equal(gtr.downsample_nd(src, 4, 5), gtr.downsample_2d(src, 4, 5))
+
+    def test_out(self):
+        src = make_src((3, 13, 11), 7, v_max=4, nan_fraction=0.1)
+        out = np.zeros((3, 5, 4))
+        actual = gtr.downsample_nd(src, 4, 5, fill_value=-1., out=out)
+        self.assertIs(actual, out)
+        assert_equal(out[1], gtr.downsample_2d(src[1], 4, 5, fill_value=-1.))
+
+    def test_non_contiguous_out(self):
+        src = make_src((3, 13, 11), 7, v_max=4, nan_fraction=0.1)
+        cube = np.zeros((5, 4, 3))
+        out = cube.transpose((2, 0, 1))
+        actual = gtr.downsample_nd(src, 4, 5, fill_value=-1., out=out)
+        self.assertIs(actual, out)
+        assert_equal(cube[:, :, 2], gtr.downsample_2d(src[2], 4, 5, fill_value=-1.))
+
+    def test_masked(self):
+        src = make_src((2, 8, 8), 7, v_max=4, nan_fraction=0.1)
+        src = np.ma.array(src, mask=src == 1.)
+        actual = gtr.downsample_nd(src, 4, 4, fill_value=-1.)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        for t in range(2):
+            desired = gtr.downsample_2d(src[t], 4, 4, fill_value=-1.)
+            assert_equal(actual[t].mask, desired.mask)
+            assert_equal(actual[t].data, desired.data)
+
+    def test_transform(self):
+        src = make_src((2, 4, 4), 7, v_max=4, nan_fraction=0.1)
+        src_transform = (1.0, 0.0, 0.0, 0.0, -1.0, 4.0)
+        out_transform = (1.0, 0.0, 0.5, 0.0, -1.0, 3.5)
+        actual = gtr.downsample_nd(src, 2, 2, src_transform=src_transform, out_transform=out_transform)
+        for t in range(2):
+            desired = gtr.downsample_2d(src[t], 2, 2, src_transform=src_transform, out_transform=out_transform)
+            assert_equal(actual[t], desired)
+
+    def test_parallel(self):
+        src = make_src((5, 13, 11), 7, v_max=4, nan_fraction=0.1)
+        desired = gtr.downsample_nd(src, 4, 5, method=gtr.DS_MODE, fill_value=-1.)
+        actual = gtr.downsample_nd(src, 4, 5, method=gtr.DS_MODE, fill_value=-1., parallel=True, num_threads=3)
+        assert_equal(actual, desired)
+
+    def test_2d_functions_reject_nd(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_2d(make_src((2, 8, 8), 7, v_max=4, nan_fraction=0.1), 4, 4)
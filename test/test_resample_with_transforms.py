@@ -48,6 +48,18 @@ def test_downsample_2d_mean_positive_dy():
     )
 
 
+def test_downsample_2d_first_last_tiny_edge():
+    # Round-off makes the second output cell cover 3.0000000000000004 source cells,
+    # the source cell covered by the tiny excess is not taken
+    src = np.arange(36.0).reshape((6, 6))
+    src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 0.6)
+    out_transform = (0.1 * 1.5, 0.0, 0.0, 0.0, -0.1 * 1.5, 0.6)
+    first = gtr.downsample_2d(src, 4, 4, gtr.DS_FIRST, src_transform=src_transform, out_transform=out_transform)
+    last = gtr.downsample_2d(src, 4, 4, gtr.DS_LAST, src_transform=src_transform, out_transform=out_transform)
+    assert np.array_equal(first, src[[0, 1, 3, 4]][:, [0, 1, 3, 4]])
+    assert np.array_equal(last, src[[1, 2, 4, 5]][:, [1, 2, 4, 5]])
+
+
 def test_errors():
     with pytest.raises(ValueError): # only one transform
         gtr.downsample_2d(SRC, 2, 2, gtr.DS_MEAN, src_transform=SRC_TRANSFORM)
@@ -66,4 +78,53 @@ def test_errors():
     with pytest.raises(ValueError): # out x falls outside of source
         gtr.downsample_2d(SRC, 4, 2, gtr.DS_MEAN, src_transform=SRC_TRANSFORM)
     with pytest.raises(ValueError): # out y falls outside of source
-        gtr.downsample_2d(SRC, 2, 4, gtr.DS_MEAN, src_transform=SRC_TRANSFORM)
\ No newline at end of file
+        gtr.downsample_2d(SRC, 2, 4, gtr.DS_MEAN, src_transform=SRC_TRANSFORM)
+
+def _make_window(src_transform, x0, y0, dx, dy):
+    # Transform of a target window whose upper left cell is (x0, y0) in target cells of size (dx, dy)
+    return (dx, 0.0, src_transform[2] + x0 * dx, 0.0, dy, src_transform[5] + y0 * dy)
+
+
+def test_upsample_2d_window():
+    src = np.random.RandomState(5).rand(20, 30)
+    src_transform = (1.0, 0.0, 100.0, 0.0, -1.0, 50.0)
+    for method in (gtr.US_NEAREST, gtr.US_LINEAR):
+        desired = gtr.upsample_2d(src, 90, 60, method=method)
+        out_transform = _make_window(src_transform, 7, 11, 1.0 / 3.0, -1.0 / 3.0)
+        actual = gtr.upsample_2d(src, 40, 25, method=method, src_transform=src_transform, out_transform=out_transform)
+        np.testing.assert_almost_equal(actual, desired[11:36, 7:47])
+        actual = gtr.Regridder(src.shape, (25, 40), src_transform, out_transform, method=method)(src)
+        np.testing.assert_almost_equal(actual, desired[11:36, 7:47])
+        out_transform = _make_window(src_transform, 0, 0, 1.0 / 3.0, -1.0 / 3.0)
+        actual = gtr.upsample_2d(src, 90, 60, method=method, src_transform=src_transform, out_transform=out_transform)
+        np.testing.assert_almost_equal(actual, desired)
+
+
+def test_resample_2d_window():
+    src = np.random.RandomState(7).rand(20, 30)
+    src_transform = (1.0, 0.0, 100.0, 0.0, -1.0, 50.0)
+    # x shrinks, y grows
+    desired = gtr.resample_2d(src, 10, 60)
+    out_transform = _make_window(src_transform, 1, 11, 3.0, -1.0 / 3.0)
+    actual = gtr.resample_2d(src, 5, 25, src_transform=src_transform, out_transform=out_transform)
+    np.testing.assert_almost_equal(actual, desired[11:36, 1:6])
+    # x grows, y shrinks
+    desired = gtr.resample_2d(src, 90, 10, us_method=gtr.US_NEAREST)
+    out_transform = _make_window(src_transform, 7, 2, 1.0 / 3.0, -2.0)
+    actual = gtr.resample_2d(src, 40, 3, us_method=gtr.US_NEAREST,
+                             src_transform=src_transform, out_transform=out_transform)
+    np.testing.assert_almost_equal(actual, desired[2:5, 7:47])
+    # Both shrink
+    out_transform = _make_window(src_transform, 1, 1, 2.0, -2.0)
+    np.testing.assert_almost_equal(
+        gtr.resample_2d(src, 4, 3, src_transform=src_transform, out_transform=out_transform),
+        gtr.downsample_2d(src, 15, 10)[1:4, 1:5])
+
+
+def test_upsample_2d_errors():
+    with pytest.raises(ValueError): # only one transform
+        gtr.upsample_2d(SRC, 8, 8, src_transform=SRC_TRANSFORM)
+    with pytest.raises(ValueError): # out has larger grid cells than source
+        gtr.upsample_2d(SRC, 2, 2, src_transform=SRC_TRANSFORM, out_transform=(2.0, 0.0, 0.0, 0.0, -2.0, 4.0))
+    with pytest.raises(ValueError): # out x falls outside of source
+        gtr.upsample_2d(SRC, 8, 2, src_transform=SRC_TRANSFORM, out_transform=(0.5, 0.0, 0.5, 0.0, -0.5, 4.0))
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+
+def _weight_matrix(idx, wgt, src_size):
+    matrix = np.zeros((len(idx), src_size))
+    for k, ((i0, i1), (w0, w1)) in enumerate(zip(idx, wgt)):
+        matrix[k, i0:i1 + 1] = 1.0
+        matrix[k, i1] = w1
+        matrix[k, i0] = w0
+    return matrix
+
+
+def _mean(src, valid, w, h, src_transform=None, out_transform=None):
+    # Dense reference: (Wy @ (v * valid) @ Wx.T) / (Wy @ valid @ Wx.T)
+    y_idx, y_wgt, x_idx, x_wgt = gtr._get_ds_tables(src.shape, (h, w), src_transform, out_transform)
+    wy = _weight_matrix(y_idx, y_wgt, src.shape[0])
+    wx = _weight_matrix(x_idx, x_wgt, src.shape[1])
+    v_sum = wy.dot(np.where(valid, src, 0.0)).dot(wx.T)
+    w_sum = wy.dot(valid.astype(np.float64)).dot(wx.T)
+    return np.where(w_sum < gtr._EPS, -1., v_sum / np.where(w_sum < gtr._EPS, 1.0, w_sum))
+
+
+class SeparableMeanTest(unittest.TestCase):
+    def test_all_valid(self):
+        src = np.random.RandomState(5).rand(61, 47)
+        for w, h in ((1, 1), (5, 7), (13, 10), (46, 60), (47, 61)):
+            actual = gtr.downsample_2d(src, w, h, method=gtr.DS_MEAN, fill_value=-1.)
+            assert_almost_equal(actual, _mean(src, np.ones(src.shape, dtype=bool), w, h))
+
+    def test_nans(self):
+        rs = np.random.RandomState(7)
+        src = rs.rand(61, 47)
+        src[rs.rand(61, 47) < 0.3] = np.nan
+        src[:20, :20] = np.nan
+        for w, h in ((1, 1), (5, 7), (13, 10), (46, 60)):
+            actual = gtr.downsample_2d(src, w, h, method=gtr.DS_MEAN, fill_value=-1.)
+            assert_almost_equal(actual, _mean(src, np.isfinite(src), w, h))
+
+    def test_mask(self):
+        rs = np.random.RandomState(9)
+        data = rs.rand(40, 30)
+        mask = rs.rand(40, 30) < 0.3
+        mask[:10, :10] = True
+        src = np.ma.array(data, mask=mask)
+        actual = gtr.downsample_2d(src, 6, 8, method=gtr.DS_MEAN, fill_value=-1.)
+        desired = _mean(data, ~mask, 6, 8)
+        assert_equal(actual.mask, desired == -1.)
+        assert_almost_equal(actual.data, desired)
+
+    def test_integers(self):
+        src = np.arange(40 * 30, dtype=np.int32).reshape((40, 30)) % 7
+        out = np.zeros((8, 6), dtype=np.float64)
+        actual = gtr.downsample_2d(src, 6, 8, method=gtr.DS_MEAN, out=out)
+        assert_almost_equal(actual, _mean(src.astype(np.float64), np.ones(src.shape, dtype=bool), 6, 8))
+
+    def test_transform(self):
+        src = np.random.RandomState(3).rand(20, 20)
+        src[5, 5] = np.nan
+        src_transform = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+        out_transform = (3.0, 0.0, 1.5, 0.0, 3.0, 2.25)
+        actual = gtr.downsample_2d(src, 5, 5, method=gtr.DS_MEAN, fill_value=-1.,
+                                   src_transform=src_transform, out_transform=out_transform)
+        assert_almost_equal(actual, _mean(src, np.isfinite(src), 5, 5, src_transform, out_transform))
+
+    def test_parallel(self):
+        src = np.random.RandomState(1).rand(3, 50, 40)
+        src[1, 10:20, 10:20] = np.nan
+        desired = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MEAN, fill_value=-1.)
+        actual = gtr.downsample_nd(src, 7, 9, method=gtr.DS_MEAN, fill_value=-1., parallel=True, num_threads=4)
+        assert_equal(actual, desired)
@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+def _rotation(angle, x0, y0, size=1.0):
+    cos = size * np.cos(np.radians(angle))
+    sin = size * np.sin(np.radians(angle))
+    return cos, -sin, x0, sin, cos, y0
+
+
+class SparseRegridderTest(unittest.TestCase):
+    def test_equals_downsample(self):
+        src = make_src((30, 40), 43, nan_fraction=0.2)
+        for w, h in ((7, 9), (39, 29), (1, 1)):
+            desired = gtr.downsample_2d(src, w, h, method=gtr.DS_MEAN, fill_value=-1.)
+            actual = gtr.SparseRegridder(src.shape, (h, w), fill_value=-1.)(src)
+            assert_almost_equal(actual, desired)
+        src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 3.0)
+        out_transform = (0.25, 0.0, 0.2, 0.0, -0.25, 2.8)
+        desired = gtr.downsample_2d(src, 9, 10, fill_value=-1., src_transform=src_transform,
+                                    out_transform=out_transform)
+        actual = gtr.SparseRegridder(src.shape, (10, 9), src_transform, out_transform, fill_value=-1.)(src)
+        assert_almost_equal(actual, desired)
+
+    def test_weights(self):
+        regridder = gtr.SparseRegridder((4, 6), (2, 2))
+        self.assertEqual(regridder.shape, (4, 24))
+        assert_equal(regridder.indptr, [0, 6, 12, 18, 24])
+        assert_equal(regridder.indices[:6], [0, 1, 2, 6, 7, 8])
+        assert_almost_equal(regridder.weights, np.ones(24))
+
+    def test_transposed(self):
+        src = make_src((5, 7), 43, nan_fraction=0.2)
+        # x = row, y = column
+        regridder = gtr.SparseRegridder(src.shape, (7, 5), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0),
+                                        (0.0, 1.0, 0.0, 1.0, 0.0, 0.0), fill_value=np.nan)
+        assert_equal(regridder(src), src.T)
+
+    def test_rotated(self):
+        src_transform = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+        # A target grid of 2 x 2 cells, rotated by 30 degrees, inside the source grid
+        out_transform = _rotation(30, 20.0, 10.0, 3.0)
+        regridder = gtr.SparseRegridder((40, 40), (2, 2), src_transform, out_transform)
+        # Each target cell covers the area of 9 source cells
+        assert_almost_equal(np.add.reduceat(regridder.weights, regridder.indptr[:-1]), np.full(4, 9.0))
+        src = np.full((40, 40), 2.5)
+        assert_almost_equal(regridder(src), np.full((2, 2), 2.5))
+        # Linear fields are reproduced at the cell centers
+        y, x = np.mgrid[0:40, 0:40] + 0.5
+        actual = regridder(0.5 * x + 0.25 * y)
+        a, b, c, d, e, f = out_transform
+        centers_x = np.array([[a * (i + 0.5) + b * (j + 0.5) + c for i in range(2)] for j in range(2)])
+        centers_y = np.array([[d * (i + 0.5) + e * (j + 0.5) + f for i in range(2)] for j in range(2)])
+        assert_almost_equal(actual, 0.5 * centers_x + 0.25 * centers_y, decimal=2)
+
+    def test_conservation(self):
+        # A rotated target grid that covers the whole source grid receives all of its area
+        regridder = gtr.SparseRegridder((10, 12), (12, 12), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0),
+                                        _rotation(45, 6.0, -8.5, 1.5))
+        self.assertAlmostEqual(regridder.weights.sum(), 120.0)
+        self.assertEqual(len(np.unique(regridder.indices)), 120)
+        # Target cells outside of the source grid have no weights
+        self.assertTrue(np.any(np.diff(regridder.indptr) == 0))
+        out = regridder(np.ones((10, 12)), out=np.zeros((12, 12)))
+        assert_almost_equal(out[np.diff(regridder.indptr).reshape((12, 12)) > 0], 1.0)
+
+    def test_stack_mask_and_parallel(self):
+        src = make_src((3, 2, 30, 40), 43, nan_fraction=0.2)
+        mask = np.isnan(src)
+        data = np.where(mask, 0.0, src)
+        regridder = gtr.SparseRegridder(src.shape, (9, 7), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0),
+                                        _rotation(10, 5.0, 2.0, 3.5), fill_value=-1.)
+        desired = regridder(src)
+        self.assertEqual(desired.shape, (3, 2, 9, 7))
+        assert_equal(desired[1, 1], regridder(src[1, 1]))
+        actual = regridder(np.ma.array(data, mask=mask))
+        assert_equal(actual.mask, desired == -1.)
+        assert_equal(actual.data, desired)
+        out_valid = np.zeros(desired.shape, dtype=bool)
+        assert_equal(regridder(data, valid=~mask, out_valid=out_valid), desired)
+        assert_equal(out_valid, desired != -1.)
+        parallel = gtr.SparseRegridder(src.shape, (9, 7), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0),
+                                       _rotation(10, 5.0, 2.0, 3.5), fill_value=-1., parallel=True, num_threads=4)
+        assert_equal(parallel.indptr, regridder.indptr)
+        assert_equal(parallel(src), desired)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            gtr.SparseRegridder((4, 4), (2, 2), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0))
+        with self.assertRaises(ValueError):
+            gtr.SparseRegridder((4, 4), (2, 2), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0), (1.0, 1.0, 0.0, 1.0, 1.0, 0.0))
+        with self.assertRaises(ValueError):
+            gtr.SparseRegridder((4, 4), (2, 2))(np.zeros((4, 5)))
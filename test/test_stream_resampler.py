@@ -0,0 +1,97 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+def _strips(src, sizes):
+    y = 0
+    k = 0
+    while y < src.shape[0]:
+        size = sizes[k % len(sizes)]
+        yield src[y:y + size]
+        y += size
+        k += 1
+
+
+class StreamResamplerTest(unittest.TestCase):
+    def test_identical_to_regridder(self):
+        src = make_src((53, 31), 41, v_max=5, nan_fraction=0.2)
+        for method in (gtr.DS_FIRST, gtr.DS_MEAN, gtr.DS_MEDIAN, gtr.DS_MODE, gtr.DS_STD,
+                       gtr.US_NEAREST, gtr.US_LINEAR):
+            out_shape = (7, 5) if method in gtr._DS_METHODS else (120, 70)
+            desired = gtr.Regridder(src.shape, out_shape, method=method, fill_value=-1.)(src)
+            for sizes in ((1,), (5, 2, 9), (53,)):
+                rows = list(gtr.resample_stream(_strips(src, sizes), src.shape, out_shape, method=method,
+                                                fill_value=-1.))
+                assert_equal(np.concatenate(rows), desired)
+
+    def test_rows_are_yielded_early(self):
+        src = make_src((100, 30), 41, v_max=5, nan_fraction=0.2)
+        resampler = gtr.StreamResampler(src.shape, (10, 3), fill_value=-1.)
+        self.assertEqual(resampler.push(src[:9]).shape, (0, 3))
+        self.assertEqual(resampler.push(src[9]).shape, (1, 3))
+        self.assertEqual(resampler.push(src[10:35]).shape, (2, 3))
+        self.assertEqual(resampler.rows_done, 3)
+        # Only the rows of the open output row are kept
+        self.assertEqual(resampler._row_count, 5)
+        self.assertEqual(resampler._rows.shape[0], 10)
+        resampler.push(src[35:])
+        self.assertEqual(resampler.rows_done, 10)
+        with self.assertRaises(ValueError):
+            resampler.push(src[:1])
+
+    def test_carry_buffer(self):
+        # Strips of any size pass through a carry buffer as large as the rows of one output row
+        src = np.ma.array(make_src((61, 23), 41, v_max=5, nan_fraction=0.2), mask=make_src((61, 23), 2) < 0.2)
+        for method, out_shape in ((gtr.DS_MEAN, (9, 5)), (gtr.DS_MODE, (4, 7)), (gtr.US_LINEAR, (130, 40))):
+            desired = gtr.Regridder(src.shape, out_shape, method=method, fill_value=-1.)(src)
+            for sizes in ((1, 11, 3), (7, 30), (2,)):
+                resampler = gtr.StreamResampler(src.shape, out_shape, method=method, fill_value=-1.)
+                rows = [resampler.push(strip) for strip in _strips(src, sizes)]
+                self.assertEqual(resampler._rows.shape[0], resampler._max_rows)
+                actual = np.ma.concatenate(rows)
+                assert_equal(actual.mask, desired.mask)
+                assert_equal(actual.data, desired.data)
+
+    def test_fractional_rows(self):
+        src = make_src((50, 20), 41, v_max=5, nan_fraction=0.2)
+        desired = gtr.downsample_2d(src, 6, 7, fill_value=-1.)
+        resampler = gtr.StreamResampler(src.shape, (7, 6), fill_value=-1.)
+        rows = [resampler.push(row) for row in src]
+        assert_equal(np.concatenate(rows), desired)
+        # Edge rows are shared by two output rows
+        self.assertEqual(max(len(r) for r in rows), 1)
+
+    def test_mask_and_valid(self):
+        src = make_src((40, 30), 41, v_max=5, nan_fraction=0.2)
+        mask = np.isnan(src)
+        data = np.where(mask, 0.0, src)
+        desired = gtr.downsample_2d(np.ma.array(data, mask=mask), 7, 9, fill_value=-1.)
+        rows = list(gtr.resample_stream(_strips(np.ma.array(data, mask=mask), (3,)), src.shape, (9, 7),
+                                        fill_value=-1.))
+        actual = np.ma.concatenate(rows)
+        assert_equal(actual.mask, desired.mask)
+        assert_equal(actual.data, desired.data)
+        resampler = gtr.StreamResampler(src.shape, (9, 7), fill_value=-1.)
+        actual = np.concatenate([resampler.push(data[y:y + 4], valid=~mask[y:y + 4]) for y in range(0, 40, 4)])
+        assert_equal(actual, desired.data)
+
+    def test_transform(self):
+        src = make_src((30, 30), 41, v_max=5, nan_fraction=0.2)
+        src_transform = (0.1, 0.0, 0.0, 0.0, -0.1, 3.0)
+        out_transform = (0.25, 0.0, 0.2, 0.0, -0.25, 2.8)
+        desired = gtr.downsample_2d(src, 9, 10, fill_value=-1., src_transform=src_transform,
+                                    out_transform=out_transform)
+        rows = list(gtr.resample_stream(_strips(src, (4,)), src.shape, (10, 9), src_transform=src_transform,
+                                        out_transform=out_transform, fill_value=-1.))
+        assert_equal(np.concatenate(rows), desired)
+
+    def test_incomplete_stream(self):
+        src = make_src((40, 30), 41, v_max=5, nan_fraction=0.2)
+        with self.assertRaises(ValueError):
+            list(gtr.resample_stream([src[:20]], src.shape, (9, 7)))
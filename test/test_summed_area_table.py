@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+from . import make_src
+
+
+class SummedAreaTableTest(unittest.TestCase):
+    def test_downsample(self):
+        src = 10. * make_src((101, 77), 11, nan_fraction=0.1)
+        sat = gtr.SummedAreaTable(src)
+        for method in (gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD):
+            for w, h in ((1, 1), (7, 7), (10, 13), (77, 50)):
+                desired = gtr.downsample_2d(src, w, h, method=method, fill_value=-1.)
+                actual = sat.downsample(w, h, method=method, fill_value=-1.)
+                # The variance suffers from cancellation, so that standard deviations close to zero are less accurate
+                assert_almost_equal(actual, desired, decimal=5 if method == gtr.DS_STD else 8)
+
+    def test_example(self):
+        src = np.array([[0.6, 0.2, 3.4],
+                        [1.4, 1.6, 1.0],
+                        [4.0, 2.8, 3.0]])
+        actual = gtr.SummedAreaTable(src).downsample(2, 2)
+        assert_almost_equal(actual, [[(0.6 + 0.5 * 0.2 + 0.5 * 1.4 + 0.25 * 1.6) / (1.0 + 0.5 + 0.5 + 0.25),
+                                      (3.4 + 0.5 * 0.2 + 0.5 * 1.0 + 0.25 * 1.6) / (1.0 + 0.5 + 0.5 + 0.25)],
+                                     [(4.0 + 0.5 * 1.4 + 0.5 * 2.8 + 0.25 * 1.6) / (1.0 + 0.5 + 0.5 + 0.25),
+                                      (3.0 + 0.5 * 1.0 + 0.5 * 2.8 + 0.25 * 1.6) / (1.0 + 0.5 + 0.5 + 0.25)]])
+
+    def test_stack_and_out(self):
+        src = 10. * make_src((3, 40, 30), 11, nan_fraction=0.1)
+        out = np.zeros((3, 7, 6))
+        actual = gtr.SummedAreaTable(src).downsample(6, 7, out=out, fill_value=-1.)
+        self.assertIs(actual, out)
+        assert_almost_equal(out, gtr.downsample_nd(src, 6, 7, fill_value=-1.))
+
+    def test_masked(self):
+        src = np.ma.array([[0.9, 0.5, 3.0, 4.0],
+                           [1.1, np.nan, 1.0, 2.0],
+                           [4.0, 2.1, 3.0, 5.0],
+                           [3.0, 4.9, np.nan, 1.0]],
+                          mask=[[1, 1, 0, 0],
+                                [1, 1, 0, 0],
+                                [0, 0, 0, 1],
+                                [0, 0, 0, 0]])
+        actual = gtr.SummedAreaTable(src).downsample(2, 2, fill_value=np.nan)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, [[1, 0], [0, 0]])
+        assert_almost_equal(actual.filled(-1.), [[-1., 2.5], [3.5, 2.0]])
+
+    def test_transform(self):
+        src = 10. * make_src((4, 4), 11, nan_fraction=0.1)
+        src_transform = (1.0, 0.0, 0.0, 0.0, -1.0, 4.0)
+        out_transform = (1.0, 0.0, 0.5, 0.0, -1.0, 3.5)
+        desired = gtr.downsample_2d(src, 2, 2, src_transform=src_transform, out_transform=out_transform)
+        actual = gtr.SummedAreaTable(src).downsample(2, 2, src_transform=src_transform, out_transform=out_transform)
+        assert_almost_equal(actual, desired)
+
+    def test_parallel(self):
+        sat = gtr.SummedAreaTable(10. * make_src((50, 40), 11, nan_fraction=0.1))
+        assert_equal(sat.downsample(6, 7, method=gtr.DS_STD, parallel=True, num_threads=3),
+                     sat.downsample(6, 7, method=gtr.DS_STD))
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            gtr.SummedAreaTable(10. * make_src((4, 4), 11, nan_fraction=0.1)).downsample(2, 2, method=gtr.DS_MODE)
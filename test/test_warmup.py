@@ -0,0 +1,28 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools
+import gridtools.resampling as gtr
+
+
+def _qualname(kernel):
+    return getattr(kernel, 'py_func', kernel).__qualname__
+
+
+class WarmupTest(unittest.TestCase):
+    def test_warmup(self):
+        gridtools.warmup(dtypes=('float64', np.int16), methods=(gtr.DS_FIRST, gtr.DS_MEAN, gtr.US_LINEAR))
+        if hasattr(gtr._downsample_mean, 'signatures'):
+            for kernel in (gtr._downsample_first_last, gtr._downsample_mean, gtr._downsample_blocks,
+                           gtr._upsample_linear):
+                src_dtypes = [np.dtype(str(signature[0].dtype)) for signature in kernel.signatures]
+                self.assertIn(np.dtype(np.int16), src_dtypes)
+        src = np.arange(64, dtype=np.int16).reshape((8, 8))
+        assert_equal(gtr.downsample_2d(src, 4, 4, method=gtr.DS_FIRST), src[::2, ::2])
+
+    def test_parallel_kernels_are_cached_separately(self):
+        # Numba's disk cache is named after the qualified name, so the variants must not share it
+        for serial, parallel in list(gtr._DS_KERNELS.values()) + list(gtr._US_KERNELS.values()):
+            self.assertEqual(_qualname(parallel), _qualname(serial) + '_parallel')
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+SRC_TRANSFORM = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+
+def _rotated(angle):
+    cos = 3.0 * np.cos(np.radians(angle))
+    sin = 3.0 * np.sin(np.radians(angle))
+    return cos, -sin, 10.0, sin, cos, 5.0
+
+
+class WeightCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self._temp_dir.name, 'weights')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_sparse_regridder(self):
+        src = np.random.RandomState(47).rand(2, 40, 50)
+        desired = gtr.SparseRegridder(src.shape, (8, 9), SRC_TRANSFORM, _rotated(20))(src)
+        cache = gtr.WeightCache(self.cache_dir)
+        actual = gtr.SparseRegridder(src.shape, (8, 9), SRC_TRANSFORM, _rotated(20), cache=cache)(src)
+        assert_equal(actual, desired)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        # Warm runs skip the geometry
+        with mock.patch.object(gtr, '_get_overlaps', side_effect=AssertionError):
+            regridder = gtr.SparseRegridder(src.shape, (8, 9), SRC_TRANSFORM, _rotated(20),
+                                            cache=gtr.WeightCache(self.cache_dir))
+        self.assertIsInstance(regridder.weights, np.memmap)
+        self.assertFalse(regridder.weights.flags.writeable)
+        assert_equal(regridder(src), desired)
+        # Other geometries are other entries
+        gtr.SparseRegridder(src.shape, (8, 9), SRC_TRANSFORM, _rotated(21), cache=cache)
+        gtr.SparseRegridder(src.shape, (8, 8), SRC_TRANSFORM, _rotated(20), cache=cache)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+    def test_regridder(self):
+        src = np.random.RandomState(53).rand(30, 40)
+        cache = gtr.WeightCache(self.cache_dir)
+        for method, out_shape in ((gtr.DS_MEAN, (7, 9)), (gtr.DS_MODE, (7, 9)), (gtr.US_LINEAR, (50, 60))):
+            desired = gtr.Regridder(src.shape, out_shape, method=method)(src)
+            gtr.Regridder(src.shape, out_shape, method=method, cache=cache)
+            with mock.patch.object(gtr, '_get_ds_tables', side_effect=AssertionError), \
+                    mock.patch.object(gtr, '_get_us_tables', side_effect=AssertionError):
+                regridder = gtr.Regridder(src.shape, out_shape, method=method, cache=cache)
+            assert_equal(regridder(src), desired)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+        cache.clear()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_lru_eviction(self):
+        entry_size = 8000 + 128
+        cache = gtr.WeightCache(self.cache_dir, max_bytes=3 * entry_size)
+        for key in range(3):
+            cache.get(('test', key), lambda: dict(a=np.zeros(1000)))
+        self.assertEqual(cache.size, 3 * entry_size)
+        # Use entry 0, so that entry 1 is the least recently used one
+        entry_dirs = sorted(os.listdir(self.cache_dir), key=lambda name: os.path.getmtime(
+            os.path.join(self.cache_dir, name)))
+        for name, mtime in zip(entry_dirs, (1000, 2000, 3000)):
+            os.utime(os.path.join(self.cache_dir, name), (mtime, mtime))
+        computed = []
+        cache.get(('test', 0), lambda: computed.append(0))
+        cache.get(('test', 3), lambda: dict(a=np.ones(1000)))
+        self.assertEqual(computed, [])
+        self.assertEqual(cache.size, 3 * entry_size)
+        self.assertNotIn(entry_dirs[1], os.listdir(self.cache_dir))
+        assert_equal(cache.get(('test', 3), None)['a'], np.ones(1000))
+
+    def test_key(self):
+        self.assertEqual(gtr._get_cache_key(('a', (2, 3), np.array([1.0, 2.0]))),
+                         gtr._get_cache_key(('a', (2, 3), (1.0, 2.0))))
+        self.assertNotEqual(gtr._get_cache_key(('a', (2, 3), (1.0, 2.0))),
+                            gtr._get_cache_key(('a', (2, 3), (1.0, 2.0 + 1e-12))))